@@ -2,7 +2,13 @@ from flask import Flask
 from config import Config
 from routes.main_routes import main_bp
 from routes.admin_routes import admin_bp
-from database import create_recordings_table
+from utils.metrics_utils import init_request_metrics
+from utils.tracing_utils import init_tracing
+from utils.profiling_utils import init_profiling
+from utils.admission import init_admission_control
+from utils.resilience import init_resilience
+from utils.static_assets import init_static_assets
+from database import ensure_schema
 
 def create_app():
     app = Flask(__name__)
@@ -10,9 +16,16 @@ def create_app():
     app.config['SESSION_PERMANENT'] = False
     
     # Initialize extensions here if any
-    create_recordings_table(Config.DB_PATH)
-    create_recordings_table(Config.TRIBAL_DB_PATH)
+    ensure_schema()
     
+    init_request_metrics(app)
+    init_tracing(app)
+    init_profiling(app)
+    init_resilience(app)
+    init_static_assets(app)
+    # Registered last so shed requests are still timed, traced and profiled
+    init_admission_control(app)
+
     # Register blueprints
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
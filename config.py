@@ -1,20 +1,23 @@
 import os
+import sys
 import tempfile
-from dotenv import load_dotenv
 
 # Base directory of the project
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-load_dotenv()
+# On Vercel the environment comes from the platform, so skip reading .env there
+if not os.getenv('VERCEL'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')    
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
     
-    # Use absolute paths for SQLite databases
-    DB_PATH = os.path.join(BASE_DIR, "prompts.db")
-    TRIBAL_DB_PATH = os.path.join(BASE_DIR, "telugu_tribe.db")
+    # Use absolute paths for SQLite databases (overridable, e.g. by the benchmarks)
+    DB_PATH = os.getenv('DB_PATH') or os.path.join(BASE_DIR, "prompts.db")
+    TRIBAL_DB_PATH = os.getenv('TRIBAL_DB_PATH') or os.path.join(BASE_DIR, "telugu_tribe.db")
     
     # AWS S3 Configuration
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
@@ -29,6 +32,21 @@ class Config:
     else:
         S3_REGION = _raw_region
 
+    # Optional custom endpoint (e.g. a local MinIO / moto server for testing)
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
+
+    # Direct browser -> S3 uploads via presigned PUT URLs
+    DIRECT_UPLOAD_ENABLED = str(os.getenv('DIRECT_UPLOAD_ENABLED', 'false')).lower() in ['true', 'on', '1']
+    try:
+        PRESIGNED_URL_EXPIRY = int(os.getenv('PRESIGNED_URL_EXPIRY', 900))
+        DIRECT_UPLOAD_MAX_BYTES = int(os.getenv('DIRECT_UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+    except (ValueError, TypeError):
+        PRESIGNED_URL_EXPIRY = 900
+        DIRECT_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+    # A presigned PUT cannot limit its size, so completion checks it with a HEAD
+    DIRECT_UPLOAD_MAX_TEXT_BYTES = 64 * 1024
+    # Issued-but-not-completed uploads kept in the (cookie) session
+    DIRECT_UPLOAD_MAX_PENDING = 10
 
     # S3 Prefixes (Folders)
     S3_AUDIO_PREFIX = "audio/standard/"
@@ -48,6 +66,33 @@ class Config:
     S3_PROMPTS_TRIBAL_ENGLISH_USED = "prompts/en-transcription-tribal/used/"
     
     S3_METADATA_PREFIX = "metadata/"
+    # Compacted metadata segments + manifest (kept outside metadata/ so its counts are unaffected)
+    S3_METADATA_SEGMENTS_PREFIX = "metadata-segments/"
+    METADATA_SEGMENT_FORMAT = os.getenv('METADATA_SEGMENT_FORMAT', 'ndjson')  # "ndjson" or "parquet" (needs pyarrow)
+    try:
+        METADATA_SEGMENT_MAX_RECORDS = int(os.getenv('METADATA_SEGMENT_MAX_RECORDS', 5000))
+    except (ValueError, TypeError):
+        METADATA_SEGMENT_MAX_RECORDS = 5000
+    # Only metadata files older than this are compacted, so a write still in
+    # flight while the compactor lists cannot fall below its watermark
+    METADATA_COMPACT_SETTLE_SECONDS = 60
+
+    # Used-prompt state: "folders" (move to prompts/*/used/) or "bitmap"
+    # (one packed bitmap object per pool under S3_PROMPTS_STATE_PREFIX)
+    USED_STATE_BACKEND = os.getenv('USED_STATE_BACKEND', 'folders')
+    S3_PROMPTS_STATE_PREFIX = "prompts/_state/"
+    USED_BITMAP_TTL_SECONDS = 10
+    USED_BITMAP_CAS_RETRIES = 8
+
+    # Object key layout for recordings, metadata and prompts: "flat"
+    # (audio/standard/UOH_x.wav) or "sharded" (audio/standard/3f/UOH_x.wav),
+    # which spreads the request rate over 16^S3_KEY_SHARD_CHARS prefixes.
+    # Convert existing objects with scripts/migrate_key_layout.py.
+    S3_KEY_LAYOUT = os.getenv('S3_KEY_LAYOUT', 'flat').lower()
+    S3_KEY_SHARD_CHARS = 2
+    # Set while a layout migration is in progress: a prompt also counts as
+    # used if its used/ marker still sits at the other layout's key.
+    S3_KEY_LAYOUT_MIGRATING = str(os.getenv('S3_KEY_LAYOUT_MIGRATING', 'false')).lower() in ['true', 'on', '1']
     
     # Upload Directories (Required for main_routes.py)
     # Using temp directory to allow writes on Serverless (Vercel) /tmp
@@ -57,7 +102,160 @@ class Config:
     UPLOAD_TRANSCRIPTION_DIR = os.path.join(BASE_UPLOAD_DIR, "transcription")
     TRIBAL_AUDIO_DIR = os.path.join(BASE_UPLOAD_DIR, "tribe-audio")
     TRIBAL_TRANSCRIPTION_DIR = os.path.join(BASE_UPLOAD_DIR, "tribe-transcription")
-    
+
+    # Identifies the running deployment (scopes the prompt partitions)
+    DEPLOYMENT_ID = os.getenv('VERCEL_DEPLOYMENT_ID') or os.getenv('VERCEL_GIT_COMMIT_SHA') or 'local'
+
+    # Serving mode: "threaded" (gthread workers) or "async" (gevent workers,
+    # see gunicorn.conf.py). In async mode every request and S3 call is a
+    # greenlet, so one worker can keep hundreds of storage calls in flight
+    # and the concurrency defaults below are scaled up accordingly. Only
+    # counts as async when gevent has actually patched the process, so a
+    # missing gevent or another server falls back to the threaded limits.
+    SERVING_MODE = os.getenv('SERVING_MODE', 'threaded')
+    ASYNC_SERVING = SERVING_MODE == 'async' and 'gevent.monkey' in sys.modules
+    _CONCURRENCY_SCALE = 8 if ASYNC_SERVING else 1
+
+    # Admission control: per-route concurrency limits with a bounded wait
+    # queue, and a process-wide token bucket for outbound storage calls.
+    # Overloaded requests get 429 + Retry-After instead of piling onto S3.
+    # Opt-in: it changes how the app behaves under load.
+    ADMISSION_CONTROL_ENABLED = str(os.getenv('ADMISSION_CONTROL_ENABLED', 'false')).lower() in ['true', 'on', '1']
+    ADMISSION_ROUTE_LIMITS = os.getenv(
+        'ADMISSION_ROUTE_LIMITS',
+        'main.api_get_prompt=%d,main.submit=%d,main.finalize_session=%d,'
+        'main.chunked_append=%d,main.api_upload_complete=%d'
+        % (16 * _CONCURRENCY_SCALE, 16 * _CONCURRENCY_SCALE, 4 * _CONCURRENCY_SCALE,
+           32 * _CONCURRENCY_SCALE, 16 * _CONCURRENCY_SCALE)
+    )
+    try:
+        ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 32 * _CONCURRENCY_SCALE))
+        ADMISSION_MAX_WAIT_MS = int(os.getenv('ADMISSION_MAX_WAIT_MS', 2000))
+        STORAGE_OPS_PER_SECOND = float(os.getenv('STORAGE_OPS_PER_SECOND', 200 * _CONCURRENCY_SCALE))
+        STORAGE_OPS_BURST = int(os.getenv('STORAGE_OPS_BURST', 100 * _CONCURRENCY_SCALE))
+        STORAGE_MAX_BACKLOG_MS = int(os.getenv('STORAGE_MAX_BACKLOG_MS', 1000))
+    except (ValueError, TypeError):
+        ADMISSION_QUEUE_SIZE = 32 * _CONCURRENCY_SCALE
+        ADMISSION_MAX_WAIT_MS = 2000
+        STORAGE_OPS_PER_SECOND = 200.0 * _CONCURRENCY_SCALE
+        STORAGE_OPS_BURST = 100 * _CONCURRENCY_SCALE
+        STORAGE_MAX_BACKLOG_MS = 1000
+
+    # S3 resilience: timeouts, jittered exponential backoff on throttling /
+    # transient errors within a per-operation deadline, and a circuit
+    # breaker that fails fast (503) while storage is degraded
+    try:
+        S3_CONNECT_TIMEOUT_SECONDS = float(os.getenv('S3_CONNECT_TIMEOUT_SECONDS', 3))
+        S3_READ_TIMEOUT_SECONDS = float(os.getenv('S3_READ_TIMEOUT_SECONDS', 10))
+        S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', 4))
+        S3_BREAKER_THRESHOLD = int(os.getenv('S3_BREAKER_THRESHOLD', 8))
+        S3_BREAKER_COOLDOWN_SECONDS = int(os.getenv('S3_BREAKER_COOLDOWN_SECONDS', 15))
+    except (ValueError, TypeError):
+        S3_CONNECT_TIMEOUT_SECONDS = 3.0
+        S3_READ_TIMEOUT_SECONDS = 10.0
+        S3_MAX_ATTEMPTS = 4
+        S3_BREAKER_THRESHOLD = 8
+        S3_BREAKER_COOLDOWN_SECONDS = 15
+    # Without s3:ListBucket, S3 answers HEAD on a missing key with 403, not 404
+    S3_HEAD_403_AS_MISSING = str(os.getenv('S3_HEAD_403_AS_MISSING', 'true')).lower() in ['true', 'on', '1']
+    S3_RETRY_BASE_SECONDS = 0.1
+    S3_RETRY_MAX_BACKOFF_SECONDS = 2.0
+    S3_DEFAULT_DEADLINE_SECONDS = 10
+    S3_OP_DEADLINES = {
+        "head_object": 3,
+        "get_object": 5,
+        "list_objects_v2": 10,
+        "put_object": 15,
+        "upload_file": 60,
+        "upload_fileobj": 60,
+    }
+
+    # Production serving (gunicorn.conf.py): prompt texts loaded into the
+    # cache by the master before fork, per prompt pool
+    try:
+        WARMUP_PROMPT_LIMIT = int(os.getenv('WARMUP_PROMPT_LIMIT', 2000))
+    except (ValueError, TypeError):
+        WARMUP_PROMPT_LIMIT = 2000
+
+    # Concurrent S3 fan-out in api_get_prompt
+    try:
+        # Threads (greenlets in async mode) for concurrent S3 calls, and the
+        # HTTP connection pool they share
+        S3_IO_THREADS = int(os.getenv('S3_IO_THREADS', 32 * _CONCURRENCY_SCALE))
+        S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50 * _CONCURRENCY_SCALE))
+    except (ValueError, TypeError):
+        S3_IO_THREADS = 32 * _CONCURRENCY_SCALE
+        S3_MAX_POOL_CONNECTIONS = 50 * _CONCURRENCY_SCALE
+    PROMPT_FANOUT_CANDIDATES = 4
+    PROMPT_FANOUT_MAX_ROUNDS = 5
+
+    # Per-worker partitioned prompt allocation
+    try:
+        PROMPT_PARTITION_COUNT = max(1, int(os.getenv('PROMPT_PARTITION_COUNT', 8)))
+    except (ValueError, TypeError):
+        PROMPT_PARTITION_COUNT = 8
+    PROMPT_PARTITION_DIR = os.path.join(BASE_UPLOAD_DIR, "partitions")
+    # Whether every process of the deployment sees the same PROMPT_PARTITION_DIR.
+    # On Vercel each instance has its own empty /tmp, so slots claimed there
+    # say nothing about other instances; partitions are then picked at random.
+    PROMPT_PARTITION_SHARED = str(os.getenv('PROMPT_PARTITION_SHARED', 'false' if os.getenv('VERCEL') else 'true')).lower() in ['true', 'on', '1']
+    PROMPT_ALLOCATION_TTL_SECONDS = 30 * 60
+
+    # Prompt selection: "partitioned" (per-worker permutations) or "weighted"
+    # (coverage-balanced by speaker demographic). With weighted selection a
+    # prompt stays available until it has PROMPT_TARGET_RECORDINGS recordings.
+    PROMPT_SELECTION = os.getenv('PROMPT_SELECTION', 'partitioned')
+    try:
+        PROMPT_TARGET_RECORDINGS = int(os.getenv('PROMPT_TARGET_RECORDINGS', 1))
+    except (ValueError, TypeError):
+        PROMPT_TARGET_RECORDINGS = 1
+    PROMPT_WEIGHTS_REBUILD_SECONDS = 60
+
+    # Prompt text cache (memory LRU + /tmp disk tier, revalidated by ETag)
+    PROMPT_CACHE_DIR = os.path.join(BASE_UPLOAD_DIR, "prompt_cache")
+    PROMPT_CACHE_MAX_ENTRIES = 2048
+    PROMPT_CACHE_REVALIDATE_SECONDS = 3600
+
+    # Idempotent submissions (idempotency key / audio content hash -> uid)
+    SUBMISSIONS_DB_PATH = os.path.join(BASE_UPLOAD_DIR, "submissions.db")
+
+    # Resumable chunked uploads (init / append chunk N / complete). Chunks are
+    # spooled in this instance's /tmp, so a resume must reach the same
+    # instance: on Vercel, where instances do not share /tmp, an upload can
+    # only be resumed while its instance is alive.
+    CHUNK_SPOOL_DIR = os.path.join(BASE_UPLOAD_DIR, "chunks")
+    CHUNKED_UPLOAD_ENABLED = str(os.getenv('CHUNKED_UPLOAD_ENABLED', 'false')).lower() in ['true', 'on', '1']
+    CHUNK_MAX_BYTES = 1024 * 1024
+    CHUNK_MAX_COUNT = 512
+    # Uploads with no new chunk for this long are abandoned and deleted
+    CHUNK_UPLOAD_TTL_SECONDS = 6 * 3600
+    CHUNK_SWEEP_SECONDS = 300
+
+    # Cross-worker shared state (caches, counters, rate limits):
+    # "sqlite" (one file shared by the workers on a host), "redis" (any
+    # Redis-protocol server at SHARED_STATE_URL, needs `pip install redis`)
+    # or "memory" (per process)
+    SHARED_STATE_BACKEND = os.getenv('SHARED_STATE_BACKEND', 'sqlite').lower()
+    SHARED_STATE_DB_PATH = os.path.join(BASE_UPLOAD_DIR, "shared_state.db")
+    SHARED_STATE_URL = os.getenv('SHARED_STATE_URL', 'redis://localhost:6379/0')
+    # Prompt key listings are shared for this long before one worker re-lists
+    PROMPT_INDEX_TTL_SECONDS = 30
+    # Enforce STORAGE_OPS_PER_SECOND across all workers instead of per process
+    SHARED_STORAGE_BUDGET = os.getenv('SHARED_STORAGE_BUDGET', 'false').lower() == 'true'
+
+    # Bounded staging spool for /submit files awaiting finalize_session.
+    # Files are deleted once uploaded; unfinalized ones expire after the TTL.
+    SPOOL_INDEX_DB_PATH = os.path.join(BASE_UPLOAD_DIR, "spool.db")
+    try:
+        SPOOL_MAX_BYTES = int(os.getenv('SPOOL_MAX_BYTES', 512 * 1024 * 1024))
+        SPOOL_MAX_FILES = int(os.getenv('SPOOL_MAX_FILES', 20000))
+        SPOOL_TTL_SECONDS = int(os.getenv('SPOOL_TTL_SECONDS', 24 * 3600))
+    except (ValueError, TypeError):
+        SPOOL_MAX_BYTES = 512 * 1024 * 1024
+        SPOOL_MAX_FILES = 20000
+        SPOOL_TTL_SECONDS = 24 * 3600
+    SPOOL_SWEEP_SECONDS = 60
+
     # Restoring missing configs to prevent system crash (AttributeErrors)
     S3_PROMPTS_STANDARD_INPROGRESS = "prompts/standard/inprogress/"
     S3_PROMPTS_TRIBAL_INPROGRESS = "prompts/tribal/inprogress/"
@@ -76,3 +274,34 @@ class Config:
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@uoh-speech.com')
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
 
+    # Bearer token for Prometheus scrapes of /admin/metrics (admins can always view it)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Request tracing: requests slower than this dump their span tree to the slow log
+    try:
+        SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 2000))
+    except (ValueError, TypeError):
+        SLOW_REQUEST_THRESHOLD_MS = 2000.0
+    SLOW_LOG_PATH = os.path.join(BASE_UPLOAD_DIR, "logs", "slow_requests.jsonl")
+    SLOW_LOG_MAX_BYTES = 5 * 1024 * 1024
+    SLOW_LOG_BACKUPS = 3
+
+    # Sampling profiler for main/admin routes (can also be toggled from /admin/profiles)
+    PROFILING_ENABLED = str(os.getenv('PROFILING_ENABLED', 'false')).lower() in ['true', 'on', '1']
+    try:
+        PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.05))
+    except (ValueError, TypeError):
+        PROFILING_SAMPLE_RATE = 0.05
+    # Per-route overrides of the sample rate, e.g. "main.submit=0.5,admin.dashboard=0"
+    PROFILING_ROUTE_RATES = os.getenv('PROFILING_ROUTE_RATES', '')
+    PROFILING_INTERVAL_MS = 5
+    PROFILING_FLUSH_SECONDS = 30
+    PROFILE_DIR = os.path.join(BASE_UPLOAD_DIR, "profiles")
+    PROFILING_STATE_PATH = os.path.join(BASE_UPLOAD_DIR, "profiles", "settings.json")
+
+    # Background alert dispatcher (per-subject cooldowns live in the shared state)
+    ALERT_DIGEST_SECONDS = 30
+    ALERT_SMTP_IDLE_SECONDS = 300
+    # Send alerts before the request returns; serverless instances freeze background threads
+    ALERT_SEND_INLINE = str(os.getenv('ALERT_SEND_INLINE', 'true' if os.getenv('VERCEL') else 'false')).lower() in ['true', 'on', '1']
+
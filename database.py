@@ -1,7 +1,9 @@
+import os
 import sqlite3
 from datetime import datetime, timedelta
 from flask import session
 from config import Config
+from utils.metrics_utils import instrument
 
 def get_db_connection(db_path):
     conn = sqlite3.connect(db_path)
@@ -15,6 +17,7 @@ def get_db_path_for_user():
         return Config.TRIBAL_DB_PATH
     return Config.DB_PATH
 
+@instrument("db.reset_old_in_progress_prompts")
 def reset_old_in_progress_prompts(db_path):
     try:
         conn = get_db_connection(db_path)
@@ -33,6 +36,7 @@ def reset_old_in_progress_prompts(db_path):
     except Exception as e:
         print(f"Error resetting prompts in {db_path}: {e}")
 
+@instrument("db.get_next_prompt")
 def get_next_prompt():
     current_db_path = get_db_path_for_user()
     reset_old_in_progress_prompts(current_db_path)
@@ -70,6 +74,7 @@ def get_next_prompt():
             conn.close()
         return None
 
+@instrument("db.mark_prompt_as_used")
 def mark_prompt_as_used(prompt_id):
     current_db_path = get_db_path_for_user()
     conn = get_db_connection(current_db_path)
@@ -81,6 +86,7 @@ def mark_prompt_as_used(prompt_id):
     conn.commit()
     conn.close()
 
+@instrument("db.get_prompt_text")
 def get_prompt_text(prompt_id):
     current_db_path = get_db_path_for_user()
     conn = get_db_connection(current_db_path)
@@ -92,6 +98,7 @@ def get_prompt_text(prompt_id):
         return row["text"]
     return None
 
+@instrument("db.add_new_prompt")
 def add_new_prompt(language, text, db_type='standard'):
     target_db = Config.TRIBAL_DB_PATH if db_type == 'tribal' else Config.DB_PATH
     conn = get_db_connection(target_db)
@@ -109,6 +116,7 @@ def add_new_prompt(language, text, db_type='standard'):
         conn.close()
         return None
 
+@instrument("db.get_prompt_stats")
 def get_prompt_stats(db_type='standard'):
     target_db = Config.TRIBAL_DB_PATH if db_type == 'tribal' else Config.DB_PATH
     conn = get_db_connection(target_db)
@@ -118,6 +126,7 @@ def get_prompt_stats(db_type='standard'):
     conn.close()
     return stats
 
+@instrument("db.bulk_add_prompts")
 def bulk_add_prompts(prompts_list, db_type='standard'):
     """
     Adds multiple prompts to the database.
@@ -157,8 +166,9 @@ def bulk_add_prompts(prompts_list, db_type='standard'):
         conn.close()
         
     return added_count, added_prompts
+@instrument("db.create_recordings_table")
 def create_recordings_table(db_path):
-    """Creates the recordings table if it doesn't exist."""
+    """Creates the recordings table if it doesn't exist. Returns False if that failed."""
     try:
         conn = get_db_connection(db_path)
         cur = conn.cursor()
@@ -173,11 +183,20 @@ def create_recordings_table(db_path):
             prompt_text TEXT,
             audio_path TEXT,
             is_tribal INTEGER,
+            prompt_key TEXT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
         """)
+        # Add the prompt_key column if it doesn't exist (for existing databases)
+        try:
+            cur.execute("ALTER TABLE recordings ADD COLUMN prompt_key TEXT")
+        except sqlite3.OperationalError:
+            # Column already exists
+            pass
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_recordings_prompt_key ON recordings (prompt_key)")
         conn.commit()
         conn.close()
+        return True
     except sqlite3.OperationalError as e:
         if "readonly" in str(e).lower():
             print(f"⚠️ Database {db_path} is read-only. Skipping table creation.")
@@ -185,21 +204,25 @@ def create_recordings_table(db_path):
             print(f"❌ Operational error creating recordings table in {db_path}: {e}")
     except Exception as e:
         print(f"❌ Error creating recordings table in {db_path}: {e}")
+    return False
 
 
-def add_recording_metadata(uid, user_info, audio_path, prompt_text, is_tribal):
+@instrument("db.add_recording_metadata")
+def add_recording_metadata(uid, user_info, audio_path, prompt_text, is_tribal, prompt_key=None):
     """
     Saves recording metadata to both databases to ensure consistency.
     We save to both because the admin dashboard might check either, 
     and it provides a fallback.
+    Returns False if either database could not be written.
     """
+    saved = True
     for db_path in [Config.DB_PATH, Config.TRIBAL_DB_PATH]:
         conn = get_db_connection(db_path)
         try:
             cur = conn.cursor()
             cur.execute("""
-                INSERT INTO recordings (uid, age, gender, location, state, prompt_text, audio_path, is_tribal)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO recordings (uid, age, gender, location, state, prompt_text, audio_path, is_tribal, prompt_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 uid,
                 user_info.get('age'),
@@ -208,7 +231,8 @@ def add_recording_metadata(uid, user_info, audio_path, prompt_text, is_tribal):
                 user_info.get('state'),
                 prompt_text,
                 audio_path,
-                1 if is_tribal else 0
+                1 if is_tribal else 0,
+                prompt_key
             ))
             conn.commit()
         except sqlite3.IntegrityError:
@@ -216,9 +240,12 @@ def add_recording_metadata(uid, user_info, audio_path, prompt_text, is_tribal):
             pass
         except Exception as e:
             print(f"Error saving recording metadata to {db_path}: {e}")
+            saved = False
         finally:
             conn.close()
+    return saved
 
+@instrument("db.get_total_recordings_count")
 def get_total_recordings_count():
     """Returns the total number of recordings across both databases (handles duplicates via UID)."""
     # Simply count from one DB as we are mirroring them now for simplicity of query
@@ -232,6 +259,34 @@ def get_total_recordings_count():
     conn.close()
     return count
 
+@instrument("db.get_prompt_recording_counts")
+def get_prompt_recording_counts():
+    """
+    Returns [(prompt_key, gender, age), count] rows: recordings per prompt and
+    speaker demographic. One grouped query, used to seed the weighted selector.
+    """
+    conn = get_db_connection(Config.DB_PATH)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT prompt_key, gender, age, COUNT(*) FROM recordings
+        WHERE prompt_key IS NOT NULL
+        GROUP BY prompt_key, gender, age
+    """)
+    rows = [((row[0], row[1], row[2]), row[3]) for row in cur.fetchall()]
+    conn.close()
+    return rows
+
+@instrument("db.count_recordings_for_prompt")
+def count_recordings_for_prompt(prompt_key):
+    """Number of recordings already made for a prompt (uses the prompt_key index)."""
+    conn = get_db_connection(Config.DB_PATH)
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM recordings WHERE prompt_key = ?", (prompt_key,))
+    count = cur.fetchone()[0]
+    conn.close()
+    return count
+
+@instrument("db.get_all_recordings")
 def get_all_recordings():
     """Fetches all recordings from the database for the metadata view."""
     conn = get_db_connection(Config.DB_PATH)
@@ -241,3 +296,171 @@ def get_all_recordings():
     rows = cur.fetchall()
     conn.close()
     return [dict(row) for row in rows]
+
+@instrument("db.create_submissions_table")
+def create_submissions_table(db_path=None):
+    """Creates the submissions table used to make /submit idempotent. Returns False if that failed."""
+    db_path = db_path or Config.SUBMISSIONS_DB_PATH
+    try:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = get_db_connection(db_path)
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT UNIQUE NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            content_hash TEXT,
+            audio_path TEXT,
+            text_path TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_submissions_content_hash ON submissions (content_hash)")
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error creating submissions table in {db_path}: {e}")
+    return False
+
+@instrument("db.find_submission")
+def find_submission(idempotency_key=None, content_hash=None):
+    """
+    Looks up an earlier submission by idempotency key first, then by content hash.
+    Callers scope both to the submitting session (see routes/main_routes.py).
+    Returns the row as a dict, or None.
+    """
+    if not idempotency_key and not content_hash:
+        return None
+    try:
+        conn = get_db_connection(Config.SUBMISSIONS_DB_PATH)
+        cur = conn.cursor()
+        row = None
+        if idempotency_key:
+            cur.execute("SELECT * FROM submissions WHERE idempotency_key = ?", (idempotency_key,))
+            row = cur.fetchone()
+        if row is None and content_hash:
+            cur.execute("SELECT * FROM submissions WHERE content_hash = ? LIMIT 1", (content_hash,))
+            row = cur.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"Error looking up submission: {e}")
+        return None
+
+@instrument("db.record_submission")
+def record_submission(uid, idempotency_key, content_hash, audio_path, text_path):
+    """Records a stored submission. Returns False if the key was already taken."""
+    try:
+        conn = get_db_connection(Config.SUBMISSIONS_DB_PATH)
+        conn.execute("""
+            INSERT INTO submissions (uid, idempotency_key, content_hash, audio_path, text_path)
+            VALUES (?, ?, ?, ?, ?)
+        """, (uid, idempotency_key or None, content_hash, audio_path, text_path))
+        conn.commit()
+        conn.close()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    except Exception as e:
+        print(f"Error recording submission {uid}: {e}")
+        return False
+
+@instrument("db.create_prompt_hashes_table")
+def create_prompt_hashes_table(db_path=None):
+    """Creates the content-hash index used to deduplicate prompts on the S3 path. Returns False if that failed."""
+    db_path = db_path or Config.DB_PATH
+    try:
+        conn = get_db_connection(db_path)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS prompt_hashes (
+            db_type TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            s3_key TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (db_type, content_hash)
+        )
+        """)
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error creating prompt_hashes table in {db_path}: {e}")
+    return False
+
+@instrument("db.claim_prompt_hash")
+def claim_prompt_hash(content_hash, s3_key, db_type='standard'):
+    """
+    Registers a prompt hash. Returns None if it was new (the caller may upload),
+    or the S3 key already holding the same prompt.
+    """
+    conn = get_db_connection(Config.DB_PATH)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT OR IGNORE INTO prompt_hashes (db_type, content_hash, s3_key) VALUES (?, ?, ?)",
+            (db_type, content_hash, s3_key)
+        )
+        conn.commit()
+        if cur.rowcount > 0:
+            return None
+        cur.execute(
+            "SELECT s3_key FROM prompt_hashes WHERE db_type = ? AND content_hash = ?",
+            (db_type, content_hash)
+        )
+        row = cur.fetchone()
+        return row["s3_key"] if row else s3_key
+    finally:
+        conn.close()
+
+@instrument("db.release_prompt_hash")
+def release_prompt_hash(content_hash, db_type='standard'):
+    """Removes a hash again, e.g. when the upload it was claimed for failed."""
+    conn = get_db_connection(Config.DB_PATH)
+    conn.execute("DELETE FROM prompt_hashes WHERE db_type = ? AND content_hash = ?", (db_type, content_hash))
+    conn.commit()
+    conn.close()
+
+# Bump when a CREATE TABLE / CREATE INDEX statement above changes
+SCHEMA_VERSION = 3
+
+def _schema_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+def _stamp_schema_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    finally:
+        conn.close()
+
+def ensure_schema():
+    """
+    Creates the recordings, submissions and prompt hash tables when needed.
+    Each database records SCHEMA_VERSION in PRAGMA user_version, so the
+    check survives with the database itself (a /tmp marker would be lost on
+    every new Vercel instance) and later boots only read one pragma per file.
+    """
+    creators = {
+        Config.DB_PATH: (create_recordings_table, create_prompt_hashes_table),
+        Config.TRIBAL_DB_PATH: (create_recordings_table,),
+        Config.SUBMISSIONS_DB_PATH: (create_submissions_table,),
+    }
+    created = False
+    for db_path, create_tables in creators.items():
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            if _schema_version(db_path) >= SCHEMA_VERSION:
+                continue
+            # Stamp only if every step worked, so a failed one is retried on the next boot
+            if all([create_table(db_path) for create_table in create_tables]):
+                _stamp_schema_version(db_path)
+                created = True
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Could not check the schema of {db_path}: {e}")
+    return created
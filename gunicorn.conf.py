@@ -0,0 +1,70 @@
+"""
+Production gunicorn settings. Loaded automatically when gunicorn runs from
+the project root:
+
+    gunicorn app:app
+
+Every request spends most of its time waiting on S3, so the default is a
+few processes with a thread pool each (gthread), not one process per CPU
+core doing nothing. SERVING_MODE=async switches to gevent workers instead:
+one cooperative process per core, each holding up to
+GUNICORN_WORKER_CONNECTIONS requests and hundreds of in-flight S3 calls
+(requires `pip install gevent`). See "Production Serving" in README.md for
+the benchmark behind these defaults. All settings can be overridden from
+the environment.
+
+Not everything yields under gevent: SQLite calls (shared state, upload
+spool, submissions) run on the event loop and stall the whole worker while
+they wait on a busy database lock (up to their 5 s timeout). Keep those
+databases on local disk; the prompt partition flock is non-blocking.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS") or (
+    "gevent" if os.getenv("SERVING_MODE", "threaded") == "async" else "gthread")
+if worker_class == "gevent":
+    try:
+        from gevent import monkey
+        # Patch sockets, ssl, threading and time before the app (boto3,
+        # urllib3, our thread pools and locks) is preloaded in the master
+        monkey.patch_all()
+    except ImportError:
+        print("⚠️ SERVING_MODE=async needs gevent (pip install gevent); using gthread workers")
+        worker_class = "gthread"
+# Config scales its concurrency limits from SERVING_MODE; make it match the
+# worker class that actually runs before the app is imported
+os.environ["SERVING_MODE"] = "async" if worker_class == "gevent" else "threaded"
+
+if worker_class == "gevent":
+    workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+else:
+    workers = int(os.getenv("WEB_CONCURRENCY", min(2 * multiprocessing.cpu_count(), 8)))
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Import the app (and warm it up) once in the master, then fork
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+# "-" logs to stdout; set GUNICORN_ACCESS_LOG= (empty) to disable
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+
+
+def when_ready(server):
+    from app import app
+    from utils.serving import warm_up
+    warm_up(app)
+
+
+def post_fork(server, worker):
+    from utils.serving import after_fork
+    after_fork()
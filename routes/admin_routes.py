@@ -1,10 +1,19 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, Response
-import os, json, csv, io
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, Response, send_from_directory
+import os, json, csv, io, uuid
 from datetime import datetime
 from functools import wraps
 from config import Config
-from database import add_new_prompt, get_prompt_stats, get_total_recordings_count, get_all_recordings
+from database import add_new_prompt, get_prompt_stats, get_total_recordings_count, get_all_recordings, claim_prompt_hash, release_prompt_hash
 from utils.s3_utils import S3Manager
+from utils.metrics_utils import registry as metrics_registry
+from utils.tracing_utils import read_slow_requests
+from utils.profiling_utils import profiler, list_profiles, parse_route_rates
+from utils.prompt_dedup import prompt_hash
+from utils.metadata_segments import compact_metadata, count_metadata, load_all_metadata
+from utils.upload_spool import upload_spool
+from utils.key_layout import object_key
+from utils.prompt_listing import prompt_listing
+from utils.resilience import StorageUnavailable
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -16,6 +25,47 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _claim_prompt(text, s3_key, db_type):
+    """
+    Checks the prompt hash index before uploading.
+    Returns (content_hash, existing_key); existing_key is set for duplicates.
+    If the index is unavailable the prompt is treated as new.
+    """
+    content_hash = prompt_hash(text)
+    try:
+        return content_hash, claim_prompt_hash(content_hash, s3_key, db_type)
+    except Exception as e:
+        print(f"⚠️ Prompt hash index unavailable, skipping duplicate check: {e}")
+        return None, None
+
+def _release_prompt(content_hash, db_type):
+    if content_hash:
+        try:
+            release_prompt_hash(content_hash, db_type)
+        except Exception as e:
+            print(f"⚠️ Could not release prompt hash {content_hash}: {e}")
+
+def _load_recordings():
+    """
+    Recordings from the database; on Vercel, where the local SQLite is
+    usually empty, falls back to the compacted metadata segments in S3.
+    """
+    recordings = get_all_recordings()
+    if recordings:
+        return recordings
+    try:
+        return load_all_metadata(S3Manager())
+    except Exception as e:
+        print(f"⚠️ Could not load metadata segments from S3: {e}")
+        return []
+
+def _token_or_admin():
+    """True for a logged-in admin or a request carrying the METRICS_TOKEN bearer token."""
+    token = Config.METRICS_TOKEN
+    return bool(session.get("admin") or (
+        token and request.headers.get("Authorization") == f"Bearer {token}"
+    ))
+
 @admin_bp.route("/login", methods=["GET", "POST"])
 def admin_login():
     # If already logged in, go to dashboard
@@ -65,6 +115,10 @@ def admin_dashboard():
         # Total in "prompts/standard/" includes subfolders like "used/"
         total_std = s3.count_files(Config.S3_PROMPTS_STANDARD_PREFIX)
         used_std = s3.count_files(Config.S3_PROMPTS_STANDARD_USED)
+        std_bitmap = s3.used_bitmap(Config.S3_PROMPTS_STANDARD_PREFIX)
+        if std_bitmap is not None:
+            # Bitmap-retired prompts stay in the root folder
+            used_std += std_bitmap.count()
         # Available = Total - Used (Assuming no other significant subfolders)
         unused_std = max(0, total_std - used_std)
         
@@ -77,6 +131,9 @@ def admin_dashboard():
         # 4. Tribal Prompts
         total_tribal = s3.count_files(Config.S3_PROMPTS_TRIBAL_PREFIX)
         used_tribal = s3.count_files(Config.S3_PROMPTS_TRIBAL_USED)
+        tribal_bitmap = s3.used_bitmap(Config.S3_PROMPTS_TRIBAL_PREFIX)
+        if tribal_bitmap is not None:
+            used_tribal += tribal_bitmap.count()
         unused_tribal = max(0, total_tribal - used_tribal)
         
         tribal_prompt_stats = {
@@ -87,13 +144,15 @@ def admin_dashboard():
         # 5. Metadata / User Records (Now from Database for reliability, but fallback to S3 for Vercel)
         metadata_count = get_total_recordings_count()
         if metadata_count == 0:
-             # Fallback: Count files in the dedicated metadata folder in S3
-             metadata_count = s3.count_files(Config.S3_METADATA_PREFIX)
-             # Note: CSV exports might exist in this folder too, so this is an estimate
-             # but better than showing 0 when data exists.
+             # Fallback: segment counts from the manifest plus the metadata files
+             # written since the last compaction (one GET and one listing)
+             metadata_count = count_metadata(s3)
         
         print(f"DEBUG DASHBOARD: Audio={audio_count}, Trans={transcription_count}, StdPrompts={prompt_stats}, Tribal={tribal_prompt_stats}, Metadata={metadata_count}")
         
+    except StorageUnavailable:
+        # S3 is down: answer with the 503 + Retry-After from init_resilience, not zero counts
+        raise
     except Exception as e:
         print(f"Error fetching S3 stats in dashboard: {e}")
         import traceback
@@ -116,8 +175,8 @@ def admin_dashboard():
 @login_required
 def admin_metadata():
     
-    # Get recordings from database
-    recordings = get_all_recordings()
+    # Get recordings from database (or S3 metadata segments)
+    recordings = _load_recordings()
     metadata_count = len(recordings)
     
     return render_template("admin_metadata.html", 
@@ -128,8 +187,8 @@ def admin_metadata():
 @login_required
 def download_metadata():
     
-    # Get metadata from database
-    metadata_list = get_all_recordings()
+    # Get metadata from database (or S3 metadata segments)
+    metadata_list = _load_recordings()
     
     # Create CSV in memory
     output = io.StringIO()
@@ -174,7 +233,6 @@ def add_prompt():
     
     try:
         # Generate a unique ID (S3-only mode)
-        import uuid
         prompt_uid = uuid.uuid4().hex[:8]
         
         if db_type == 'tribal':
@@ -186,16 +244,22 @@ def add_prompt():
             
         s3 = S3Manager()
         
-        # 1. Upload Telugu prompt
+        # 1. Upload Telugu prompt (unless the same text already exists)
         filename = f"UOH_{prompt_uid}.txt"
-        s3_key = f"{prompt_prefix}{filename}"
-        s3.upload_string(text, s3_key)
+        s3_key = object_key(prompt_prefix, filename)
+        content_hash, existing_key = _claim_prompt(text, s3_key, db_type)
+        if existing_key:
+            return jsonify({"error": f"Duplicate prompt (already stored as {existing_key})"}), 409
+        if not s3.upload_string(text, s3_key):
+            _release_prompt(content_hash, db_type)
+            return jsonify({"error": "Failed to upload prompt to S3"}), 500
         
         # 2. Upload English transliteration (if provided)
         if english_text:
-            s3_en_key = f"{en_prompt_prefix}{filename}"
+            s3_en_key = object_key(en_prompt_prefix, filename)
             s3.upload_string(english_text, s3_en_key)
-            
+
+        prompt_listing.invalidate(prompt_prefix)
         return jsonify({"success": True, "message": f"Prompt added to S3 ({db_type}) as {filename}"})
              
     except Exception as e:
@@ -216,7 +280,7 @@ def extract_and_upload_individual_files(added_prompts, prompt_prefix):
         if pid:
             try:
                 # Filename: UOH_{id}.txt
-                s3_key = f"{prompt_prefix}UOH_{pid}.txt"
+                s3_key = object_key(prompt_prefix, f"UOH_{pid}.txt")
                 if s3.upload_string(ptext, s3_key):
                     print(f"Uploaded: {s3_key}")
                     success_count += 1
@@ -226,6 +290,7 @@ def extract_and_upload_individual_files(added_prompts, prompt_prefix):
                 print(f"Error uploading {pid}: {e}")
                 
     print(f"Completed S3 upload. Success: {success_count}/{len(added_prompts)}")
+    prompt_listing.invalidate(prompt_prefix)
     return success_count
 
 @admin_bp.route("/upload_prompts", methods=["POST"])
@@ -242,13 +307,15 @@ def upload_prompts():
     if not file.filename.lower().endswith(('.csv', '.xlsx')):
         return jsonify({"error": "Only CSV or XLSX files are allowed"}), 400
 
+    db_type = request.form.get("db_type", "tribal")
+    claimed_hashes = {}  # local Telugu path -> content hash
+    uploaded = set()
+
     try:
         import csv, io, os, re, tempfile, shutil
-        import pandas as pd
 
         file_content = file.read()
         default_language = request.form.get("language", "te")
-        db_type = request.form.get("db_type", "tribal")
 
         if db_type == 'tribal':
             S3_PROMPT_PREFIX = Config.S3_PROMPTS_TRIBAL_PREFIX
@@ -259,6 +326,7 @@ def upload_prompts():
 
         prompts_to_add = []
         txt_files = []
+        duplicates_skipped = 0
 
 
         def safe_filename(name: str) -> str:
@@ -294,9 +362,16 @@ def upload_prompts():
                 language = (row.get(lang_col) if lang_col else None) or default_language
                 prompt_id = row.get(id_col) if id_col else f"UOH_{uuid.uuid4().hex[:6]}"
 
-                # Save Telugu
+                # Skip prompts that are already stored (hash index lookup, O(1) per row)
                 filename = safe_filename(f"{prompt_id}.txt")
+                content_hash, existing_key = _claim_prompt(text, object_key(S3_PROMPT_PREFIX, filename), db_type)
+                if existing_key:
+                    duplicates_skipped += 1
+                    continue
+
+                # Save Telugu
                 te_path = os.path.join(temp_dir, filename)
+                claimed_hashes[te_path] = content_hash
                 with open(te_path, "w", encoding="utf-8") as f:
                     f.write(text)
                 txt_files.append((te_path, S3_PROMPT_PREFIX))
@@ -310,6 +385,7 @@ def upload_prompts():
 
         # ================= XLSX =================
         else:
+            import pandas as pd
             df = pd.read_excel(io.BytesIO(file_content))
 
             cols = {str(c).lower(): c for c in df.columns}
@@ -330,9 +406,16 @@ def upload_prompts():
                 language = (row[lang_col] if lang_col else None) or default_language
                 prompt_id = row[id_col] if id_col else f"UOH_{uuid.uuid4().hex[:6]}"
 
-                # Save Telugu
+                # Skip prompts that are already stored (hash index lookup, O(1) per row)
                 filename = safe_filename(f"{prompt_id}.txt")
+                content_hash, existing_key = _claim_prompt(text, object_key(S3_PROMPT_PREFIX, filename), db_type)
+                if existing_key:
+                    duplicates_skipped += 1
+                    continue
+
+                # Save Telugu
                 te_path = os.path.join(temp_dir, filename)
+                claimed_hashes[te_path] = content_hash
                 with open(te_path, "w", encoding="utf-8") as f:
                     f.write(text)
                 txt_files.append((te_path, S3_PROMPT_PREFIX))
@@ -377,23 +460,31 @@ def upload_prompts():
                 else: # (local_path, s3_prefix, original_filename) -> English
                     path, prefix, filename = item
                 
-                s3_key = f"{prefix}{filename}"
+                s3_key = object_key(prefix, filename)
                 if s3.upload_file(path, s3_key):
                     success_count += 1
+                    uploaded.add(path)
             except Exception as e:
                 print(f"Failed to upload {item[0]}: {e}")
 
         # Clean up
         shutil.rmtree(temp_dir, ignore_errors=True)
+        prompt_listing.invalidate(S3_PROMPT_PREFIX)
 
         return jsonify({
             "success": True,
-            "message": f"Uploaded {success_count} prompts directly to S3.",
-            "txt_uploaded": success_count
+            "message": f"Uploaded {success_count} prompts directly to S3 ({duplicates_skipped} duplicates skipped).",
+            "txt_uploaded": success_count,
+            "duplicates_skipped": duplicates_skipped
         })
 
     except Exception as e:
         return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+    finally:
+        # Give back the hash of every claimed prompt that did not reach S3
+        for path, content_hash in claimed_hashes.items():
+            if path not in uploaded:
+                _release_prompt(content_hash, db_type)
 
 
 
@@ -404,22 +495,26 @@ def s3_status():
     try:
         s3 = S3Manager()
         
-        # Local counts (reusing logic from dashboard but simplified)
+        # Local counts come from the spool index, not directory listings
+        local = upload_spool.stats()["categories"]
+        def local_files(upload_dir):
+            return local.get(os.path.basename(upload_dir), {}).get("files", 0)
+
         stats = {
             "Audio Queries": {
-                "local": len([f for f in os.listdir(Config.UPLOAD_AUDIO_DIR)]) if os.path.exists(Config.UPLOAD_AUDIO_DIR) else 0,
+                "local": local_files(Config.UPLOAD_AUDIO_DIR),
                 "s3": s3.count_files(Config.S3_AUDIO_PREFIX)
             },
             "Transcription": {
-                "local": len([f for f in os.listdir(Config.UPLOAD_TRANSCRIPTION_DIR) if f.endswith('.txt')]) if os.path.exists(Config.UPLOAD_TRANSCRIPTION_DIR) else 0,
+                "local": local_files(Config.UPLOAD_TRANSCRIPTION_DIR),
                 "s3": s3.count_files(Config.S3_TRANSCRIPTION_PREFIX)
             },
             "Tribal Audio": {
-                "local": len([f for f in os.listdir(Config.TRIBAL_AUDIO_DIR)]) if os.path.exists(Config.TRIBAL_AUDIO_DIR) else 0,
+                "local": local_files(Config.TRIBAL_AUDIO_DIR),
                 "s3": s3.count_files(Config.S3_TRIBAL_AUDIO_PREFIX)
             },
             "Tribal Transcription": {
-                "local": len([f for f in os.listdir(Config.TRIBAL_TRANSCRIPTION_DIR) if f.endswith('.txt')]) if os.path.exists(Config.TRIBAL_TRANSCRIPTION_DIR) else 0,
+                "local": local_files(Config.TRIBAL_TRANSCRIPTION_DIR),
                 "s3": s3.count_files(Config.S3_TRIBAL_TRANSCRIPTION_PREFIX)
             }
         }
@@ -463,6 +558,76 @@ def sync_s3_prompts():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@admin_bp.route("/metrics")
+def admin_metrics():
+    """Per-operation / per-route metrics in Prometheus text format."""
+    if not _token_or_admin():
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+
+    return Response(metrics_registry.render_prometheus(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@admin_bp.route("/spool")
+def admin_spool():
+    """Files and bytes staged locally awaiting upload, per directory, against the quota."""
+    if not _token_or_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(upload_spool.stats())
+
+@admin_bp.route("/metadata/compact", methods=["POST"])
+def admin_compact_metadata():
+    """
+    Merges new per-recording metadata JSONs into segments. Meant to be
+    called periodically (cron) with the metrics bearer token, or by an admin.
+    """
+    if not _token_or_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        compacted = compact_metadata(S3Manager())
+        return jsonify({"success": True, "compacted": compacted})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/slow_requests")
+@login_required
+def admin_slow_requests():
+    """Slowest recent requests with their span trees."""
+    slow_requests = read_slow_requests(limit=50)
+    return render_template("admin_slow_requests.html",
+                           slow_requests=slow_requests,
+                           threshold_ms=Config.SLOW_REQUEST_THRESHOLD_MS)
+
+@admin_bp.route("/profiles")
+@login_required
+def admin_profiles():
+    """Lists the per-route sampling profiles and the profiler toggle."""
+    profiler.flush()
+    return render_template("admin_profiles.html",
+                           profiles=list_profiles(),
+                           settings=profiler.get_settings())
+
+@admin_bp.route("/profiles/settings", methods=["POST"])
+@login_required
+def admin_profiles_settings():
+    enabled = request.form.get("enabled") == "on"
+    try:
+        sample_rate = float(request.form.get("sample_rate", Config.PROFILING_SAMPLE_RATE))
+    except (ValueError, TypeError):
+        flash("Invalid sample rate")
+        return redirect(url_for("admin.admin_profiles"))
+
+    route_rates = parse_route_rates(request.form.get("route_rates", ""))
+    profiler.set_settings(enabled, sample_rate, route_rates)
+    return redirect(url_for("admin.admin_profiles"))
+
+@admin_bp.route("/profiles/<path:name>")
+@login_required
+def download_profile(name):
+    if not name.endswith(".collapsed"):
+        return jsonify({"error": "Not found"}), 404
+    return send_from_directory(Config.PROFILE_DIR, name, as_attachment=True, mimetype="text/plain")
+
 @admin_bp.route("/logout")
 def admin_logout():
     session.pop("admin", None)
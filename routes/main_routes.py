@@ -1,15 +1,209 @@
 from flask import Blueprint, render_template, request, jsonify, session
-import os, uuid, json
+import os, uuid, json, hashlib, time
 from config import Config
 
-from database import reset_old_in_progress_prompts, add_recording_metadata
+from database import reset_old_in_progress_prompts, add_recording_metadata, find_submission, record_submission, count_recordings_for_prompt
 from utils.s3_utils import S3Manager
+from utils.chunk_utils import ChunkSpool
+from utils.prompt_weights import weighted_selector
+from utils.used_bitmap import used_bitmaps
+from utils.upload_spool import upload_spool, SpoolFull
+from utils.key_layout import object_key
 
 main_bp = Blueprint('main', __name__)
 
+def _is_tribal_user(user_info):
+    return user_info.get("state", "") in ["TS-Tribal", "AP-Tribal"]
+
+def _get_s3_prefixes(is_tribal):
+    """Returns the (audio, transcription) S3 prefixes for the user's pool."""
+    if is_tribal:
+        return Config.S3_TRIBAL_AUDIO_PREFIX, Config.S3_TRIBAL_TRANSCRIPTION_PREFIX
+    return Config.S3_AUDIO_PREFIX, Config.S3_TRANSCRIPTION_PREFIX
+
+def _get_upload_dirs(is_tribal):
+    """Returns the local (audio, transcription) staging directories, creating them if needed."""
+    if is_tribal:
+        uploads_audio_dir = Config.TRIBAL_AUDIO_DIR
+        uploads_transcription_dir = Config.TRIBAL_TRANSCRIPTION_DIR
+    else:
+        uploads_audio_dir = Config.UPLOAD_AUDIO_DIR
+        uploads_transcription_dir = Config.UPLOAD_TRANSCRIPTION_DIR
+
+    os.makedirs(uploads_audio_dir, exist_ok=True)
+    os.makedirs(uploads_transcription_dir, exist_ok=True)
+    return uploads_audio_dir, uploads_transcription_dir
+
+def _queue_pending_upload(uid, audio_path, text_path, prompt_id, text, is_tribal, user_info):
+    """Stores details in session for batch upload later (see finalize_session)."""
+    pending_uploads = session.get("pending_uploads", [])
+    pending_uploads.append({
+        "uid": uid,
+        "audio_path": audio_path,
+        "text_path": text_path,
+        "prompt_id": prompt_id,
+        "prompt_text": text, # Store the text submitted for backup
+        "is_tribal": is_tribal,
+        "user_info": user_info
+    })
+    session["pending_uploads"] = pending_uploads
+    session.modified = True
+    
+    print(f"✅ Saved {uid} locally. Queued for S3 (Queue size: {len(pending_uploads)})")
+
+def _spool_full(e):
+    """503 with Retry-After: the spool frees up as other sessions finalize or expire."""
+    print(f"⚠️ {e}")
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.headers["Retry-After"] = "30"
+    return response, 503
+
+def _prune_direct_uploads(direct_uploads):
+    """
+    Drops issued direct uploads whose URLs expired well ago and keeps only
+    the newest DIRECT_UPLOAD_MAX_PENDING, so abandoned takes cannot grow the
+    cookie session without bound.
+    """
+    cutoff = time.time() - 2 * Config.PRESIGNED_URL_EXPIRY
+    live = sorted(((uid, item) for uid, item in direct_uploads.items() if item.get("issued", 0) >= cutoff),
+                  key=lambda entry: entry[1]["issued"])
+    return dict(live[-Config.DIRECT_UPLOAD_MAX_PENDING:])
+
+def _submission_scope():
+    """
+    Random id of this cookie session, issued with the user details. Idempotency
+    keys and content hashes are scoped to it, so a submission can only be
+    replayed to the session that stored it (two volunteers may well send
+    byte-identical audio, e.g. silence).
+    """
+    scope = session.get("submission_scope")
+    if not scope:
+        scope = session["submission_scope"] = uuid.uuid4().hex
+    return scope
+
+def _hash_upload(file_storage, prompt_id, scope):
+    """Streams the uploaded audio through SHA-256 (scoped to the session and prompt) without loading it whole."""
+    digest = hashlib.sha256(f"{scope}:{prompt_id}".encode("utf-8"))
+    stream = file_storage.stream
+    for block in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def _replay_submission(existing, prompt_id, text, is_tribal, user_info):
+    """
+    Handles a repeated /submit. If the original response never reached the
+    client, its session changes were lost too, so re-queue the stored files
+    for this session instead of storing the audio again.
+    """
+    uid = existing["uid"]
+    queued_uids = [item["uid"] for item in session.get("pending_uploads", [])]
+    if uid not in queued_uids and os.path.exists(existing["audio_path"]):
+        _queue_pending_upload(uid, existing["audio_path"], existing["text_path"], prompt_id, text, is_tribal, user_info)
+        session['completed'] = session.get('completed', 0) + 1
+
+    print(f"♻️ Duplicate submission short-circuited to {uid}")
+    return jsonify({"status": "saved", "uid": uid, "duplicate": True})
+
+def _retire_prompt(s3, prompt_id, uid, is_tribal):
+    """
+    Stores a copy of the original prompt next to the recording and marks the
+    prompt used: moves it (and its English transliteration) into the used/
+    folders, or sets its bit in the used bitmap.
+    """
+    prompt_text_content = None
+    if "/" in str(prompt_id) or ".txt" in str(prompt_id):
+         # S3 key
+         prompt_text_content = s3.read_prompt(prompt_id)
+    
+    if not prompt_text_content:
+        return
+
+    if is_tribal:
+        s3_prompt_prefix = Config.S3_PROMPTS_TRIBAL_PREFIX
+        s3_prompt_used = Config.S3_PROMPTS_TRIBAL_USED
+    else:
+        s3_prompt_prefix = Config.S3_PROMPTS_STANDARD_PREFIX
+        s3_prompt_used = Config.S3_PROMPTS_STANDARD_USED
+        
+    s3_actual_prompt_key = object_key(s3_prompt_prefix, f"{uid}_prompt.txt")
+    s3.upload_string(prompt_text_content, s3_actual_prompt_key)
+    
+    # With a multi-speaker target, keep the prompt available until it has enough recordings
+    target = Config.PROMPT_TARGET_RECORDINGS
+    if target > 1 and count_recordings_for_prompt(prompt_id) < target:
+        return
+
+    if "/" in str(prompt_id) and Config.USED_STATE_BACKEND == "bitmap":
+        # One CAS update of the pool's bitmap instead of copy+delete of both texts
+        pool = "tribal" if is_tribal else "standard"
+        if used_bitmaps.mark_used(s3, pool, [os.path.basename(prompt_id)]):
+            return
+        # Lost the CAS race too often (or S3 failed): retire it the folder way,
+        # which takes it out of the listing, so it is not issued again
+        print(f"⚠️ Could not mark {prompt_id} used in the bitmap; moving it to used/ instead")
+
+    # Move original prompt from Available(root) to used
+    if "/" in str(prompt_id): 
+        filename = os.path.basename(prompt_id)
+        dest_key = object_key(s3_prompt_used, filename)
+        s3.move_file(prompt_id, dest_key)
+        
+        # Also move the English transliteration if it exists
+        try:
+            if is_tribal:
+                en_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX
+                en_used_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_USED
+            else:
+                en_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX
+                en_used_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_USED
+                
+            en_source_key = object_key(en_prefix, filename)
+            en_dest_key = object_key(en_used_prefix, filename)
+            
+            # Only move if it actually exists (legacy prompts might not have English)
+            if s3.check_file_exists(en_source_key):
+                s3.move_file(en_source_key, en_dest_key)
+        except Exception as e:
+            print(f"Warning: Failed to move English transliteration for {filename}: {e}")
+
+def _upload_metadata(s3, uid, user_info):
+    """Saves the user metadata JSON to the dedicated metadata folder (for Admin Dashboard)."""
+    if not user_info:
+        return
+    metadata_json = json.dumps(user_info, ensure_ascii=False)
+    s3_dedicated_meta_key = object_key(Config.S3_METADATA_PREFIX, f"{uid}_metadata.json")
+    if not s3.upload_string(metadata_json, s3_dedicated_meta_key):
+        print(f"⚠️ Warning: Failed to upload metadata for {uid} to {s3_dedicated_meta_key}, but proceeding as audio/text are saved.")
+
+def _complete_recording(s3, uid, user_info, prompt_id, prompt_text, is_tribal):
+    """Records a recording whose audio/transcript are already in S3, then retires its prompt."""
+    # Upload Metadata
+    _upload_metadata(s3, uid, user_info)
+
+    # Save to Local Database for persistence and Admin Dashboard
+    s3_audio_prefix, _ = _get_s3_prefixes(is_tribal)
+    saved = add_recording_metadata(
+        uid=uid,
+        user_info=user_info,
+        audio_path=object_key(s3_audio_prefix, f"{uid}.wav"),
+        prompt_text=prompt_text,
+        is_tribal=is_tribal,
+        prompt_key=prompt_id if "/" in str(prompt_id) else None
+    )
+    if not saved:
+        print(f"⚠️ Recording {uid} is in S3 but not in the database; scripts/reconcile.py --repair will restore it.")
+    if "/" in str(prompt_id):
+        weighted_selector.record(prompt_id, user_info or {})
+
+    # Upload Original Prompt Text and retire the prompt
+    _retire_prompt(s3, prompt_id, uid, is_tribal)
+
 @main_bp.route("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html",
+                           direct_upload=Config.DIRECT_UPLOAD_ENABLED,
+                           chunked_upload=Config.CHUNKED_UPLOAD_ENABLED)
 
 @main_bp.route("/submit_user_info", methods=["POST"])
 def submit_user_info():
@@ -30,6 +224,7 @@ def submit_user_info():
     
     # Reset completed count for new user session
     session["completed"] = 0
+    _submission_scope()
     
     return jsonify({"success": True})
 
@@ -39,23 +234,33 @@ def submit():
     text = request.form.get("text")
     prompt_id = request.form.get("prompt_id")
 
-    uid = "UOH_" + uuid.uuid4().hex[:8]
-    
+    if audio is None:
+        return jsonify({"error": "Audio is required"}), 400
+
     user_info = session.get("user_info", {})
-    state = user_info.get("state", "")
-    is_tribal = state in ["TS-Tribal", "AP-Tribal"]
+    is_tribal = _is_tribal_user(user_info)
 
-    # Define upload directories
-    if is_tribal:
-        uploads_audio_dir = Config.TRIBAL_AUDIO_DIR
-        uploads_transcription_dir = Config.TRIBAL_TRANSCRIPTION_DIR
-    else:
-        uploads_audio_dir = Config.UPLOAD_AUDIO_DIR
-        uploads_transcription_dir = Config.UPLOAD_TRANSCRIPTION_DIR
-    
-    os.makedirs(uploads_audio_dir, exist_ok=True)
-    os.makedirs(uploads_transcription_dir, exist_ok=True)
+    # --- Idempotency ---
+    # A retried request carries the same key (and the same audio bytes),
+    # so it short-circuits to the uid stored the first time. Both are
+    # scoped to this session; other sessions never match.
+    scope = _submission_scope()
+    idempotency_key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    if idempotency_key:
+        idempotency_key = f"{scope}:{idempotency_key}"
+    content_hash = _hash_upload(audio, prompt_id, scope)
+    existing = find_submission(idempotency_key, content_hash)
+    if existing:
+        return _replay_submission(existing, prompt_id, text, is_tribal, user_info)
+
+    uid = "UOH_" + uuid.uuid4().hex[:8]
+
+    uploads_audio_dir, uploads_transcription_dir = _get_upload_dirs(is_tribal)
 
+    try:
+        reservation = upload_spool.reserve(request.content_length or 0, nfiles=2)
+    except SpoolFull as e:
+        return _spool_full(e)
 
     try:
         # Save audio locally
@@ -67,27 +272,20 @@ def submit():
         with open(text_path, "w", encoding="utf-8") as f:
             f.write(text)
 
-
+        upload_spool.track(audio_path, text_path, reservation=reservation)
     except Exception as e:
+        upload_spool.cancel(reservation)
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+    if not record_submission(uid, idempotency_key, content_hash, audio_path, text_path):
+        # A concurrent retry with the same key won the race; keep its copy
+        existing = find_submission(idempotency_key, content_hash)
+        if existing and existing["uid"] != uid:
+            upload_spool.release(audio_path, text_path)
+            return _replay_submission(existing, prompt_id, text, is_tribal, user_info)
+
     # --- S3 Upload Deferral ---
-    # Store details in session for batch upload later
-    pending_uploads = session.get("pending_uploads", [])
-    pending_uploads.append({
-        "uid": uid,
-        "audio_path": audio_path,
-        "text_path": text_path,
-        "prompt_id": prompt_id,
-        "prompt_text": text, # Store the text submitted for backup
-        "is_tribal": is_tribal,
-        "user_info": user_info
-    })
-    session["pending_uploads"] = pending_uploads
-    session.modified = True
-    
-    print(f"✅ Saved {uid} locally. Queued for S3 (Queue size: {len(pending_uploads)})")
-    
+    _queue_pending_upload(uid, audio_path, text_path, prompt_id, text, is_tribal, user_info)
     # -------------------------
 
     # Update prompt status: Only if it's a numeric ID (DB)
@@ -100,7 +298,127 @@ def submit():
     # Increment session completed count
     session['completed'] = session.get('completed', 0) + 1
 
-    return jsonify({"status": "saved"})
+    return jsonify({"status": "saved", "uid": uid})
+
+@main_bp.route("/api/chunked/init", methods=["POST"])
+def chunked_init():
+    """Starts a resumable chunked upload for one take."""
+    if not Config.CHUNKED_UPLOAD_ENABLED:
+        return jsonify({"error": "Chunked uploads are disabled"}), 404
+
+    user_info = session.get("user_info", {})
+    if not user_info:
+        return jsonify({"error": "User info missing"}), 400
+
+    data = request.get_json(silent=True) or {}
+    uid = "UOH_" + uuid.uuid4().hex[:8]
+    spool = ChunkSpool()
+    spool.maybe_expire()
+    upload_id = spool.init_upload({
+        "uid": uid,
+        "prompt_id": data.get("prompt_id"),
+        "is_tribal": _is_tribal_user(user_info)
+    })
+
+    # Only the session that started an upload may append to it
+    chunked_uploads = session.get("chunked_uploads", [])
+    chunked_uploads.append(upload_id)
+    session["chunked_uploads"] = chunked_uploads
+    session.modified = True
+
+    return jsonify({"upload_id": upload_id, "next_chunk": 0, "max_chunk_bytes": Config.CHUNK_MAX_BYTES})
+
+def _get_owned_upload(upload_id):
+    """Returns (spool, manifest) for an upload owned by this session, or (spool, None)."""
+    spool = ChunkSpool()
+    if upload_id not in session.get("chunked_uploads", []):
+        return spool, None
+    return spool, spool.get_manifest(upload_id)
+
+@main_bp.route("/api/chunked/<upload_id>", methods=["GET"])
+def chunked_status(upload_id):
+    """Returns the resume point: the first chunk the server has not acknowledged."""
+    spool, manifest = _get_owned_upload(upload_id)
+    if manifest is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    return jsonify({"upload_id": upload_id, "next_chunk": spool.next_chunk(upload_id)})
+
+@main_bp.route("/api/chunked/<upload_id>/<int:index>", methods=["PUT"])
+def chunked_append(upload_id, index):
+    """Stores chunk N (raw request body). Re-sending an acknowledged chunk is harmless."""
+    spool, manifest = _get_owned_upload(upload_id)
+    if manifest is None:
+        return jsonify({"error": "Unknown upload"}), 404
+
+    data = request.get_data()
+    try:
+        reservation = upload_spool.reserve(len(data), nfiles=1)
+    except SpoolFull as e:
+        return _spool_full(e)
+
+    try:
+        chunk_path = spool.write_chunk(upload_id, index, data)
+        upload_spool.track(chunk_path, reservation=reservation, category="chunks")
+    except ValueError as e:
+        upload_spool.cancel(reservation)
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        upload_spool.cancel(reservation)
+        return jsonify({"error": f"Chunk write failed: {str(e)}"}), 500
+
+    return jsonify({"received": index, "next_chunk": spool.next_chunk(upload_id)})
+
+@main_bp.route("/api/chunked/<upload_id>/complete", methods=["POST"])
+def chunked_complete(upload_id):
+    """Assembles the chunks into the staged WAV and queues it like /submit does."""
+    spool, manifest = _get_owned_upload(upload_id)
+    if manifest is None:
+        return jsonify({"error": "Unknown upload"}), 404
+
+    data = request.get_json(silent=True) or {}
+    text = data.get("text", "")
+    try:
+        total_chunks = int(data.get("total_chunks", 0))
+    except (ValueError, TypeError):
+        total_chunks = 0
+    if total_chunks <= 0:
+        return jsonify({"error": "total_chunks is required"}), 400
+    if total_chunks > Config.CHUNK_MAX_COUNT:
+        return jsonify({"error": f"total_chunks must be at most {Config.CHUNK_MAX_COUNT}"}), 400
+
+    uid = manifest["uid"]
+    is_tribal = manifest["is_tribal"]
+    user_info = session.get("user_info", {})
+    uploads_audio_dir, uploads_transcription_dir = _get_upload_dirs(is_tribal)
+
+    try:
+        # The chunks are already counted; they are released right after assembly
+        reservation = upload_spool.reserve(0, nfiles=2)
+    except SpoolFull as e:
+        return _spool_full(e)
+
+    try:
+        audio_path = f"{uploads_audio_dir}/{uid}.wav"
+        missing = spool.assemble(upload_id, audio_path, total_chunks)
+        if missing:
+            upload_spool.cancel(reservation)
+            return jsonify({"error": "Missing chunks", "missing": missing, "next_chunk": missing[0]}), 409
+
+        text_path = f"{uploads_transcription_dir}/{uid}.txt"
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        upload_spool.track(audio_path, text_path, reservation=reservation)
+    except Exception as e:
+        upload_spool.cancel(reservation)
+        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+
+    spool.discard(upload_id)
+    session["chunked_uploads"] = [u for u in session.get("chunked_uploads", []) if u != upload_id]
+
+    _queue_pending_upload(uid, audio_path, text_path, manifest["prompt_id"], text, is_tribal, user_info)
+    session['completed'] = session.get('completed', 0) + 1
+
+    return jsonify({"status": "saved", "uid": uid})
 
 @main_bp.route("/finalize_session", methods=["POST"])
 def finalize_session():
@@ -125,83 +443,23 @@ def finalize_session():
             audio_path = item["audio_path"]
             text_path = item["text_path"]
             
-            # prefixes
-            if is_tribal:
-                s3_audio_prefix = Config.S3_TRIBAL_AUDIO_PREFIX
-                s3_transcription_prefix = Config.S3_TRIBAL_TRANSCRIPTION_PREFIX
-            else:
-                s3_audio_prefix = Config.S3_AUDIO_PREFIX
-                s3_transcription_prefix = Config.S3_TRANSCRIPTION_PREFIX
+            s3_audio_prefix, s3_transcription_prefix = _get_s3_prefixes(is_tribal)
 
             # 1. Upload Audio
-            s3_audio_key = f"{s3_audio_prefix}{uid}.wav"
+            s3_audio_key = object_key(s3_audio_prefix, f"{uid}.wav")
             if not s3.upload_file(audio_path, s3_audio_key):
                 raise Exception(f"Failed to upload audio to {s3_audio_key}")
 
             # 2. Upload Transcription
-            s3_text_key = f"{s3_transcription_prefix}{uid}.txt"
+            s3_text_key = object_key(s3_transcription_prefix, f"{uid}.txt")
             if not s3.upload_file(text_path, s3_text_key):
                 raise Exception(f"Failed to upload transcription to {s3_text_key}")
 
-            # 3. Upload Original Prompt Text (Optional but recommended to check)
-            prompt_text_content = None
-            if "/" in str(prompt_id) or ".txt" in str(prompt_id):
-                 # S3 key
-                 prompt_text_content = s3.read_file(prompt_id)
-            
-            if prompt_text_content:
-                if is_tribal:
-                    s3_prompt_prefix = Config.S3_PROMPTS_TRIBAL_PREFIX
-                    s3_prompt_used = Config.S3_PROMPTS_TRIBAL_USED
-                else:
-                    s3_prompt_prefix = Config.S3_PROMPTS_STANDARD_PREFIX
-                    s3_prompt_used = Config.S3_PROMPTS_STANDARD_USED
-                    
-                s3_actual_prompt_key = f"{s3_prompt_prefix}{uid}_prompt.txt"
-                s3.upload_string(prompt_text_content, s3_actual_prompt_key)
-                
-                # Move original prompt from Available(root) to used
-                if "/" in str(prompt_id): 
-                    filename = os.path.basename(prompt_id)
-                    dest_key = s3_prompt_used + filename
-                    s3.move_file(prompt_id, dest_key)
-                    
-                    # Also move the English transliteration if it exists
-                    try:
-                        if is_tribal:
-                            en_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX
-                            en_used_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_USED
-                        else:
-                            en_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX
-                            en_used_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_USED
-                            
-                        en_source_key = f"{en_prefix}{filename}"
-                        en_dest_key = f"{en_used_prefix}{filename}"
-                        
-                        # Only move if it actually exists (legacy prompts might not have English)
-                        if s3.check_file_exists(en_source_key):
-                            s3.move_file(en_source_key, en_dest_key)
-                    except Exception as e:
-                        print(f"Warning: Failed to move English transliteration for {filename}: {e}")
-
-            # 4. Upload Metadata
-            if user_info:
-                metadata_json = json.dumps(user_info, ensure_ascii=False)
-                
-                # Save to Dedicated Metadata folder (for Admin Dashboard)
-                s3_dedicated_meta_key = f"{Config.S3_METADATA_PREFIX}{uid}_metadata.json"
-                if not s3.upload_string(metadata_json, s3_dedicated_meta_key):
-                    print(f"⚠️ Warning: Failed to upload metadata for {uid} to {s3_dedicated_meta_key}, but proceeding as audio/text are saved.")
-                
-            # 5. Save to Local Database for persistence and Admin Dashboard
-            add_recording_metadata(
-                uid=uid,
-                user_info=user_info,
-                audio_path=f"audio/{'tribal' if is_tribal else 'standard'}/{uid}.wav",
-                prompt_text=item.get("prompt_text", ""),
-                is_tribal=is_tribal
-            )
+            # 3-5. Metadata, local database and prompt retirement
+            _complete_recording(s3, uid, user_info, prompt_id, item.get("prompt_text", ""), is_tribal)
 
+            # The staged copies are in S3 now; failed items expire from the spool instead
+            upload_spool.release(audio_path, text_path)
             success_count += 1
             
         except Exception as e:
@@ -216,6 +474,99 @@ def finalize_session():
     
     return jsonify({"status": "success", "uploaded": success_count})
 
+@main_bp.route("/api/upload_url", methods=["POST"])
+def api_upload_url():
+    """
+    Issues presigned PUT URLs so the browser can upload the audio and
+    transcript straight to S3. The app server only sees small JSON requests.
+    """
+    if not Config.DIRECT_UPLOAD_ENABLED:
+        return jsonify({"error": "Direct uploads are disabled"}), 404
+
+    data = request.get_json(silent=True) or {}
+    prompt_id = data.get("prompt_id")
+
+    user_info = session.get("user_info", {})
+    if not user_info:
+        return jsonify({"error": "User info missing"}), 400
+    is_tribal = _is_tribal_user(user_info)
+
+    uid = "UOH_" + uuid.uuid4().hex[:8]
+    s3_audio_prefix, s3_transcription_prefix = _get_s3_prefixes(is_tribal)
+    s3_audio_key = object_key(s3_audio_prefix, f"{uid}.wav")
+    s3_text_key = object_key(s3_transcription_prefix, f"{uid}.txt")
+
+    s3 = S3Manager()
+    audio_url = s3.generate_presigned_put_url(s3_audio_key, "audio/wav")
+    text_url = s3.generate_presigned_put_url(s3_text_key, "text/plain; charset=utf-8")
+    if not audio_url or not text_url:
+        return jsonify({"error": "Could not create upload URLs"}), 500
+
+    # Remember the issued uid so only this session can complete it
+    direct_uploads = session.get("direct_uploads", {})
+    direct_uploads[uid] = {
+        "prompt_id": prompt_id,
+        "is_tribal": is_tribal,
+        "issued": time.time()
+    }
+    direct_uploads = _prune_direct_uploads(direct_uploads)
+    session["direct_uploads"] = direct_uploads
+    session.modified = True
+
+    return jsonify({
+        "uid": uid,
+        "expires_in": Config.PRESIGNED_URL_EXPIRY,
+        "max_bytes": Config.DIRECT_UPLOAD_MAX_BYTES,
+        "audio": {"url": audio_url, "key": s3_audio_key, "content_type": "audio/wav"},
+        "transcription": {"url": text_url, "key": s3_text_key, "content_type": "text/plain; charset=utf-8"}
+    })
+
+@main_bp.route("/api/upload_complete", methods=["POST"])
+def api_upload_complete():
+    """Completion callback for a direct upload: records metadata and retires the prompt."""
+    if not Config.DIRECT_UPLOAD_ENABLED:
+        return jsonify({"error": "Direct uploads are disabled"}), 404
+
+    data = request.get_json(silent=True) or {}
+    uid = data.get("uid")
+    text = data.get("text", "")
+
+    direct_uploads = session.get("direct_uploads", {})
+    item = direct_uploads.get(uid)
+    if item is None:
+        return jsonify({"error": "Unknown upload"}), 404
+
+    user_info = session.get("user_info", {})
+    is_tribal = item["is_tribal"]
+    s3_audio_prefix, s3_transcription_prefix = _get_s3_prefixes(is_tribal)
+    s3_audio_key = object_key(s3_audio_prefix, f"{uid}.wav")
+    s3_text_key = object_key(s3_transcription_prefix, f"{uid}.txt")
+
+    s3 = S3Manager()
+    audio_size = s3.object_size(s3_audio_key)
+    if not audio_size:
+        return jsonify({"error": "Audio not found in storage"}), 409
+    text_size = s3.object_size(s3_text_key)
+    if text_size is None:
+        return jsonify({"error": "Transcript not found in storage"}), 409
+    if audio_size > Config.DIRECT_UPLOAD_MAX_BYTES or text_size > Config.DIRECT_UPLOAD_MAX_TEXT_BYTES:
+        # The URLs cannot enforce a size, so oversized uploads are removed here
+        s3.delete_file(s3_audio_key)
+        s3.delete_file(s3_text_key)
+        direct_uploads.pop(uid, None)
+        session["direct_uploads"] = direct_uploads
+        return jsonify({"error": "Upload too large"}), 413
+
+    _complete_recording(s3, uid, user_info, item["prompt_id"], text, is_tribal)
+
+    direct_uploads.pop(uid, None)
+    session["direct_uploads"] = direct_uploads
+    session['completed'] = session.get('completed', 0) + 1
+    session.modified = True
+
+    print(f"✅ Direct upload {uid} completed")
+    return jsonify({"status": "saved", "uid": uid})
+
 @main_bp.route("/api/prompt", methods=["GET"])
 def api_get_prompt():
     completed = session.get('completed', 0)
@@ -231,61 +582,45 @@ def api_get_prompt():
     if is_tribal:
         prefix = Config.S3_PROMPTS_TRIBAL_PREFIX
         en_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX
+        used_prefix = Config.S3_PROMPTS_TRIBAL_USED
+        en_used_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_USED
     else:
         prefix = Config.S3_PROMPTS_STANDARD_PREFIX
         en_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX
+        used_prefix = Config.S3_PROMPTS_STANDARD_USED
+        en_used_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_USED
+
+    # Find a prompt where both Telugu and English are NOT used.
+    # Candidates are checked concurrently; see S3Manager.find_clean_prompt_pair.
+    recorded = [item["prompt_id"] for item in session.get("pending_uploads", [])]
+    status, s3_key, text, english_text = s3.find_clean_prompt_pair(
+        prefix, en_prefix, used_prefix, en_used_prefix,
+        user_info=user_info, exclude=set(recorded)
+    )
+
+    if status == "empty":
+        # No prompts available in S3
+        from utils.email_utils import send_admin_alert
         
-    # Try to find a prompt where both Telugu and English are NOT used
-    for _ in range(10): # Try 10 times to find a clean pair
-        s3_key, text = s3.get_random_file_from_prefix(prefix)
-        
-        if s3_key is None or text is None:
-            # No prompts available in S3
-            from utils.email_utils import send_admin_alert
-            
-            prompt_type = "Tribal" if is_tribal else "Standard"
-            subject = f"Urgent: No {prompt_type} Prompts Available"
-            body = f"The user is trying to access {prompt_type} prompts, but the S3 folder '{prefix}' appears to be empty or contains no text files.\n\nPlease upload more prompts via the Admin Dashboard immediately."
-            
-            send_admin_alert(subject, body)
-            
-            # Return generic done, but with error flag so frontend can show "Sorry" message
-            return jsonify({"done": True, "completed": completed, "error": "no_prompts"})
-            
-        # We have a Telugu prompt that is NOT in te_used. 
-        # NOW: Check if the English counterpart is in en_used.
-        filename = os.path.basename(s3_key)
+        prompt_type = "Tribal" if is_tribal else "Standard"
+        subject = f"Urgent: No {prompt_type} Prompts Available"
+        body = f"The user is trying to access {prompt_type} prompts, but the S3 folder '{prefix}' appears to be empty or contains no text files.\n\nPlease upload more prompts via the Admin Dashboard immediately."
         
-        if is_tribal:
-            en_used_prefix = Config.S3_PROMPTS_TRIBAL_ENGLISH_USED
-        else:
-            en_used_prefix = Config.S3_PROMPTS_STANDARD_ENGLISH_USED
-            
-        en_used_key = f"{en_used_prefix}{filename}"
+        send_admin_alert(subject, body)
         
-        if s3.check_file_exists(en_used_key):
-            print(f"⚠️ English version of {filename} is already in used folder. Skipping pair...")
-            continue # Try another one
-            
-        # If we reach here, it's truly unused on both sides
-        # Fetch English text from main prefix
-        english_text = ""
-        try:
-            en_key = f"{en_prefix}{filename}"
-            english_text = s3.read_file(en_key) or ""
-        except Exception as e:
-            print(f"Warning: Failed to fetch English transliteration for {s3_key}: {e}")
-
-        # Return S3 key as ID
-        return jsonify({
-            "id": s3_key, 
-            "text": text.strip(), 
-            "english_text": english_text.strip(),
-            "completed": completed
-        })
-
-    # If we exhausted 10 tries, just return the last one found or done
-    return jsonify({"done": True, "completed": completed, "error": "finding_pair"})
+        # Return generic done, but with error flag so frontend can show "Sorry" message
+        return jsonify({"done": True, "completed": completed, "error": "no_prompts"})
+
+    if status != "ok":
+        return jsonify({"done": True, "completed": completed, "error": "finding_pair"})
+
+    # Return S3 key as ID
+    return jsonify({
+        "id": s3_key, 
+        "text": text.strip(), 
+        "english_text": english_text.strip(),
+        "completed": completed
+    })
 
 
 @main_bp.route("/new_session", methods=["POST"])
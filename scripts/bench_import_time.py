@@ -0,0 +1,95 @@
+"""
+Cold-start benchmark for the serverless entry point.
+
+Runs `python -X importtime -c "import app"` in fresh interpreters and
+reports the median total import time plus the slowest modules. Exits
+non-zero if the median exceeds --max-ms or if any module listed in
+--forbid (heavy dependencies that must stay deferred) is imported at
+startup, so it can guard against cold-start regressions in CI.
+
+Usage:
+    python scripts/bench_import_time.py
+    python scripts/bench_import_time.py --runs 7 --max-ms 400 --json bench.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FORBID = "boto3,botocore,pandas,openpyxl"
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def run_once():
+    """Returns {module: (self_us, cumulative_us, depth)} for one fresh import of app."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("❌ Importing app failed")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if median import time exceeds this")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="Comma-separated modules that must not load at import")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this file")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    totals_ms = [r["app"][1] / 1000 for r in runs if "app" in r]
+    median_ms = statistics.median(totals_ms)
+
+    last = runs[-1]
+    slowest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    forbidden = [m for m in args.forbid.split(",") if m and m in last]
+
+    print(f"⏱️  import app: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f})")
+    print(f"\nSlowest modules (self time, last run):")
+    for name, (self_us, cumulative_us, _) in slowest:
+        print(f"  {self_us / 1000:8.1f} ms  (cumulative {cumulative_us / 1000:8.1f} ms)  {name}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "runs": args.runs,
+                "median_ms": round(median_ms, 2),
+                "totals_ms": [round(t, 2) for t in totals_ms],
+                "slowest": {name: round(self_us / 1000, 2) for name, (self_us, _, _) in slowest},
+                "forbidden_imported": forbidden,
+            }, f, indent=2)
+
+    failed = False
+    if forbidden:
+        print(f"\n❌ Heavy modules imported at startup: {', '.join(forbidden)}")
+        failed = True
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"\n❌ Median import time {median_ms:.1f} ms exceeds budget of {args.max_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("\n✅ Cold-start import within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
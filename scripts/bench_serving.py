@@ -0,0 +1,268 @@
+"""
+Compares gunicorn worker configurations on the app's hot routes.
+
+For each configuration (worker_class:workers:threads, or
+gevent:workers:connections for SERVING_MODE=async) the script starts
+gunicorn with gunicorn.conf.py, waits for it to come up, then runs
+--clients concurrent volunteers for --duration seconds. Each volunteer
+has its own cookie session and loops: load the page, fetch a prompt,
+submit a recording. Reports throughput, latency percentiles per route,
+errors and the total RSS of the server processes.
+
+Storage is an in-memory S3 stand-in (moto, `pip install "moto[server]"`)
+that adds --storage-latency-ms to every call and is seeded with --prompts
+prompt pairs per pool. Each configuration gets its own temporary
+directory and databases, and SMTP is disabled so no alert email goes out.
+
+Usage:
+    python scripts/bench_serving.py
+    python scripts/bench_serving.py --configs sync:4:1,gthread:2:16,gthread:4:8 --clients 64
+    python scripts/bench_serving.py --configs gthread:2:16,gevent:1:1000 --clients 200
+    python scripts/bench_serving.py --json bench_serving.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BUCKET = "uoh-bench"
+DEFAULT_CONFIGS = "sync:4:1,gthread:1:32,gthread:2:16,gthread:4:8"
+WAV = b"RIFF" + b"\0" * 2044
+
+
+class SlowStorage:
+    """The moto S3 server behind a fixed per-call delay, standing in for a remote bucket."""
+
+    def __init__(self, port, latency_ms):
+        try:
+            from moto.server import DomainDispatcherApplication, create_backend_app
+        except ImportError:
+            raise SystemExit('❌ The storage stand-in needs moto: pip install "moto[server]"')
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.app = DomainDispatcherApplication(create_backend_app)
+        self.latency = latency_ms / 1000.0
+        self.server = make_server("127.0.0.1", port, self._wsgi, threaded=True)
+        self.url = f"http://127.0.0.1:{port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _wsgi(self, environ, start_response):
+        time.sleep(self.latency)
+        return self.app(environ, start_response)
+
+    def env(self):
+        return {
+            "S3_ENDPOINT_URL": self.url, "S3_BUCKET_NAME": BUCKET, "S3_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench",
+        }
+
+    def seed(self, count):
+        """Creates the bucket with `count` Telugu/English prompt pairs per pool."""
+        import boto3
+        from concurrent.futures import ThreadPoolExecutor
+        from config import Config
+        from utils.key_layout import object_key
+
+        s3 = boto3.client("s3", endpoint_url=self.url, region_name="us-east-1",
+                          aws_access_key_id="bench", aws_secret_access_key="bench")
+        s3.create_bucket(Bucket=BUCKET)
+        objects = []
+        for prefix, en_prefix in (
+            (Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX),
+            (Config.S3_PROMPTS_TRIBAL_PREFIX, Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX),
+        ):
+            for i in range(count):
+                name = f"UOH_BENCH_{i:05d}.txt"
+                objects.append((object_key(prefix, name), f"ఇది పరీక్ష వాక్యం {i}"))
+                objects.append((object_key(en_prefix, name), f"Benchmark sentence {i}"))
+        with ThreadPoolExecutor(16) as pool:
+            list(pool.map(lambda kv: s3.put_object(Bucket=BUCKET, Key=kv[0], Body=kv[1].encode("utf-8")),
+                          objects))
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def server_rss_mb(pid):
+    """RSS of the master and its workers (Linux /proc), or None elsewhere."""
+    try:
+        pids = [pid]
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+        total = 0
+        for p in pids:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        return round(total / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def volunteer(base, stop_at, samples, errors, lock):
+    s = requests.Session()
+    s.post(f"{base}/submit_user_info", data={"age": 25, "gender": "female", "location": "bench", "state": "Telangana"})
+    while time.time() < stop_at:
+        for route, call in (
+            ("index", lambda: s.get(f"{base}/")),
+            ("api_prompt", lambda: s.get(f"{base}/api/prompt")),
+        ):
+            t = time.perf_counter()
+            try:
+                r = call()
+                ok = r.status_code < 500
+                prompt = r.json() if route == "api_prompt" and ok else None
+            except (requests.RequestException, ValueError):
+                ok, prompt = False, None
+            with lock:
+                samples.setdefault(route, []).append(time.perf_counter() - t)
+                if not ok:
+                    errors[route] = errors.get(route, 0) + 1
+
+        if prompt and prompt.get("id"):
+            t = time.perf_counter()
+            try:
+                r = s.post(f"{base}/submit",
+                           data={"text": prompt.get("text", ""), "prompt_id": prompt["id"]},
+                           files={"audio": ("take.wav", WAV, "audio/wav")})
+                ok = r.status_code < 500
+            except requests.RequestException:
+                ok = False
+            with lock:
+                samples.setdefault("submit", []).append(time.perf_counter() - t)
+                if not ok:
+                    errors["submit"] = errors.get("submit", 0) + 1
+        # Start a fresh session once this one is complete, like a new volunteer
+        if prompt and prompt.get("done"):
+            s.post(f"{base}/new_session")
+
+
+def run_config(spec, storage, args):
+    worker_class, workers, threads = spec.split(":")
+    # Keep the databases, spool and shared state of each run out of the
+    # project and out of the real /tmp/uoh_speech_uploads; empty MAIL_*
+    # values win over .env, so alerts are only printed
+    tmp_dir = tempfile.mkdtemp(prefix="uoh-bench-")
+    env = dict(os.environ, **storage.env(),
+               TMPDIR=tmp_dir, DB_PATH=os.path.join(tmp_dir, "prompts.db"),
+               TRIBAL_DB_PATH=os.path.join(tmp_dir, "telugu_tribe.db"),
+               MAIL_USERNAME="", MAIL_PASSWORD="",
+               GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=workers,
+               GUNICORN_THREADS=threads, PORT=str(args.port), GUNICORN_ACCESS_LOG="")
+    if worker_class == "gevent":
+        env.update(SERVING_MODE="async", GUNICORN_WORKER_CONNECTIONS=threads)
+    proc = subprocess.Popen(["gunicorn", "-c", args.config, "app:app"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        started = time.time()
+        while True:
+            try:
+                if requests.get(f"{base}/", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() - started > 120 or proc.poll() is not None:
+                raise RuntimeError(f"gunicorn ({spec}) did not come up")
+            time.sleep(0.2)
+        startup = time.time() - started
+
+        samples, errors, lock = {}, {}, threading.Lock()
+        stop_at = time.time() + args.duration
+        clients = [threading.Thread(target=volunteer, args=(base, stop_at, samples, errors, lock))
+                   for _ in range(args.clients)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+
+        total = sum(len(v) for v in samples.values())
+        result = {
+            "config": spec,
+            "startup_s": round(startup, 2),
+            "requests": total,
+            "rps": round(total / args.duration, 1),
+            "errors": sum(errors.values()),
+            "rss_mb": server_rss_mb(proc.pid),
+            "routes": {
+                route: {
+                    "count": len(values),
+                    "p50_ms": round(percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 99) * 1000, 1),
+                }
+                for route, values in sorted(samples.items())
+            },
+        }
+        return result
+    finally:
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=30)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="Comma-separated worker_class:workers:threads")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=int, default=20, help="Seconds of load per configuration")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--storage-port", type=int, default=8768)
+    parser.add_argument("--storage-latency-ms", type=float, default=50.0, help="Delay added to every S3 call")
+    parser.add_argument("--prompts", type=int, default=5000, help="Prompt pairs seeded per pool")
+    parser.add_argument("--config", default=os.path.join(ROOT, "gunicorn.conf.py"), help="gunicorn config file")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this file")
+    args = parser.parse_args()
+
+    storage = SlowStorage(args.storage_port, args.storage_latency_ms)
+    results = []
+    try:
+        print(f"🌱 Seeding {args.prompts} prompt pairs per pool ...", flush=True)
+        storage.seed(args.prompts)
+        for spec in args.configs.split(","):
+            print(f"▶ {spec} ...", flush=True)
+            results.append(run_config(spec.strip(), storage, args))
+    finally:
+        storage.stop()
+
+    print(f"\n{'config':<16}{'req/s':>8}{'errors':>8}{'RSS MB':>8}{'start s':>9}  route p50/p95/p99 ms")
+    for r in results:
+        routes = "  ".join(f"{name} {v['p50_ms']:.0f}/{v['p95_ms']:.0f}/{v['p99_ms']:.0f}"
+                           for name, v in r["routes"].items())
+        print(f"{r['config']:<16}{r['rps']:>8}{r['errors']:>8}{str(r['rss_mb']):>8}{r['startup_s']:>9}  {routes}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"clients": args.clients, "duration_s": args.duration, "prompts": args.prompts,
+                       "storage_latency_ms": args.storage_latency_ms, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Builds the fingerprinted static assets served with long-lived caching.
+
+For every file in static/ (except static/dist/) this writes
+static/dist/<name>.<content-hash>.<ext>, plus:
+  - .gz and .br precompressed copies of text assets (CSS, JS, SVG);
+    brotli needs `pip install Brotli`
+  - a .webp variant of PNG/JPEG images when it is smaller;
+    needs `pip install Pillow`
+and finally static/dist/manifest.json, which the app reads at startup to
+rewrite url_for('static', ...) references to the fingerprinted files.
+Missing optional packages only skip those variants.
+
+Usage:
+    python scripts/build_assets.py
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+
+ASSET_EXTENSIONS = {".css", ".js", ".png", ".jpg", ".jpeg", ".svg", ".ico", ".webp"}
+COMPRESSIBLE = {".css", ".js", ".svg"}
+WEBP_SOURCES = {".png", ".jpg", ".jpeg"}
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def load_brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        print("⚠️ Brotli not installed (pip install Brotli): skipping .br variants")
+        return None
+
+
+def load_pillow():
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        print("⚠️ Pillow not installed (pip install Pillow): skipping WebP variants")
+        return None
+
+
+def to_webp(Image, data):
+    with Image.open(io.BytesIO(data)) as img:
+        out = io.BytesIO()
+        img.save(out, "WEBP", quality=85, method=6)
+        return out.getvalue()
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build():
+    brotli = load_brotli()
+    Image = load_pillow()
+
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    assets = {}
+    original_bytes = compressed_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for name in sorted(filenames):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in ASSET_EXTENSIONS:
+                continue
+            source = os.path.join(dirpath, name)
+            logical = os.path.relpath(source, STATIC_DIR).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+
+            folder = os.path.dirname(logical)
+            hashed = f"{stem}.{fingerprint(data)}{ext}"
+            dist_path = "/".join(p for p in ("dist", folder, hashed) if p)
+            write(os.path.join(STATIC_DIR, dist_path), data)
+            entry = {"path": dist_path, "bytes": len(data), "encodings": []}
+            original_bytes += len(data)
+            best = len(data)
+
+            if ext.lower() in COMPRESSIBLE:
+                gz = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(gz) < len(data):
+                    write(os.path.join(STATIC_DIR, dist_path + ".gz"), gz)
+                    entry["encodings"].append("gzip")
+                    best = min(best, len(gz))
+                if brotli is not None:
+                    br = brotli.compress(data, quality=11)
+                    if len(br) < len(data):
+                        write(os.path.join(STATIC_DIR, dist_path + ".br"), br)
+                        entry["encodings"].append("br")
+                        best = min(best, len(br))
+
+            if Image is not None and ext.lower() in WEBP_SOURCES:
+                try:
+                    webp = to_webp(Image, data)
+                except Exception as e:
+                    print(f"⚠️ Could not convert {logical} to WebP: {e}")
+                    webp = None
+                if webp and len(webp) < len(data):
+                    webp_path = "/".join(p for p in ("dist", folder, f"{stem}.{fingerprint(webp)}.webp") if p)
+                    write(os.path.join(STATIC_DIR, webp_path), webp)
+                    entry["webp"] = webp_path
+                    best = min(best, len(webp))
+
+            compressed_bytes += best
+            assets[logical] = entry
+            variants = ", ".join(entry["encodings"] + (["webp"] if "webp" in entry else [])) or "as is"
+            print(f"  {logical:<32} -> {dist_path} ({variants})")
+
+    write(os.path.join(DIST_DIR, "manifest.json"),
+          json.dumps({"version": 1, "assets": assets}, indent=2, sort_keys=True).encode("utf-8"))
+    print(f"✅ Built {len(assets)} assets: {original_bytes / 1024:.1f} KB -> "
+          f"{compressed_bytes / 1024:.1f} KB over the wire (best variant)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(build())
@@ -0,0 +1,44 @@
+"""
+Backfills the prompt hash index (prompt_hashes table) from the prompts
+already in S3, including the used/ folders, so uploads made before the
+index existed are also detected as duplicates.
+
+Usage:
+    python scripts/build_prompt_index.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import create_prompt_hashes_table, claim_prompt_hash
+from utils.prompt_dedup import prompt_hash
+from utils.s3_utils import S3Manager
+
+
+def index_prefix(s3, prefix, db_type):
+    added = duplicates = 0
+    for key in s3.list_all_keys(prefix):
+        # Only prompt files: skip English transliterations and per-recording prompt copies
+        if not key.endswith(".txt") or key.endswith("_prompt.txt"):
+            continue
+        text = s3.read_file(key)
+        if not text:
+            continue
+        if claim_prompt_hash(prompt_hash(text), key, db_type) is None:
+            added += 1
+        else:
+            duplicates += 1
+    print(f"✅ {prefix}: indexed {added} prompts ({duplicates} duplicates already indexed)")
+
+
+if __name__ == "__main__":
+    if not Config.S3_BUCKET_NAME:
+        print("❌ Error: S3_BUCKET_NAME not configured")
+        sys.exit(1)
+
+    create_prompt_hashes_table()
+    s3 = S3Manager()
+    index_prefix(s3, Config.S3_PROMPTS_STANDARD_PREFIX, "standard")
+    index_prefix(s3, Config.S3_PROMPTS_TRIBAL_PREFIX, "tribal")
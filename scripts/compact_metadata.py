@@ -0,0 +1,23 @@
+"""
+Merges the per-recording metadata/<uid>_metadata.json files into
+append-only segments listed in metadata-segments/manifest.json.
+Safe to run repeatedly (e.g. from cron); only new files are compacted.
+
+Usage:
+    python scripts/compact_metadata.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.s3_utils import S3Manager
+from utils.metadata_segments import compact_metadata
+
+
+if __name__ == "__main__":
+    if not Config.S3_BUCKET_NAME:
+        print("❌ Error: S3_BUCKET_NAME not configured")
+        sys.exit(1)
+    compact_metadata(S3Manager())
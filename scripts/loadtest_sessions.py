@@ -0,0 +1,486 @@
+"""
+Load test of complete volunteer sessions, for capacity planning before a
+collection drive and for comparing releases.
+
+Each virtual user runs whole sessions the way the browser does: submit
+the user details, then 5 rounds of /api/prompt + /submit with a real
+16 kHz mono WAV, then /finalize_session (retrying 429/503 after their
+Retry-After, like the frontend). --users virtual users run concurrently,
+--sessions each.
+
+Storage is a local S3 stand-in (moto, `pip install "moto[server]"`)
+seeded with --prompts prompt pairs per pool, behind a proxy that counts
+every S3 call. The app runs under gunicorn with gunicorn.conf.py, with
+its own temporary directory and databases and with SMTP disabled (or
+pass --url to target a server that is already using the stand-in at
+--storage-port). Reported:
+
+- sessions/s and requests/s
+- p50/p95/p99 latency, errors and retries per route
+- S3 calls per completed session, by operation
+- duplicate-prompt rate: submits of a prompt that was already recorded
+
+Results are written as JSON (--out); --compare checks them against an
+earlier baseline and exits 1 if anything regressed by more than
+--tolerance.
+
+Usage:
+    python scripts/loadtest_sessions.py --users 32 --sessions 3 --out baseline.json
+    python scripts/loadtest_sessions.py --server gevent:1:1000 --users 200 --compare baseline.json
+    python scripts/loadtest_sessions.py --compare baseline.json --against current.json
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from array import array
+from collections import Counter
+from urllib.parse import parse_qs
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BUCKET = "uoh-loadtest"
+ROUNDS = 5
+TRIBAL_STATES = ("TS-Tribal", "AP-Tribal")
+# Metrics where a higher value is a regression; everything else in the comparison is throughput
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "error_rate", "per_session", "duplicate_prompt_rate")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# --- Storage stand-in ---
+
+def s3_operation(environ):
+    """Names the S3 operation of a path-style request (enough for the calls the app makes)."""
+    method = environ["REQUEST_METHOD"]
+    query = parse_qs(environ.get("QUERY_STRING", ""), keep_blank_values=True)
+    has_key = "/" in environ.get("PATH_INFO", "").strip("/")
+    if method == "GET":
+        if not has_key:
+            return "ListObjectsV2" if "list-type" in query else "ListObjects"
+        return "GetObject"
+    if method == "HEAD":
+        return "HeadObject" if has_key else "HeadBucket"
+    if method == "PUT":
+        if not has_key:
+            return "CreateBucket"
+        if "partNumber" in query:
+            return "UploadPart"
+        return "CopyObject" if "HTTP_X_AMZ_COPY_SOURCE" in environ else "PutObject"
+    if method == "DELETE":
+        return "DeleteObject" if has_key else "DeleteBucket"
+    if method == "POST":
+        if "delete" in query:
+            return "DeleteObjects"
+        if "uploads" in query:
+            return "CreateMultipartUpload"
+        return "CompleteMultipartUpload" if "uploadId" in query else "PostObject"
+    return method
+
+
+class CountingStorage:
+    """The moto S3 server in a WSGI wrapper that counts calls per operation."""
+
+    def __init__(self, port):
+        try:
+            from moto.server import DomainDispatcherApplication, create_backend_app
+        except ImportError:
+            raise SystemExit('❌ The storage stand-in needs moto: pip install "moto[server]"')
+        from werkzeug.serving import make_server
+
+        # One access log line per S3 call would drown the report
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.app = DomainDispatcherApplication(create_backend_app)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.server = make_server("127.0.0.1", port, self._wsgi, threaded=True)
+        self.url = f"http://127.0.0.1:{port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _wsgi(self, environ, start_response):
+        op = s3_operation(environ)
+        with self._lock:
+            self.calls[op] += 1
+        return self.app(environ, start_response)
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls)
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def storage_env(url):
+    return {
+        "S3_ENDPOINT_URL": url, "S3_BUCKET_NAME": BUCKET, "S3_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "loadtest", "AWS_SECRET_ACCESS_KEY": "loadtest",
+    }
+
+
+def seed_prompts(url, count):
+    """Creates the bucket with `count` Telugu/English prompt pairs per pool, in the configured key layout."""
+    os.environ.update(storage_env(url))
+    import boto3
+    from concurrent.futures import ThreadPoolExecutor
+    from config import Config
+    from utils.key_layout import object_key
+
+    s3 = boto3.client("s3", endpoint_url=url, region_name="us-east-1")
+    s3.create_bucket(Bucket=BUCKET)
+    pools = (
+        (Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX, "UOH"),
+        (Config.S3_PROMPTS_TRIBAL_PREFIX, Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX, "UOH_TRIBAL"),
+    )
+    objects = []
+    for prefix, en_prefix, tag in pools:
+        for i in range(count):
+            name = f"{tag}_{i:05d}.txt"
+            objects.append((object_key(prefix, name), f"ఇది పరీక్ష వాక్యం సంఖ్య {i}"))
+            objects.append((object_key(en_prefix, name), f"This is test sentence number {i}"))
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(lambda kv: s3.put_object(Bucket=BUCKET, Key=kv[0], Body=kv[1].encode("utf-8")), objects))
+    return len(objects)
+
+
+# --- Virtual users ---
+
+def make_wav(seconds, rate=16000):
+    """A 16-bit mono WAV of a noisy tone, about the size of a real take."""
+    rng = random.Random(seconds)
+    samples = array("h", (int(3000 * math.sin(2 * math.pi * 220 * i / rate)) + rng.randint(-800, 800)
+                          for i in range(int(seconds * rate))))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = Counter()
+        self.retries = Counter()
+        self.prompt_submits = Counter()
+        self.sessions = 0
+        self.failed_sessions = 0
+        self.session_times = []
+
+    def record(self, route, seconds, ok, retries):
+        with self.lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] += 1
+            self.retries[route] += retries
+
+
+def call(results, route, fn, max_attempts=5, max_wait=5.0):
+    """Runs one request, retrying 429/503 after Retry-After (capped), and records its total latency."""
+    started = time.perf_counter()
+    retries = 0
+    r = None
+    for attempt in range(max_attempts):
+        try:
+            r = fn()
+        except requests.RequestException:
+            r = None
+        if r is not None and r.status_code in (429, 503) and attempt < max_attempts - 1:
+            retries += 1
+            try:
+                wait = float(r.headers.get("Retry-After", 1))
+            except ValueError:
+                wait = 1.0
+            time.sleep(min(wait, max_wait) * random.uniform(0.8, 1.2))
+            continue
+        break
+    ok = r is not None and r.status_code < 400
+    results.record(route, time.perf_counter() - started, ok, retries)
+    return r if ok else None
+
+
+def run_session(base, wav, results, args, rng):
+    """One volunteer from the details form to the final upload. Returns True if every take was uploaded."""
+    s = requests.Session()
+    state = rng.choice(TRIBAL_STATES) if rng.random() < args.tribal_share else "Telangana"
+    started = time.perf_counter()
+    if not call(results, "submit_user_info", lambda: s.post(
+            f"{base}/submit_user_info",
+            data={"age": rng.randint(18, 70), "gender": rng.choice(("female", "male")),
+                  "location": "loadtest", "state": state})):
+        return False
+
+    submitted = []
+    for _ in range(ROUNDS):
+        r = call(results, "api_prompt", lambda: s.get(f"{base}/api/prompt"))
+        prompt = r.json() if r is not None else None
+        if not prompt or prompt.get("done") or not prompt.get("id"):
+            break
+        time.sleep(args.think)
+        # A unique tail per take, so the upload dedup never mistakes two takes for a retry
+        take = wav[:-16] + os.urandom(16)
+        r = call(results, "submit", lambda: s.post(
+            f"{base}/submit",
+            data={"text": prompt.get("text", ""), "prompt_id": prompt["id"]},
+            files={"audio": ("take.wav", take, "audio/wav")},
+            headers={"Idempotency-Key": uuid.uuid4().hex}))
+        if r is not None:
+            submitted.append(prompt["id"])
+
+    r = call(results, "finalize_session", lambda: s.post(f"{base}/finalize_session"))
+    uploaded = r.json().get("uploaded", 0) if r is not None else 0
+    complete = len(submitted) == ROUNDS and uploaded == ROUNDS
+    with results.lock:
+        results.prompt_submits.update(submitted)
+        results.session_times.append(time.perf_counter() - started)
+        if complete:
+            results.sessions += 1
+        else:
+            results.failed_sessions += 1
+    return complete
+
+
+def virtual_user(base, wav, results, args, seed):
+    rng = random.Random(seed)
+    for _ in range(args.sessions):
+        run_session(base, wav, results, args, rng)
+
+
+# --- Server ---
+
+def start_server(spec, storage_url, tmp_dir, args):
+    worker_class, workers, threads = spec.split(":")
+    # Databases, spool and shared state live in tmp_dir, not in the project
+    # or the real /tmp/uoh_speech_uploads; empty MAIL_* values win over
+    # .env, so alerts are only printed
+    env = dict(os.environ, **storage_env(storage_url),
+               TMPDIR=tmp_dir, DB_PATH=os.path.join(tmp_dir, "prompts.db"),
+               TRIBAL_DB_PATH=os.path.join(tmp_dir, "telugu_tribe.db"),
+               MAIL_USERNAME="", MAIL_PASSWORD="",
+               GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=workers,
+               GUNICORN_THREADS=threads, PORT=str(args.port), GUNICORN_ACCESS_LOG="")
+    if worker_class == "gevent":
+        env.update(SERVING_MODE="async", GUNICORN_WORKER_CONNECTIONS=threads)
+    proc = subprocess.Popen(["gunicorn", "-c", args.config, "app:app"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    base = f"http://127.0.0.1:{args.port}"
+    started = time.time()
+    while True:
+        try:
+            if requests.get(f"{base}/", timeout=1).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        if time.time() - started > 120 or proc.poll() is not None:
+            stop_server(proc)
+            raise RuntimeError(f"gunicorn ({spec}) did not come up")
+        time.sleep(0.2)
+
+
+def stop_server(proc):
+    if proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+# --- Report ---
+
+def summarize(results, calls, duration):
+    requests_total = sum(len(v) for v in results.samples.values())
+    submits = sum(results.prompt_submits.values())
+    sessions = results.sessions
+    return {
+        "duration_s": round(duration, 2),
+        "sessions": sessions,
+        "failed_sessions": results.failed_sessions,
+        "sessions_per_s": round(sessions / duration, 2) if duration else 0.0,
+        "requests": requests_total,
+        "requests_per_s": round(requests_total / duration, 1) if duration else 0.0,
+        "session_p50_s": round(percentile(results.session_times, 50), 2),
+        "session_p95_s": round(percentile(results.session_times, 95), 2),
+        "routes": {
+            route: {
+                "count": len(values),
+                "errors": results.errors[route],
+                "retries": results.retries[route],
+                "error_rate": round(results.errors[route] / len(values), 4),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+            for route, values in sorted(results.samples.items())
+        },
+        "storage": None if calls is None else {
+            "calls": sum(calls.values()),
+            "per_session": round(sum(calls.values()) / sessions, 1) if sessions else None,
+            "by_operation": {op: {"calls": n, "per_session": round(n / sessions, 2) if sessions else None}
+                             for op, n in sorted(calls.items())},
+        },
+        "prompt_submits": submits,
+        "duplicate_prompt_rate": round((submits - len(results.prompt_submits)) / submits, 4) if submits else 0.0,
+    }
+
+
+def print_report(report):
+    r = report["results"]
+    print(f"\n{r['sessions']} session(s) complete, {r['failed_sessions']} failed, in {r['duration_s']} s: "
+          f"{r['sessions_per_s']} sessions/s, {r['requests_per_s']} req/s "
+          f"(session p50/p95 {r['session_p50_s']}/{r['session_p95_s']} s)")
+    print(f"\n{'route':<20}{'count':>7}{'errors':>8}{'retries':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, v in r["routes"].items():
+        print(f"{route:<20}{v['count']:>7}{v['errors']:>8}{v['retries']:>9}"
+              f"{v['p50_ms']:>9}{v['p95_ms']:>9}{v['p99_ms']:>9}")
+    if r["storage"]:
+        ops = ", ".join(f"{op} {v['per_session']}" for op, v in r["storage"]["by_operation"].items())
+        print(f"\nS3 calls per session: {r['storage']['per_session']} ({ops})")
+    print(f"Duplicate-prompt rate: {r['duplicate_prompt_rate']:.2%} of {r['prompt_submits']} submits")
+
+
+def flatten(results):
+    """The comparable numbers of a results block, as {"routes.submit.p95_ms": value, ...}."""
+    flat = {k: results[k] for k in ("sessions_per_s", "requests_per_s", "duplicate_prompt_rate")}
+    for route, v in results["routes"].items():
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            flat[f"routes.{route}.{metric}"] = v[metric]
+    if results.get("storage") and results["storage"]["per_session"] is not None:
+        flat["storage.per_session"] = results["storage"]["per_session"]
+    return flat
+
+
+def compare(old, new, tolerance, min_ms):
+    """Prints the change of every metric. Returns the regressions beyond `tolerance` (a fraction)."""
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    regressions = []
+    print(f"\n{'metric':<36}{'baseline':>11}{'current':>11}{'change':>9}")
+    for name in sorted(set(old_flat) & set(new_flat)):
+        before, after = old_flat[name], new_flat[name]
+        change = (after - before) / before if before else (0.0 if after == before else math.inf)
+        worse = change > tolerance if name.endswith(LOWER_IS_BETTER) else change < -tolerance
+        if worse and name.endswith("_ms") and abs(after - before) < min_ms:
+            # Too small to matter in absolute terms
+            worse = False
+        marker = "  ❌" if worse else ""
+        print(f"{name:<36}{before:>11}{after:>11}{change:>+9.1%}{marker}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def run(args):
+    storage = CountingStorage(args.storage_port)
+    tmp_dir = tempfile.mkdtemp(prefix="uoh-loadtest-")
+    proc = None
+    try:
+        print(f"🌱 Seeding {args.prompts} prompt pairs per pool ...", flush=True)
+        seed_prompts(storage.url, args.prompts)
+        if args.url:
+            base = args.url.rstrip("/")
+        else:
+            print(f"▶ Starting gunicorn ({args.server}) ...", flush=True)
+            proc, base = start_server(args.server, storage.url, tmp_dir, args)
+
+        wav = make_wav(args.wav_seconds)
+        results = Results()
+        print(f"🚀 {args.users} users x {args.sessions} session(s), {len(wav) // 1024} KB per take ...", flush=True)
+        before = storage.snapshot()
+        started = time.perf_counter()
+        users = [threading.Thread(target=virtual_user, args=(base, wav, results, args, args.seed * 100003 + i))
+                 for i in range(args.users)]
+        for u in users:
+            u.start()
+        for u in users:
+            u.join()
+        duration = time.perf_counter() - started
+        # With --url the server may talk to another store; only count calls if ours saw any
+        calls = storage.snapshot() - before
+        summary = summarize(results, calls if calls or not args.url else None, duration)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        storage.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "users": args.users, "sessions_per_user": args.sessions, "rounds": ROUNDS,
+            "prompts_per_pool": args.prompts, "wav_seconds": args.wav_seconds, "think_s": args.think,
+            "tribal_share": args.tribal_share, "server": args.url or args.server,
+            "key_layout": os.getenv("S3_KEY_LAYOUT", "flat"), "seed": args.seed,
+        },
+        "results": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="Concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=3, help="Sessions per virtual user")
+    parser.add_argument("--prompts", type=int, default=2000, help="Prompt pairs seeded per pool")
+    parser.add_argument("--wav-seconds", type=float, default=6.0, help="Length of each recorded take")
+    parser.add_argument("--think", type=float, default=0.0, help="Seconds between a prompt and its submit")
+    parser.add_argument("--tribal-share", type=float, default=0.2, help="Share of tribal volunteers")
+    parser.add_argument("--server", default="gthread:2:16", help="worker_class:workers:threads for gunicorn")
+    parser.add_argument("--config", default=os.path.join(ROOT, "gunicorn.conf.py"), help="gunicorn config file")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--storage-port", type=int, default=8767)
+    parser.add_argument("--url", help="Load an already-running app instead of starting gunicorn")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare with an earlier results file")
+    parser.add_argument("--against", metavar="RESULTS", help="With --compare: compare this file instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    if args.against:
+        if not args.compare:
+            parser.error("--against needs --compare")
+        with open(args.against) as f:
+            report = json.load(f)
+    else:
+        report = run(args)
+        print_report(report)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"💾 Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+        print(f"\n✅ No regression beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Converts the objects under the recording, metadata and prompt prefixes
+between the flat and the hash-sharded key layout:
+
+    audio/standard/UOH_1a2b3c4d.wav  <->  audio/standard/3f/UOH_1a2b3c4d.wav
+
+Objects are copied to their new key (concurrently), and the prompt keys
+(per-prompt recording counts) and audio paths stored in the recordings
+tables are rewritten to match the target layout. Sources are only deleted with --delete-source, so the
+migration can run while the app still uses the old layout:
+
+    1. python scripts/migrate_key_layout.py --to sharded
+    2. deploy with S3_KEY_LAYOUT=sharded and S3_KEY_LAYOUT_MIGRATING=true
+    3. python scripts/migrate_key_layout.py --to sharded --delete-source
+       (copies anything written in between, then removes the old keys)
+    4. deploy again without S3_KEY_LAYOUT_MIGRATING
+
+Prompts retired between steps 1 and 2 have their used/ marker at the old
+key while their copy in the new layout is still listed as available.
+S3_KEY_LAYOUT_MIGRATING makes the app check both used/ keys meanwhile, and
+every run deletes the available copies (in either layout) of prompts that
+are already in used/.
+
+Usage:
+    python scripts/migrate_key_layout.py --to sharded --dry-run
+    python scripts/migrate_key_layout.py --to flat --delete-source
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import get_db_connection
+from utils.s3_utils import S3Manager, submit_io
+from utils.key_layout import sharded_prefixes, object_key, filename_in
+
+
+def plan_moves(s3, layout):
+    """(source, destination) for every object not yet at its key in `layout`."""
+    moves = []
+    for prefix in sharded_prefixes():
+        # Flat leftovers next to their sharded copy must be moved (deleted) too
+        for key in s3.list_all_keys(prefix, dedupe=False):
+            name = filename_in(prefix, key)
+            if not name:
+                # Sub-folder content (used/, inprogress/) is handled under its own prefix
+                continue
+            target = object_key(prefix, name, layout=layout)
+            if target != key:
+                moves.append((key, target))
+    return moves
+
+
+def copy_object(s3, source, dest):
+    s3._call('copy_object', CopySource={'Bucket': s3.bucket_name, 'Key': source}, Key=dest)
+    return True
+
+
+def prompt_pools():
+    """(available prefix, used prefix) of every prompt pool."""
+    return (
+        (Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_USED),
+        (Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_USED),
+        (Config.S3_PROMPTS_TRIBAL_PREFIX, Config.S3_PROMPTS_TRIBAL_USED),
+        (Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX, Config.S3_PROMPTS_TRIBAL_ENGLISH_USED),
+    )
+
+
+def plan_stale_prompts(s3):
+    """Available copies (in either layout) of prompts whose used/ marker exists (in either layout)."""
+    stale = []
+    for prefix, used_prefix in prompt_pools():
+        used = {filename_in(used_prefix, key) for key in s3.list_all_keys(used_prefix, dedupe=False)}
+        used.discard(None)
+        stale.extend(key for key in s3.list_all_keys(prefix, dedupe=False)
+                     if filename_in(prefix, key) in used)
+    return stale
+
+
+def relayout_key(key, layout):
+    """The key in `layout` of an object stored directly under one of the sharded prefixes, else the key itself."""
+    for prefix in sorted(sharded_prefixes(), key=len, reverse=True):
+        if key.startswith(prefix):
+            name = filename_in(prefix, key)
+            return object_key(prefix, name, layout=layout) if name else key
+    return key
+
+
+def rewrite_recording_keys(layout):
+    """
+    Points recordings.prompt_key and recordings.audio_path at the keys in
+    `layout`. Done from the rows, not the objects moved: a recorded prompt
+    may since have been moved to used/, but its key is still what the
+    counts go by.
+    """
+    updated = 0
+    for db_path in (Config.DB_PATH, Config.TRIBAL_DB_PATH):
+        if not os.path.exists(db_path):
+            continue
+        conn = get_db_connection(db_path)
+        try:
+            for column in ("prompt_key", "audio_path"):
+                keys = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT {column} FROM recordings WHERE {column} IS NOT NULL")]
+                for key in keys:
+                    target = relayout_key(key, layout)
+                    if target != key:
+                        updated += conn.execute(f"UPDATE recordings SET {column} = ? WHERE {column} = ?",
+                                                (target, key)).rowcount
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️ Could not update recording keys in {db_path}: {e}")
+        finally:
+            conn.close()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", choices=("sharded", "flat"), default="sharded", help="Target layout")
+    parser.add_argument("--delete-source", action="store_true", help="Delete each object after copying it")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    args = parser.parse_args()
+
+    if not Config.S3_BUCKET_NAME:
+        print("❌ Error: S3_BUCKET_NAME not configured")
+        return 1
+
+    s3 = S3Manager()
+    moves = plan_moves(s3, args.to)
+    print(f"📦 {len(moves)} object(s) to move to the {args.to} layout")
+    if args.dry_run:
+        for src, dst in moves[:20]:
+            print(f"  {src} -> {dst}")
+        stale = plan_stale_prompts(s3)
+        print(f"🧹 {len(stale)} available copies of used prompts would be deleted")
+        return 0
+
+    op = s3.move_file if args.delete_source else (lambda src, dst: copy_object(s3, src, dst))
+    futures = [(src, dst, submit_io(op, src, dst)) for src, dst in moves]
+    moved = []
+    for src, dst, future in futures:
+        try:
+            if future.result():
+                moved.append((src, dst))
+        except Exception as e:
+            print(f"❌ {src}: {e}")
+
+    # After the copies: a prompt retired meanwhile may have just been copied back to available
+    stale = plan_stale_prompts(s3)
+    deleted = sum(1 for future in [submit_io(s3.delete_file, key) for key in stale] if future.result())
+    if stale:
+        print(f"🧹 Deleted {deleted}/{len(stale)} available copies of used prompts")
+
+    updated = rewrite_recording_keys(args.to)
+    print(f"✅ Moved {len(moved)}/{len(moves)} object(s), updated {updated} recording key(s)")
+    return 0 if len(moved) == len(moves) and deleted == len(stale) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ import sqlite3
 import pandas as pd
 from config import Config
 from utils.s3_utils import S3Manager
+from utils.key_layout import object_key
 
 def migrate_files(s3):
     """Uploads all files from local upload directories to S3."""
@@ -33,7 +34,7 @@ def migrate_files(s3):
             if not os.path.isfile(file_path):
                 continue
                 
-            s3_key = f"{s3_prefix}{filename}"
+            s3_key = object_key(s3_prefix, filename)
             
             print(f"   ⬆️ Uploading {filename}...", end="\r")
             if s3.upload_file(file_path, s3_key):
@@ -0,0 +1,64 @@
+"""
+Checks that every recording has its audio, transcript, metadata JSON and
+recordings row, using one sorted merge over the S3 listings and the
+database (bounded memory, prefixes listed in parallel).
+
+Usage:
+    python scripts/reconcile.py                      # report only
+    python scripts/reconcile.py --repair             # also restore metadata JSONs / db rows
+    python scripts/reconcile.py --issues issues.ndjson --json report.json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.s3_utils import S3Manager
+from utils.reconciler import Reconciler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repair", action="store_true", help="Rewrite missing metadata JSONs and db rows")
+    parser.add_argument("--db", default=Config.DB_PATH, help="Recordings database to reconcile")
+    parser.add_argument("--samples", type=int, default=20, help="Issues to include in the report")
+    parser.add_argument("--issues", dest="issues_path", help="Write every issue to this NDJSON file")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    if not Config.S3_BUCKET_NAME:
+        print("❌ Error: S3_BUCKET_NAME not configured")
+        return 1
+
+    issues_file = open(args.issues_path, "w") if args.issues_path else None
+    sink = (lambda entry: issues_file.write(json.dumps(entry) + "\n")) if issues_file else None
+    try:
+        report = Reconciler(S3Manager(), db_path=args.db, repair=args.repair,
+                            sample_limit=args.samples, issue_sink=sink).run()
+    finally:
+        if issues_file:
+            issues_file.close()
+
+    print(f"Scanned {report['scanned_uids']} recordings")
+    for issue, count in report["issues"].items():
+        repaired = report["repaired"].get(issue)
+        suffix = f" ({repaired} repaired)" if args.repair and repaired is not None else ""
+        print(f"  {issue:<24} {count}{suffix}")
+    if report["repair_failed"]:
+        print(f"❌ {report['repair_failed']} repairs failed")
+    for name, count in report["out_of_order"].items():
+        print(f"⚠️ {name}: {count} keys out of uid order, results for them may be wrong")
+    for entry in report["samples"]:
+        print(f"  - {entry['uid']}: {entry['issue']} (has {', '.join(entry['sources'])})")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
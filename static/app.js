@@ -7,6 +7,7 @@ let mediaStream = null;
 let processor = null;
 
 let currentPromptId = null;
+let currentIdempotencyKey = null;
 
 /* DOM ELEMENTS */
 const recordBtn = document.getElementById("recordBtn");
@@ -116,11 +117,27 @@ function float32ArrayToWav(buffers, sampleRate) {
   return new Blob([arrayBuffer], { type: 'audio/wav' });
 }
 
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// The server answers 429 (overloaded) or 503 (storage degraded) with
+// Retry-After; wait and try again
+async function fetchWithBackoff(url, options = {}, attempts = 5) {
+  for (let attempt = 1; ; attempt++) {
+    const res = await fetch(url, options);
+    if ((res.status !== 429 && res.status !== 503) || attempt >= attempts) return res;
+    const retryAfter = parseInt(res.headers.get("Retry-After"), 10) || attempt;
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000 * (0.8 + Math.random() * 0.4)));
+  }
+}
+
 /* ---------------- PROMPT LOADING (STEP 6) ---------------- */
 
 async function loadPrompt() {
   try {
-    const res = await fetch("/api/prompt");
+    const res = await fetchWithBackoff("/api/prompt");
     const data = await res.json();
 
     if (data.done) {
@@ -187,10 +204,11 @@ async function loadPrompt() {
         confirmBtn.textContent = "UPLOADING...";
 
         try {
-          const res = await fetch('/finalize_session', { method: 'POST' });
+          const res = await fetchWithBackoff('/finalize_session', { method: 'POST' });
           const result = await res.json();
 
-          if (result.status === 'success') {
+          // With direct uploads every take is already in storage
+          if (result.status === 'success' || (window.UOH_DIRECT_UPLOAD && result.status === 'no_uploads')) {
             statusP.innerHTML = "UPLOAD SUCCESSFUL!<br>THANK YOU FOR YOUR CONTRIBUTION.";
             confirmBtn.style.display = 'none';
 
@@ -330,6 +348,8 @@ recordBtn.onclick = async () => {
     // Convert to WAV
     if (chunks.length > 0) {
       audioBlob = float32ArrayToWav(chunks, 44100);
+      // One key per take: retries of the same take reuse it
+      currentIdempotencyKey = newIdempotencyKey();
     }
 
     recordBtn.style.display = "none";
@@ -343,6 +363,7 @@ recordBtn.onclick = async () => {
 retakeBtn.onclick = () => {
   audioBlob = null;
   chunks = [];
+  currentIdempotencyKey = null;
 
   // Cleanup audio context and stream
   if (processor) {
@@ -364,6 +385,104 @@ retakeBtn.onclick = () => {
   recordBtn.textContent = "RECORD";
 };
 
+/* ---------------- DIRECT UPLOAD ---------------- */
+
+// Uploads the take straight to storage using presigned URLs,
+// then tells the server to record the metadata.
+async function directUpload(blob, text, promptId) {
+  const urlRes = await fetch("/api/upload_url", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ prompt_id: promptId })
+  });
+  if (!urlRes.ok) {
+    throw new Error(`Upload URL error! status: ${urlRes.status}`);
+  }
+  const target = await urlRes.json();
+
+  const putAudio = await fetch(target.audio.url, {
+    method: "PUT",
+    headers: { "Content-Type": target.audio.content_type },
+    body: blob
+  });
+  const putText = await fetch(target.transcription.url, {
+    method: "PUT",
+    headers: { "Content-Type": target.transcription.content_type },
+    body: text
+  });
+  if (!putAudio.ok || !putText.ok) {
+    throw new Error("Direct upload to storage failed");
+  }
+
+  const doneRes = await fetch("/api/upload_complete", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ uid: target.uid, text: text })
+  });
+  if (!doneRes.ok) {
+    throw new Error(`Upload completion error! status: ${doneRes.status}`);
+  }
+  return doneRes.json();
+}
+
+/* ---------------- CHUNKED UPLOAD ---------------- */
+
+const CHUNK_RETRIES = 5;
+
+// Uploads the take in chunks. After a network drop it asks the server
+// for the last acknowledged chunk and resumes from there.
+async function chunkedUpload(blob, text, promptId) {
+  const initRes = await fetch("/api/chunked/init", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ prompt_id: promptId })
+  });
+  if (!initRes.ok) {
+    throw new Error(`Chunked init error! status: ${initRes.status}`);
+  }
+  const init = await initRes.json();
+  const chunkSize = init.max_chunk_bytes;
+  const totalChunks = Math.max(1, Math.ceil(blob.size / chunkSize));
+
+  let next = 0;
+  let failures = 0;
+  while (next < totalChunks) {
+    try {
+      const part = blob.slice(next * chunkSize, (next + 1) * chunkSize);
+      const res = await fetch(`/api/chunked/${init.upload_id}/${next}`, {
+        method: "PUT",
+        body: part
+      });
+      if (!res.ok) {
+        throw new Error(`Chunk error! status: ${res.status}`);
+      }
+      next += 1;
+      failures = 0;
+    } catch (error) {
+      failures += 1;
+      if (failures > CHUNK_RETRIES) throw error;
+      await new Promise(resolve => setTimeout(resolve, 500 * 2 ** failures));
+      // Resume from whatever the server last acknowledged
+      try {
+        const status = await (await fetch(`/api/chunked/${init.upload_id}`)).json();
+        if (typeof status.next_chunk === "number") next = status.next_chunk;
+      } catch (e) {
+        // Still offline, retry the same chunk
+      }
+    }
+  }
+
+  const doneRes = await fetch(`/api/chunked/${init.upload_id}/complete`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ text: text, total_chunks: totalChunks })
+  });
+  if (!doneRes.ok) {
+    throw new Error(`Chunked completion error! status: ${doneRes.status}`);
+  }
+  return doneRes.json();
+}
+
 /* ---------------- SAVE (STEP 7) ---------------- */
 
 saveBtn.onclick = async () => {
@@ -374,25 +493,33 @@ saveBtn.onclick = async () => {
   saveBtn.textContent = "SAVING...";
 
   try {
-    const fd = new FormData();
-    fd.append("audio", audioBlob);
-    fd.append("text", promptBox.innerText);
-    fd.append("prompt_id", currentPromptId);
+    if (window.UOH_DIRECT_UPLOAD) {
+      await directUpload(audioBlob, promptBox.innerText, currentPromptId);
+    } else if (window.UOH_CHUNKED_UPLOAD) {
+      await chunkedUpload(audioBlob, promptBox.innerText, currentPromptId);
+    } else {
+      const fd = new FormData();
+      fd.append("audio", audioBlob);
+      fd.append("text", promptBox.innerText);
+      fd.append("prompt_id", currentPromptId);
+
+      const response = await fetchWithBackoff("/submit", {
+        method: "POST",
+        headers: currentIdempotencyKey ? { "Idempotency-Key": currentIdempotencyKey } : {},
+        body: fd
+      });
 
-    const response = await fetch("/submit", {
-      method: "POST",
-      body: fd
-    });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
 
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
+      await response.json();
     }
 
-    const result = await response.json();
-
     // Reset audio state
     audioBlob = null;
     chunks = [];
+    currentIdempotencyKey = null;
 
     // Load next unique prompt
     await loadPrompt();
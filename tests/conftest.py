@@ -0,0 +1,47 @@
+"""
+Test setup: keeps every run away from the project's databases, the real
+/tmp/uoh_speech_uploads, the .env SMTP account and any real bucket.
+Set before the app's modules are imported, since Config reads the
+environment at import time.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp_dir = tempfile.mkdtemp(prefix="uoh-tests-")
+tempfile.tempdir = _tmp_dir
+os.environ.update(
+    TMPDIR=_tmp_dir,
+    DB_PATH=os.path.join(_tmp_dir, "prompts.db"),
+    TRIBAL_DB_PATH=os.path.join(_tmp_dir, "telugu_tribe.db"),
+    MAIL_USERNAME="", MAIL_PASSWORD="",
+    S3_BUCKET_NAME="uoh-tests", S3_REGION="us-east-1", S3_ENDPOINT_URL="",
+    AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing", AWS_DEFAULT_REGION="us-east-1",
+    SHARED_STATE_BACKEND="memory",
+)
+
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """An S3Manager on an in-process moto bucket, with fresh prompt listing and allocator state."""
+    moto = pytest.importorskip("moto")
+    import boto3
+    import utils.s3_utils as s3_utils
+    from utils.prompt_allocator import prompt_allocator
+    from utils.prompt_listing import prompt_listing
+    from utils.shared_state import InProcessState
+
+    monkeypatch.setattr(prompt_listing, "state", InProcessState())
+    monkeypatch.setattr(prompt_listing, "_local", {})
+    prompt_allocator.reset_after_fork()
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=os.environ["S3_BUCKET_NAME"])
+        s3_utils._client = None
+        yield s3_utils.S3Manager()
+        s3_utils._client = None
@@ -0,0 +1,43 @@
+import pytest
+from config import Config
+from utils import email_utils, shared_state as shared_state_module
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    monkeypatch.setattr(email_utils, "shared_state", shared_state_module.InProcessState())
+    monkeypatch.setattr(Config, "MAIL_USERNAME", "alerts@example.com")
+    monkeypatch.setattr(Config, "MAIL_PASSWORD", "secret")
+    monkeypatch.setattr(Config, "ALERT_SEND_INLINE", True)
+    dispatcher = email_utils.AlertDispatcher()
+    monkeypatch.setattr(email_utils, "_dispatcher", dispatcher)
+    return dispatcher
+
+
+def test_inline_alert_is_sent_before_returning(alerts, monkeypatch):
+    sent = []
+    monkeypatch.setattr(alerts, "_send_batch", lambda batch: sent.append(batch) or True)
+    assert email_utils.send_admin_alert("S3 down", "details") is True
+    assert sent == [[("S3 down", "details")]]
+    assert alerts._thread is None
+
+    # The cooldown only starts after the successful send
+    assert email_utils.send_admin_alert("S3 down", "again") is False
+    assert len(sent) == 1
+
+
+def test_failed_send_does_not_start_the_cooldown(alerts, monkeypatch):
+    results = [False, True]
+    monkeypatch.setattr(alerts, "_send_batch", lambda batch: results.pop(0))
+    assert email_utils.send_admin_alert("S3 down", "details") is False
+    assert email_utils.send_admin_alert("S3 down", "retry") is True
+    assert results == []
+
+
+def test_background_batch_skips_duplicates_and_cooling_subjects(alerts, monkeypatch):
+    sent = []
+    monkeypatch.setattr(alerts, "_send_batch", lambda batch: sent.append(batch) or True)
+    email_utils._start_cooldown("old")
+    alerts._deliver([("new", "1"), ("new", "2"), ("old", "3")])
+    assert sent == [[("new", "1")]]
+    assert email_utils._cooling_down("new")
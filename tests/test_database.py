@@ -0,0 +1,28 @@
+import database
+from config import Config
+
+
+def point_at(monkeypatch, tmp_path):
+    for name in ("DB_PATH", "TRIBAL_DB_PATH", "SUBMISSIONS_DB_PATH"):
+        monkeypatch.setattr(Config, name, str(tmp_path / f"{name.lower()}.db"))
+
+
+def test_schema_is_stamped_once_created(monkeypatch, tmp_path):
+    point_at(monkeypatch, tmp_path)
+    assert database.ensure_schema() is True
+    assert database._schema_version(Config.DB_PATH) == database.SCHEMA_VERSION
+    # Later boots only read the stamp
+    assert database.ensure_schema() is False
+
+
+def test_failed_step_is_not_stamped_and_retried(monkeypatch, tmp_path):
+    point_at(monkeypatch, tmp_path)
+    monkeypatch.setattr(database, "create_prompt_hashes_table", lambda db_path=None: False)
+    database.ensure_schema()
+    assert database._schema_version(Config.DB_PATH) == 0
+    assert database._schema_version(Config.SUBMISSIONS_DB_PATH) == database.SCHEMA_VERSION
+
+    monkeypatch.undo()
+    point_at(monkeypatch, tmp_path)
+    assert database.ensure_schema() is True
+    assert database._schema_version(Config.DB_PATH) == database.SCHEMA_VERSION
@@ -0,0 +1,81 @@
+import socket
+
+import pytest
+
+from config import Config
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A test client whose S3 is a local moto server, so presigned URLs can really be PUT to."""
+    moto_server = pytest.importorskip("moto.server")
+    import boto3
+    import utils.s3_utils as s3_utils
+    from app import app
+
+    port = free_port()
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    monkeypatch.setattr(Config, "S3_ENDPOINT_URL", endpoint)
+    monkeypatch.setattr(Config, "DIRECT_UPLOAD_ENABLED", True)
+    monkeypatch.setattr(s3_utils, "_client", None)
+    boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1").create_bucket(Bucket=Config.S3_BUCKET_NAME)
+    try:
+        client = app.test_client()
+        client.post("/submit_user_info", data={"age": 30, "gender": "male", "location": "Hyderabad",
+                                               "state": "Telangana"})
+        yield client
+    finally:
+        server.stop()
+
+
+def put(part, body):
+    import requests
+    response = requests.put(part["url"], data=body, headers={"Content-Type": part["content_type"]}, timeout=10)
+    assert response.status_code == 200
+
+
+def test_presign_put_complete(client):
+    issued = client.post("/api/upload_url", json={"prompt_id": "prompts/standard/UOH_1.txt"}).get_json()
+    put(issued["audio"], b"RIFF" + b"\0" * 1020)
+    put(issued["transcription"], "ఒక వాక్యం".encode("utf-8"))
+
+    response = client.post("/api/upload_complete", json={"uid": issued["uid"], "text": "ఒక వాక్యం"})
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "saved", "uid": issued["uid"]}
+
+    # The upload is consumed: completing it again is refused
+    assert client.post("/api/upload_complete", json={"uid": issued["uid"]}).status_code == 404
+
+
+def test_complete_without_uploaded_objects(client):
+    issued = client.post("/api/upload_url", json={"prompt_id": "p"}).get_json()
+    response = client.post("/api/upload_complete", json={"uid": issued["uid"]})
+    assert response.status_code == 409
+    assert "Audio" in response.get_json()["error"]
+
+    put(issued["audio"], b"RIFF" + b"\0" * 1020)
+    response = client.post("/api/upload_complete", json={"uid": issued["uid"]})
+    assert response.status_code == 409
+    assert "Transcript" in response.get_json()["error"]
+
+
+def test_oversized_upload_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(Config, "DIRECT_UPLOAD_MAX_BYTES", 100)
+    issued = client.post("/api/upload_url", json={"prompt_id": "p"}).get_json()
+    put(issued["audio"], b"RIFF" + b"\0" * 1020)
+    put(issued["transcription"], b"text")
+    assert client.post("/api/upload_complete", json={"uid": issued["uid"]}).status_code == 413
+
+
+def test_completion_is_refused_when_direct_uploads_are_disabled(client, monkeypatch):
+    issued = client.post("/api/upload_url", json={"prompt_id": "p"}).get_json()
+    monkeypatch.setattr(Config, "DIRECT_UPLOAD_ENABLED", False)
+    assert client.post("/api/upload_complete", json={"uid": issued["uid"]}).status_code == 404
@@ -0,0 +1,43 @@
+from config import Config
+from utils.key_layout import object_key
+from utils.prompt_allocator import prompt_allocator
+
+POOL = (Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX,
+        Config.S3_PROMPTS_STANDARD_USED, Config.S3_PROMPTS_STANDARD_ENGLISH_USED)
+
+
+def seed(s3, count):
+    for i in range(count):
+        name = f"UOH_T{i}.txt"
+        s3.upload_string(f"te {i}", object_key(POOL[0], name))
+        s3.upload_string(f"en {i}", object_key(POOL[1], name))
+
+
+def test_handed_out_prompts_are_not_reported_as_empty(s3):
+    seed(s3, 3)
+    picked = set()
+    for _ in range(3):
+        status, key, _, _ = s3.find_clean_prompt_pair(*POOL)
+        assert status == "ok"
+        picked.add(key)
+    assert len(picked) == 3
+
+    # Every prompt is handed out to a running session, none is used
+    status, _, _, _ = s3.find_clean_prompt_pair(*POOL)
+    assert status == "exhausted"
+
+
+def test_empty_only_when_every_prompt_is_used(s3):
+    seed(s3, 2)
+    for i in range(2):
+        s3.upload_string("used", object_key(POOL[2], f"UOH_T{i}.txt"))
+    status, _, _, _ = s3.find_clean_prompt_pair(*POOL)
+    assert status == "empty"
+
+
+def test_released_prompts_are_offered_again(s3):
+    seed(s3, 1)
+    status, key, _, _ = s3.find_clean_prompt_pair(*POOL)
+    assert status == "ok"
+    prompt_allocator.release(key)
+    assert s3.find_clean_prompt_pair(*POOL)[:2] == ("ok", key)
@@ -0,0 +1,77 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from utils import resilience
+from utils.resilience import CircuitBreaker, StorageUnavailable, classify, storage_call, THROTTLE
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code}}, "PutObject")
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    monkeypatch.setattr(resilience, "breaker", breaker)
+    monkeypatch.setattr(resilience.Config, "S3_RETRY_BASE_SECONDS", 0)
+    return breaker
+
+
+def test_fatal_probe_releases_the_half_open_circuit(breaker):
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+
+    def denied():
+        raise client_error("AccessDenied")
+    with pytest.raises(ClientError):
+        storage_call("put_object", denied)
+
+    # The failed probe must not leave the circuit shut for good
+    assert storage_call("put_object", lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_interrupted_probe_releases_the_half_open_circuit(breaker):
+    breaker.record_failure()
+
+    def interrupted():
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        storage_call("put_object", interrupted)
+    assert breaker.allow()
+
+
+def test_upload_failures_are_classified_by_the_wrapped_error():
+    from boto3.exceptions import S3UploadFailedError
+    try:
+        try:
+            raise client_error("SlowDown")
+        except ClientError as e:
+            raise S3UploadFailedError(f"Failed to upload: {e}")
+    except S3UploadFailedError as wrapped:
+        assert classify(wrapped) == THROTTLE
+
+
+def test_wrapped_upload_throttling_is_retried(breaker):
+    from boto3.exceptions import S3UploadFailedError
+    calls = []
+
+    def upload():
+        calls.append(1)
+        if len(calls) == 1:
+            try:
+                raise client_error("SlowDown")
+            except ClientError as e:
+                raise S3UploadFailedError(f"Failed to upload: {e}")
+        return "ok"
+    assert storage_call("upload_file", upload) == "ok"
+    assert len(calls) == 2
+
+
+def test_exhausted_retries_raise_storage_unavailable(breaker, monkeypatch):
+    monkeypatch.setattr(resilience.Config, "S3_MAX_ATTEMPTS", 2)
+
+    def throttled():
+        raise client_error("SlowDown")
+    with pytest.raises(StorageUnavailable):
+        storage_call("put_object", throttled)
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from utils.shared_state import InProcessState, RedisState, SQLiteState
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        return InProcessState()
+    if request.param == "sqlite":
+        return SQLiteState(str(tmp_path / "shared_state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    state = RedisState(url="redis://localhost:6379/0")
+    state._client = fakeredis.FakeRedis()
+    return state
+
+
+def test_get_set_delete(state):
+    assert state.get("k") is None
+    assert state.get("k", "default") == "default"
+    state.set("k", {"a": [1, 2]})
+    assert state.get("k") == {"a": [1, 2]}
+    state.delete("k")
+    assert state.get("k") is None
+
+
+def test_add_only_sets_missing_keys(state):
+    assert state.add("lock", 1) is True
+    assert state.add("lock", 2) is False
+    assert state.get("lock") == 1
+
+
+def test_incr(state):
+    assert state.incr("n") == 1
+    assert state.incr("n", 5) == 6
+    assert state.incr("f", 0.5) == pytest.approx(0.5)
+
+
+def test_cas(state):
+    assert state.cas("v", None, 1) is True
+    assert state.cas("v", None, 2) is False
+    assert state.cas("v", 0, 2) is False
+    assert state.cas("v", 1, 2) is True
+    assert state.get("v") == 2
+
+
+def test_ttl(state):
+    state.set("s", 1, ttl=0.2)
+    state.add("a", 1, ttl=0.2)
+    state.incr("i", ttl=0.2)
+    state.cas("c", None, 1, ttl=0.2)
+    assert [state.get(k) for k in "saic"] == [1, 1, 1, 1]
+    time.sleep(0.3)
+    assert [state.get(k) for k in "saic"] == [None, None, None, None]
+    # Expired keys can be claimed again
+    assert state.add("a", 2) is True
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_sqlite_reconnects_after_fork(tmp_path):
+    state = SQLiteState(str(tmp_path / "shared_state.db"))
+    state.set("k", "parent")
+    parent_conn = state._local.conn
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = state.get("k") == "parent" and state._local.conn is not parent_conn
+            state.set("k", "child")
+        finally:
+            os.write(write, b"1" if ok else b"0")
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b"1"
+    assert state._local.conn is parent_conn
+    assert state.get("k") == "child"
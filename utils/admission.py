@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+from flask import request, g, jsonify
+from config import Config
+from utils.metrics_utils import registry
+from utils.route_map import parse_route_map
+from utils.shared_state import shared_state
+
+
+class TokenBucket:
+    """
+    Process-wide budget for outbound storage operations. acquire() always
+    takes a token and returns how long the caller must wait for it (the
+    bucket may go into debt), so callers are paced in arrival order.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def backlog_seconds(self):
+        """How long a new storage operation would currently have to wait."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket whose state lives in the shared state, so the budget holds
+    for all workers together (SHARED_STORAGE_BUDGET). Kept in GCRA form:
+    a single "theoretical arrival time" that every operation advances by
+    1/rate with a compare-and-swap. Falls back to a per-process bucket
+    while the shared state is unavailable.
+
+    Every storage call does a get + CAS on that one key, so with the sqlite
+    backend all workers' S3 calls queue behind a single SQLite write lock;
+    use the redis backend for high call rates. Under heavy contention a call
+    that loses 32 CAS races in a row is paced by the per-process bucket
+    instead, without a warning, so the shared budget can be exceeded then.
+    """
+
+    KEY = "admission:storage_tat"
+
+    def __init__(self, rate, burst, state=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.state = state or shared_state
+        self._fallback = TokenBucket(rate, burst)
+
+    def acquire(self):
+        interval = 1 / self.rate
+        try:
+            for _ in range(32):
+                now = time.time()
+                tat = self.state.get(self.KEY)
+                new_tat = max(tat or now, now) + interval
+                if self.state.cas(self.KEY, tat, new_tat, ttl=60):
+                    return max(0.0, new_tat - now - self.burst * interval)
+        except Exception as e:
+            print(f"⚠️ Shared storage budget unavailable ({e}), pacing per process")
+        return self._fallback.acquire()
+
+    def backlog_seconds(self):
+        try:
+            tat = self.state.get(self.KEY) or 0.0
+        except Exception:
+            return self._fallback.backlog_seconds()
+        return max(0.0, tat - time.time() - (self.burst - 1) / self.rate)
+
+
+class RouteLimiter:
+    """
+    Concurrency limit for one endpoint with a bounded wait queue. Requests
+    beyond `limit` wait up to `max_wait` seconds for a slot; when `queue_size`
+    requests are already waiting, new ones are turned away immediately.
+    """
+
+    def __init__(self, limit, queue_size, max_wait):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._service_time = 0.5  # EWMA of request duration, seconds
+
+    def try_acquire(self):
+        with self._cond:
+            if self._active < self.limit and self._waiting == 0:
+                self._active += 1
+                return True
+            if self._waiting >= self.queue_size:
+                return False
+            self._waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self._active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._active += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self, duration):
+        with self._cond:
+            self._active -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * duration
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until the queue ahead of a new request should have drained."""
+        with self._cond:
+            backlog = self._active + self._waiting
+            return max(1, math.ceil(self._service_time * backlog / max(self.limit, 1)))
+
+
+def parse_route_limits(spec):
+    """Parses "main.submit=16,main.api_get_prompt=32" into {endpoint: limit}."""
+    return parse_route_map(spec, int, "admission limit")
+
+
+if Config.SHARED_STORAGE_BUDGET:
+    storage_budget = SharedTokenBucket(Config.STORAGE_OPS_PER_SECOND, Config.STORAGE_OPS_BURST)
+else:
+    storage_budget = TokenBucket(Config.STORAGE_OPS_PER_SECOND, Config.STORAGE_OPS_BURST)
+route_limiters = {
+    endpoint: RouteLimiter(limit, Config.ADMISSION_QUEUE_SIZE, Config.ADMISSION_MAX_WAIT_MS / 1000)
+    for endpoint, limit in parse_route_limits(Config.ADMISSION_ROUTE_LIMITS).items()
+}
+
+
+def pace_storage_call(**kwargs):
+    """botocore before-call hook: spends one storage token, sleeping while the bucket is in debt."""
+    wait = storage_budget.acquire()
+    if wait > 0:
+        registry.observe("admission.storage_wait", "storage", wait)
+        time.sleep(wait)
+
+
+def _reject(reason, retry_after):
+    registry.observe("admission.rejected", request.endpoint or "unknown", 0, error=True)
+    print(f"⚠️ Shedding {request.endpoint} ({reason}), retry after {retry_after}s")
+    response = jsonify({"error": "busy", "reason": reason, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def init_admission_control(app):
+    """
+    Applies the per-route concurrency limits and sheds requests with 429 +
+    Retry-After when their route's queue is full or the storage budget is
+    already backed up by more than STORAGE_MAX_BACKLOG_MS.
+    """
+    if not Config.ADMISSION_CONTROL_ENABLED:
+        return
+
+    @app.before_request
+    def _admit():
+        limiter = route_limiters.get(request.endpoint)
+        if limiter is None:
+            return None
+
+        backlog = storage_budget.backlog_seconds()
+        if backlog * 1000 > Config.STORAGE_MAX_BACKLOG_MS:
+            return _reject("storage_backlog", max(1, math.ceil(backlog)))
+
+        start = time.perf_counter()
+        if not limiter.try_acquire():
+            return _reject("route_busy", limiter.retry_after())
+        registry.observe("admission.queue_wait", request.endpoint, time.perf_counter() - start)
+        g.admission_limiter = limiter
+        g.admission_start = time.perf_counter()
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        limiter = g.pop("admission_limiter", None)
+        if limiter is not None:
+            limiter.release(time.perf_counter() - g.pop("admission_start"))
@@ -0,0 +1,151 @@
+import os
+import json
+import re
+import shutil
+import time
+import uuid
+from config import Config
+from utils.upload_spool import upload_spool
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+class ChunkSpool:
+    """
+    Server-side spool for resumable chunked uploads.
+
+    Each upload lives in its own directory under CHUNK_SPOOL_DIR:
+        <upload_id>/manifest.json
+        <upload_id>/00000.part, 00001.part, ...
+    Chunks are written atomically (temp file + rename), so a chunk that is
+    present on disk has been fully received and can be acknowledged.
+    Uploads that receive nothing for CHUNK_UPLOAD_TTL_SECONDS are deleted.
+    Stored chunks count against the upload spool quota (category "chunks")
+    until the upload is assembled or discarded.
+    """
+
+    _last_sweep = 0.0  # per process, shared by the per-request instances
+
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or Config.CHUNK_SPOOL_DIR
+
+    def _upload_dir(self, upload_id):
+        if not upload_id or not _UPLOAD_ID_RE.match(upload_id):
+            raise ValueError(f"Invalid upload id: {upload_id!r}")
+        return os.path.join(self.base_dir, upload_id)
+
+    def _chunk_path(self, upload_id, index):
+        return os.path.join(self._upload_dir(upload_id), f"{index:05d}.part")
+
+    def init_upload(self, manifest):
+        """Creates a new upload with the given manifest dict. Returns the upload id."""
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        with open(os.path.join(upload_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return upload_id
+
+    def get_manifest(self, upload_id):
+        """Returns the manifest dict, or None if the upload does not exist."""
+        try:
+            with open(os.path.join(self._upload_dir(upload_id), "manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_chunk(self, upload_id, index, data):
+        """
+        Stores chunk `index` and returns its path. Re-sending an already
+        stored chunk simply overwrites it.
+        """
+        if index < 0 or index >= Config.CHUNK_MAX_COUNT:
+            raise ValueError(f"Chunk index out of range: {index}")
+        if len(data) > Config.CHUNK_MAX_BYTES:
+            raise ValueError(f"Chunk too large: {len(data)} bytes")
+
+        path = self._chunk_path(upload_id, index)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def next_chunk(self, upload_id):
+        """Returns the index of the first chunk not yet received (resume point)."""
+        index = 0
+        while os.path.exists(self._chunk_path(upload_id, index)):
+            index += 1
+        return index
+
+    def assemble(self, upload_id, dest_path, total_chunks):
+        """
+        Concatenates chunks 0..total_chunks-1 into dest_path.
+        Returns the list of missing chunk indexes (empty on success).
+        """
+        if total_chunks > Config.CHUNK_MAX_COUNT:
+            raise ValueError(f"Too many chunks: {total_chunks}")
+        missing = [i for i in range(total_chunks) if not os.path.exists(self._chunk_path(upload_id, i))]
+        if missing:
+            return missing
+
+        with open(dest_path, "wb") as out:
+            for i in range(total_chunks):
+                with open(self._chunk_path(upload_id, i), "rb") as part:
+                    shutil.copyfileobj(part, out)
+        return []
+
+    def discard(self, upload_id):
+        """Deletes the upload directory and all its chunks, and drops the chunks from the spool index."""
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            parts = [os.path.join(upload_dir, name) for name in os.listdir(upload_dir) if name.endswith(".part")]
+        except FileNotFoundError:
+            parts = []
+        if parts:
+            try:
+                upload_spool.release(*parts)
+            except Exception as e:
+                print(f"⚠️ Could not release chunks of {upload_id} from the spool index: {e}")
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def upload_dirs(self):
+        """Directories of all uploads in progress."""
+        try:
+            return [entry.path for entry in os.scandir(self.base_dir)
+                    if _UPLOAD_ID_RE.match(entry.name) and entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def expire(self, now=None):
+        """
+        Deletes uploads whose directory has not changed for CHUNK_UPLOAD_TTL_SECONDS
+        (every stored chunk renames into it). Returns the number deleted.
+        """
+        now = now or time.time()
+        expired = 0
+        try:
+            entries = list(os.scandir(self.base_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if not _UPLOAD_ID_RE.match(entry.name) or not entry.is_dir():
+                continue
+            try:
+                if now - entry.stat().st_mtime < Config.CHUNK_UPLOAD_TTL_SECONDS:
+                    continue
+            except FileNotFoundError:
+                continue
+            self.discard(entry.name)
+            expired += 1
+        return expired
+
+    def maybe_expire(self):
+        """expire(), at most once per CHUNK_SWEEP_SECONDS per process."""
+        now = time.time()
+        if now - ChunkSpool._last_sweep < Config.CHUNK_SWEEP_SECONDS:
+            return 0
+        ChunkSpool._last_sweep = now
+        expired = self.expire(now)
+        if expired:
+            print(f"🧹 Deleted {expired} abandoned chunked upload(s)")
+        return expired
@@ -1,57 +1,199 @@
+import queue
 import smtplib
+import threading
+import time
+import atexit
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
 from config import Config
+from utils.metrics_utils import instrument
+from utils.shared_state import shared_state
 
-# Simple in-memory rate limiter
-# Dictionary to store last alert time for different keys
-_last_alert_time = {}
 ALERT_COOLDOWN_MINUTES = 60
 
-def send_admin_alert(subject, body):
+
+def _cooling_down(subject):
     """
-    Sends an email to the admin.
-    Includes rate limiting to avoid spamming (one alert per hour per subject).
+    Shared rate limiter: True if `subject` was sent within the cooldown.
+    The marker is a key in the shared state that expires after the cooldown,
+    so every worker sees the same limit (one alert per hour per subject).
     """
-    global _last_alert_time
-    
-    # Check rate limit
-    now = datetime.now()
-    if subject in _last_alert_time:
-        last_time = _last_alert_time[subject]
-        if now - last_time < timedelta(minutes=ALERT_COOLDOWN_MINUTES):
-            print(f"Skipping email alert '{subject}' (Rate limited)")
-            return False
-            
-    # Update last time
-    _last_alert_time[subject] = now
-    
-    if not Config.MAIL_USERNAME or not Config.MAIL_PASSWORD:
-        print(f"⚠️ Email config missing. Would have sent: [Subject: {subject}] {body}")
+    try:
+        return shared_state.get(f"alert_cooldown:{subject}") is not None
+    except Exception as e:
+        # Never block alerting on the cooldown store
+        print(f"⚠️ Alert cooldown store unavailable ({e}), sending anyway")
         return False
 
+
+def _start_cooldown(subject):
+    """Starts the cooldown once `subject` was actually sent, so a failed send is retried by the next alert."""
     try:
+        shared_state.set(f"alert_cooldown:{subject}", time.time(), ttl=ALERT_COOLDOWN_MINUTES * 60)
+    except Exception as e:
+        print(f"⚠️ Could not record alert cooldown for '{subject}': {e}")
+
+
+class AlertDispatcher:
+    """
+    Background admin alert sender.
+
+    Alerts are put on a queue and sent by a daemon thread, so the request
+    that raised the alert never waits on SMTP. Alerts arriving within
+    ALERT_DIGEST_SECONDS of each other are batched into one digest email,
+    and the SMTP connection is reused until it has been idle for
+    ALERT_SMTP_IDLE_SECONDS.
+
+    With ALERT_SEND_INLINE (the default on Vercel, where a function is frozen
+    once its response is returned and a daemon thread would never run) each
+    alert is sent before submit() returns instead.
+    """
+
+    def __init__(self, digest_seconds=None, idle_seconds=None):
+        self.digest_seconds = Config.ALERT_DIGEST_SECONDS if digest_seconds is None else digest_seconds
+        self.idle_seconds = Config.ALERT_SMTP_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self._queue = queue.Queue()
+        self._server = None
+        self._last_used = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._flushing = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="admin-alerts", daemon=True)
+                self._thread.start()
+
+    def submit(self, subject, body):
+        if Config.ALERT_SEND_INLINE:
+            return self._deliver([(subject, body)])
+        self.start()
+        self._queue.put((subject, body))
+        return True
+
+    def flush(self, timeout=10):
+        """Waits until every queued alert has been handled (used at exit)."""
+        self._flushing.set()
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+        self._flushing.clear()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                self._disconnect()
+                continue
+
+            # Collect everything else that arrives within the digest window
+            batch = [first]
+            deadline = time.time() + self.digest_seconds
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or self._flushing.is_set():
+                    break
+                remaining = min(remaining, 0.5)
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    continue
+
+            try:
+                self._deliver(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _deliver(self, batch):
+        """Sends the alerts not already cooling down and starts their cooldown if that worked."""
+        pending = {}
+        for subject, body in batch:
+            if subject not in pending and not _cooling_down(subject):
+                pending[subject] = body
+        if not pending:
+            return False
+        # Inline sends from several request threads share one SMTP connection
+        with self._send_lock:
+            sent = self._send_batch(list(pending.items()))
+        if sent:
+            for subject in pending:
+                _start_cooldown(subject)
+        return sent
+
+    def _connect(self):
+        if self._server is not None and time.time() - self._last_used < self.idle_seconds:
+            try:
+                self._server.noop()
+                return self._server
+            except Exception:
+                self._server = None
+
+        self._disconnect()
+        server = smtplib.SMTP(Config.MAIL_SERVER, Config.MAIL_PORT, timeout=30)
+        if Config.MAIL_USE_TLS:
+            server.starttls()
+        server.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
+        self._server = server
+        return server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    @instrument("smtp.send", is_error=lambda sent: not sent)
+    def _send_batch(self, batch):
+        if len(batch) == 1:
+            subject, body = batch[0]
+        else:
+            subject = f"{len(batch)} alerts: " + "; ".join(s for s, _ in batch)
+            body = "\n\n".join(f"=== {s} ===\n{b}" for s, b in batch)
+
         msg = MIMEMultipart()
         msg['From'] = Config.MAIL_DEFAULT_SENDER
         msg['To'] = Config.ADMIN_EMAIL
         msg['Subject'] = f"[UOH Speech Alert] {subject}"
-
         msg.attach(MIMEText(body, 'plain'))
 
-        # Connect to SMTP server
-        server = smtplib.SMTP(Config.MAIL_SERVER, Config.MAIL_PORT)
-        if Config.MAIL_USE_TLS:
-            server.starttls()
-            
-        server.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(Config.MAIL_DEFAULT_SENDER, Config.ADMIN_EMAIL, text)
-        server.quit()
-        
-        print(f"📧 Admin alert sent: {subject}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to send email alert: {e}")
+        for attempt in range(2):
+            try:
+                server = self._connect()
+                server.sendmail(Config.MAIL_DEFAULT_SENDER, Config.ADMIN_EMAIL, msg.as_string())
+                self._last_used = time.time()
+                print(f"📧 Admin alert sent: {subject}")
+                return True
+            except Exception as e:
+                # A stale reused connection fails once; reconnect and retry
+                self._server = None
+                if attempt == 1:
+                    print(f"❌ Failed to send email alert: {e}")
         return False
+
+
+_dispatcher = AlertDispatcher()
+atexit.register(_dispatcher.flush)
+
+
+def send_admin_alert(subject, body):
+    """
+    Queues an email to the admin and returns immediately (or sends it right
+    away with ALERT_SEND_INLINE). Includes rate limiting to avoid spamming
+    (one alert per hour per subject, shared across workers); the cooldown
+    only starts once the alert was actually sent.
+    """
+    if not Config.MAIL_USERNAME or not Config.MAIL_PASSWORD:
+        print(f"⚠️ Email config missing. Would have sent: [Subject: {subject}] {body}")
+        return False
+
+    if _cooling_down(subject):
+        print(f"Skipping email alert '{subject}' (Rate limited)")
+        return False
+
+    return _dispatcher.submit(subject, body)
@@ -0,0 +1,53 @@
+import hashlib
+from config import Config
+
+
+def sharded_prefixes():
+    """Prefixes whose objects get a hash shard level when S3_KEY_LAYOUT=sharded."""
+    return (
+        Config.S3_AUDIO_PREFIX, Config.S3_TRIBAL_AUDIO_PREFIX,
+        Config.S3_TRANSCRIPTION_PREFIX, Config.S3_TRIBAL_TRANSCRIPTION_PREFIX,
+        Config.S3_METADATA_PREFIX,
+        Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_USED,
+        Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_USED,
+        Config.S3_PROMPTS_TRIBAL_PREFIX, Config.S3_PROMPTS_TRIBAL_USED,
+        Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX, Config.S3_PROMPTS_TRIBAL_ENGLISH_USED,
+    )
+
+
+def is_sharded(prefix, layout=None):
+    return (layout or Config.S3_KEY_LAYOUT) == "sharded" and prefix in sharded_prefixes()
+
+
+def shard_for(filename):
+    """Hex shard of a file name. The Telugu and English copies of a prompt share a name, so they share a shard."""
+    return hashlib.md5(filename.encode("utf-8")).hexdigest()[:Config.S3_KEY_SHARD_CHARS]
+
+
+def object_key(prefix, filename, layout=None):
+    """
+    The S3 key of `filename` under `prefix`:
+    audio/standard/UOH_1a2b3c4d.wav (flat) or audio/standard/3f/UOH_1a2b3c4d.wav (sharded).
+    """
+    if is_sharded(prefix, layout):
+        return f"{prefix}{shard_for(filename)}/{filename}"
+    return f"{prefix}{filename}"
+
+
+def all_shards():
+    width = Config.S3_KEY_SHARD_CHARS
+    return [format(i, f"0{width}x") for i in range(16 ** width)]
+
+
+def filename_in(prefix, key):
+    """
+    The file name of an object stored directly under `prefix` in either
+    layout, or None for keys in other sub-folders (used/, inprogress/, ...).
+    """
+    rest = key[len(prefix):]
+    if "/" not in rest:
+        return rest
+    shard, _, name = rest.partition("/")
+    if "/" in name or len(shard) != Config.S3_KEY_SHARD_CHARS or shard != shard_for(name):
+        return None
+    return name
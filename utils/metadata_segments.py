@@ -0,0 +1,205 @@
+import gzip
+import io
+import json
+import os
+import time
+import uuid
+from config import Config
+from utils.metrics_utils import instrument
+from utils.s3_utils import submit_io
+
+METADATA_SUFFIX = "_metadata.json"
+
+
+def _manifest_key():
+    return f"{Config.S3_METADATA_SEGMENTS_PREFIX}manifest.json"
+
+
+def _uid_from_key(key):
+    return os.path.basename(key)[:-len(METADATA_SUFFIX)]
+
+
+def _encode_ndjson(records):
+    lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+    return gzip.compress(lines.encode("utf-8"))
+
+
+def _decode_ndjson(data):
+    text = gzip.decompress(data).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _encode_parquet(records):
+    # pyarrow is optional: only needed when METADATA_SEGMENT_FORMAT=parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = sorted({k for r in records for k in r})
+    table = pa.table({c: [None if r.get(c) is None else str(r.get(c)) for r in records] for c in columns})
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd")
+    return buf.getvalue()
+
+
+def _decode_parquet(data):
+    import pyarrow.parquet as pq
+    return pq.read_table(io.BytesIO(data)).to_pylist()
+
+
+def load_manifest(s3):
+    """Returns (manifest, etag); an empty manifest if none has been written yet."""
+    data, etag = s3.get_object_with_etag(_manifest_key())
+    if not data:
+        return {"version": 0, "watermark": 0, "segments": []}, None
+    return json.loads(data.decode("utf-8")), etag
+
+
+def _legacy_uids(manifest):
+    """uids listed by segments written before the watermark existed."""
+    return {uid for seg in manifest["segments"] for uid in seg.get("uids", ())}
+
+
+def _tail(s3, manifest):
+    """
+    Keys of the per-recording metadata files not in any segment: those last
+    modified at or after the manifest's watermark (segments hold the older ones).
+    """
+    watermark = manifest.get("watermark", 0)
+    legacy = _legacy_uids(manifest)
+    return [key for key, modified in s3.list_all_objects(Config.S3_METADATA_PREFIX)
+            if key.endswith(METADATA_SUFFIX) and modified >= watermark and _uid_from_key(key) not in legacy]
+
+
+@instrument("metadata.compact")
+def compact_metadata(s3, max_records=None):
+    """
+    Merges metadata/<uid>_metadata.json files that are not yet in a segment
+    into new append-only segments, then publishes them in the manifest with
+    a compare-and-swap write. The per-recording JSONs are left in place.
+
+    The manifest keeps a watermark instead of the compacted uids: every file
+    last modified before it is in a segment, and each segment records the
+    [from, until) range it covers. Returns the number of records compacted.
+    """
+    max_records = max_records or Config.METADATA_SEGMENT_MAX_RECORDS
+    manifest, etag = load_manifest(s3)
+    watermark = manifest.get("watermark", 0)
+    cutoff = int(time.time()) - Config.METADATA_COMPACT_SETTLE_SECONDS
+    legacy = _legacy_uids(manifest)
+
+    new_keys = [key for key, modified in s3.list_all_objects(Config.S3_METADATA_PREFIX)
+                if key.endswith(METADATA_SUFFIX) and watermark <= modified < cutoff
+                and _uid_from_key(key) not in legacy]
+    if not new_keys:
+        print("✅ Metadata segments are up to date")
+        return 0
+
+    fmt = Config.METADATA_SEGMENT_FORMAT
+    encode, ext = (_encode_parquet, "parquet") if fmt == "parquet" else (_encode_ndjson, "ndjson.gz")
+
+    new_segments = []
+    failed = False
+    for start in range(0, len(new_keys), max_records):
+        batch = new_keys[start:start + max_records]
+        texts = [f.result() for f in [submit_io(s3.read_file, k) for k in batch]]
+        if any(text is None for text in texts):
+            # The watermark moves past the whole range, so nothing may be left out
+            print("❌ Could not read every metadata file, not compacting this run")
+            failed = True
+            break
+        records = []
+        for key, text in zip(batch, texts):
+            try:
+                record = json.loads(text)
+            except ValueError:
+                print(f"⚠️ Skipping unreadable metadata file {key}")
+                continue
+            record["uid"] = _uid_from_key(key)
+            records.append(record)
+        if not records:
+            continue
+
+        segment_key = f"{Config.S3_METADATA_SEGMENTS_PREFIX}seg-{int(time.time())}-{uuid.uuid4().hex[:8]}.{ext}"
+        body = encode(records)
+        if not s3.upload_bytes(body, segment_key):
+            print(f"❌ Failed to write metadata segment {segment_key}")
+            failed = True
+            break
+        new_segments.append({
+            "key": segment_key,
+            "format": fmt,
+            "count": len(records),
+            "bytes": len(body),
+            "created": int(time.time()),
+            "from": watermark,
+            "until": cutoff,
+        })
+
+    if failed:
+        for seg in new_segments:
+            s3.delete_file(seg["key"])
+        return 0
+
+    for seg in manifest["segments"]:
+        # Everything before the new watermark is covered now
+        seg.pop("uids", None)
+    manifest["segments"].extend(new_segments)
+    manifest["watermark"] = cutoff
+    manifest["version"] = manifest.get("version", 0) + 1
+    body = json.dumps(manifest).encode("utf-8")
+    if not s3.put_object_if_match(_manifest_key(), body, etag):
+        # A retried PUT can fail its condition after the first attempt
+        # actually landed, so check before treating the segments as orphans
+        published = load_manifest(s3)[0]
+        if published.get("watermark") != cutoff or not all(
+                seg["key"] in {p["key"] for p in published["segments"]} for seg in new_segments):
+            # Another compactor published first; the records will be picked up again by the next run
+            print("⚠️ Metadata manifest changed during compaction, discarding this run")
+            for seg in new_segments:
+                s3.delete_file(seg["key"])
+            return 0
+
+    count = sum(seg["count"] for seg in new_segments)
+    print(f"✅ Compacted {count} metadata files into {len(new_segments)} segment(s)")
+    return count
+
+
+@instrument("metadata.count")
+def count_metadata(s3):
+    """
+    Number of metadata records without reading any of them: the segment
+    counts from the manifest plus the files written since the watermark.
+    """
+    manifest, _ = load_manifest(s3)
+    return sum(seg["count"] for seg in manifest["segments"]) + len(_tail(s3, manifest))
+
+
+@instrument("metadata.load_all")
+def load_all_metadata(s3, include_tail=True):
+    """
+    Loads every metadata record: one GET per segment (fetched concurrently)
+    plus, with `include_tail`, the per-recording JSONs written since the last
+    compaction. Records carry their `uid`.
+    """
+    manifest, _ = load_manifest(s3)
+    futures = [(seg, submit_io(s3.read_bytes, seg["key"])) for seg in manifest["segments"]]
+    records = []
+    for seg, future in futures:
+        data = future.result()
+        if not data:
+            print(f"⚠️ Metadata segment {seg['key']} is missing")
+            continue
+        decode = _decode_parquet if seg.get("format") == "parquet" else _decode_ndjson
+        records.extend(decode(data))
+
+    if include_tail:
+        # A file rewritten after it was compacted shows up in both; keep the segment copy
+        seen = {r.get("uid") for r in records}
+        tail = [k for k in _tail(s3, manifest) if _uid_from_key(k) not in seen]
+        for key, future in [(k, submit_io(s3.read_file, k)) for k in tail]:
+            try:
+                record = json.loads(future.result() or "")
+            except ValueError:
+                continue
+            record["uid"] = _uid_from_key(key)
+            records.append(record)
+    return records
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from flask import has_request_context, request
+from utils.tracing_utils import start_span, end_span
+
+# Latency histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    In-process metrics store: call counts, errors, bytes and a latency
+    histogram per (operation, route). Counters are kept per worker process;
+    Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, operation, route, duration, error=False, nbytes=0):
+        key = (operation, route)
+        bucket = bisect_left(LATENCY_BUCKETS, duration)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"count": 0, "errors": 0, "bytes": 0, "sum": 0.0,
+                          "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+                self._series[key] = series
+            series["count"] += 1
+            series["sum"] += duration
+            series["bytes"] += nbytes or 0
+            series["buckets"][bucket] += 1
+            if error:
+                series["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(series, buckets=list(series["buckets"]))
+                    for key, series in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render_prometheus(self):
+        """Renders all series in the Prometheus text exposition format."""
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+
+        def labels(operation, route, extra=""):
+            return f'operation="{operation}",route="{route}"{extra}'
+
+        for name, field, help_text in (
+            ("uoh_operation_calls_total", "count", "Number of calls per operation and route."),
+            ("uoh_operation_errors_total", "errors", "Number of failed calls per operation and route."),
+            ("uoh_operation_bytes_total", "bytes", "Bytes transferred per operation and route."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (operation, route), series in snapshot:
+                lines.append(f"{name}{{{labels(operation, route)}}} {series[field]}")
+
+        name = "uoh_operation_duration_seconds"
+        lines.append(f"# HELP {name} Latency per operation and route.")
+        lines.append(f"# TYPE {name} histogram")
+        for (operation, route), series in snapshot:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, series["buckets"]):
+                cumulative += count
+                le = ',le="%s"' % bound
+                lines.append(f"{name}_bucket{{{labels(operation, route, le)}}} {cumulative}")
+            le = ',le="+Inf"'
+            lines.append(f"{name}_bucket{{{labels(operation, route, le)}}} {series['count']}")
+            lines.append(f"{name}_sum{{{labels(operation, route)}}} {series['sum']:.6f}")
+            lines.append(f"{name}_count{{{labels(operation, route)}}} {series['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def current_route():
+    """Flask endpoint of the active request, or 'background' outside a request."""
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "background"
+
+
+def instrument(operation, bytes_fn=None, is_error=None):
+    """
+    Decorator recording count, latency, errors and bytes for `operation`.
+    bytes_fn(args, kwargs, result) returns the bytes moved by the call;
+    is_error(result) flags failures for functions that swallow exceptions
+    and return False/None instead of raising. Each call is also recorded as
+    a span in the current request trace.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            span_token = start_span(operation)
+            result = None
+            error = True
+            try:
+                result = f(*args, **kwargs)
+                error = bool(is_error and is_error(result))
+                return result
+            finally:
+                end_span(span_token, error)
+                nbytes = 0
+                if bytes_fn and not error:
+                    try:
+                        nbytes = bytes_fn(args, kwargs, result) or 0
+                    except Exception:
+                        nbytes = 0
+                registry.observe(operation, current_route(), time.perf_counter() - start, error, nbytes)
+        return wrapper
+    return decorator
+
+
+def file_size_arg(index):
+    """bytes_fn for calls whose positional argument `index` is a local file path."""
+    def bytes_fn(args, kwargs, result):
+        return os.path.getsize(args[index]) if len(args) > index else 0
+    return bytes_fn
+
+
+def init_request_metrics(app):
+    """Records total latency of every request under operation 'request'."""
+    @app.before_request
+    def _start_request_timer():
+        request.environ["uoh.metrics_start"] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = request.environ.get("uoh.metrics_start")
+        if start is not None:
+            registry.observe("request", current_route(), time.perf_counter() - start,
+                             response.status_code >= 500, response.calculate_content_length() or 0)
+        return response
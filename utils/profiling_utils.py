@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from flask import request
+from config import Config
+from utils.route_map import parse_route_map
+
+
+class SamplingProfiler:
+    """
+    Opt-in, low-overhead sampling profiler for production routes.
+
+    A fraction of requests (per route) is marked as sampled: the route's rate
+    from the route_rates setting, else the global sample rate. While a
+    sampled request runs, a background thread snapshots its stack every
+    PROFILING_INTERVAL_MS via sys._current_frames() and aggregates the stacks
+    per route. Profiles are flushed to PROFILE_DIR in collapsed-stack format
+    ("frame;frame;frame count"), which flamegraph tools read directly.
+
+    The on/off switch and sample rate live in a small JSON file so an admin
+    toggle applies to every worker on the host without a redeploy.
+
+    Disabled under gevent (SERVING_MODE=async): requests are greenlets there,
+    and sys._current_frames() only sees the OS thread running the hub.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}  # thread ident -> endpoint
+        self._stacks = defaultdict(Counter)  # endpoint -> Counter(stack -> samples)
+        self._thread = None
+        self._wake = threading.Event()  # set while a sampled request is running
+        self._last_flush = time.time()
+        self._settings = None
+        self._settings_checked = 0
+
+    # ---------------- settings ----------------
+
+    def get_settings(self):
+        """Returns {"enabled": bool, "sample_rate": float, "route_rates": {endpoint: float}}, re-read at most every few seconds."""
+        now = time.time()
+        if self._settings is None or now - self._settings_checked > 5:
+            settings = {"enabled": Config.PROFILING_ENABLED, "sample_rate": Config.PROFILING_SAMPLE_RATE,
+                        "route_rates": parse_route_rates(Config.PROFILING_ROUTE_RATES)}
+            try:
+                with open(Config.PROFILING_STATE_PATH, encoding="utf-8") as f:
+                    settings.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+            self._settings = settings
+            self._settings_checked = now
+        return self._settings
+
+    def set_settings(self, enabled, sample_rate, route_rates=None):
+        sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        route_rates = {endpoint: min(1.0, max(0.0, float(rate))) for endpoint, rate in (route_rates or {}).items()}
+        os.makedirs(os.path.dirname(Config.PROFILING_STATE_PATH), exist_ok=True)
+        tmp_path = f"{Config.PROFILING_STATE_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"enabled": bool(enabled), "sample_rate": sample_rate, "route_rates": route_rates}, f)
+        os.replace(tmp_path, Config.PROFILING_STATE_PATH)
+        self._settings = None
+
+    # ---------------- sampling ----------------
+
+    def begin(self, endpoint):
+        if Config.ASYNC_SERVING:
+            return False
+        settings = self.get_settings()
+        rate = settings["route_rates"].get(endpoint, settings["sample_rate"])
+        if not settings["enabled"] or random.random() >= rate:
+            return False
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self._wake.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="route-profiler", daemon=True)
+                self._thread.start()
+        return True
+
+    def end(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if time.time() - self._last_flush > Config.PROFILING_FLUSH_SECONDS:
+            self.flush()
+
+    def _run(self):
+        interval = Config.PROFILING_INTERVAL_MS / 1000.0
+        while True:
+            with self._lock:
+                if not self._active:
+                    # Cleared under the lock, so a begin() right after sets it again
+                    self._wake.clear()
+            # Idle until the next sampled request instead of polling
+            self._wake.wait()
+            time.sleep(interval)
+            with self._lock:
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for ident, endpoint in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                collapsed = ";".join(reversed(stack))
+                with self._lock:
+                    self._stacks[endpoint][collapsed] += 1
+
+    def flush(self):
+        """Writes this process's aggregated stacks, one file per route."""
+        self._last_flush = time.time()
+        with self._lock:
+            snapshot = {endpoint: Counter(stacks) for endpoint, stacks in self._stacks.items()}
+        if not snapshot:
+            return
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        for endpoint, stacks in snapshot.items():
+            path = os.path.join(Config.PROFILE_DIR, f"{endpoint}.{os.getpid()}.collapsed")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            os.replace(tmp_path, path)
+
+
+def parse_route_rates(spec):
+    """Parses "main.submit=0.5,main.api_get_prompt=0.1" into {endpoint: rate}."""
+    return parse_route_map(spec, lambda value: min(1.0, max(0.0, float(value))), "profiling rate")
+
+
+profiler = SamplingProfiler()
+
+
+def list_profiles():
+    """Returns [{name, size, modified}] for every profile file, newest first."""
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(Config.PROFILE_DIR):
+        if not name.endswith(".collapsed"):
+            continue
+        stat = os.stat(os.path.join(Config.PROFILE_DIR, name))
+        profiles.append({"name": name, "size": stat.st_size, "modified": stat.st_mtime})
+    profiles.sort(key=lambda p: p["modified"], reverse=True)
+    for profile in profiles:
+        profile["modified"] = datetime.fromtimestamp(profile["modified"]).strftime("%Y-%m-%d %H:%M:%S")
+    return profiles
+
+
+def init_profiling(app):
+    @app.before_request
+    def _begin_profile():
+        if request.blueprint in ("main", "admin"):
+            profiler.begin(request.endpoint)
+
+    @app.teardown_request
+    def _end_profile(exc):
+        profiler.end()
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import random
+import socket
+import threading
+import time
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _bucket(key, partition_count):
+    """Stable partition of a prompt key (independent of PYTHONHASHSEED)."""
+    digest = hashlib.md5(os.path.basename(key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % partition_count
+
+
+class PromptAllocator:
+    """
+    Hands out prompts so concurrent sessions rarely contend for the same one.
+
+    The prompt space is split into PROMPT_PARTITION_COUNT disjoint partitions
+    by a hash of the file name. Each worker process claims one partition
+    (a lock file in /tmp, so workers on a host get distinct slots) and walks
+    it as a seeded random permutation with a cursor, so it never hands out
+    the same prompt twice while that prompt is still in use. Only when its
+    own partition is exhausted does a worker move on to the others.
+
+    When the lock directory is not shared by the whole deployment
+    (PROMPT_PARTITION_SHARED=false, the default on Vercel), every instance
+    would win slot 0; the partition is then drawn at random and the
+    permutation is seeded per instance instead.
+    """
+
+    def __init__(self, partition_count=None, partition=None):
+        self.partition_count = partition_count or Config.PROMPT_PARTITION_COUNT
+        self._partition = partition
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._state = {}  # prefix -> {"signature", "order", "cursor"}
+        self._issued = {}  # key -> time handed out
+        self._instance_token = None
+
+    @property
+    def partition(self):
+        if self._partition is None:
+            self._partition = self._claim_partition()
+        return self._partition
+
+    def reset_after_fork(self):
+        """
+        Forgets a partition claimed before fork: the flock is shared with the
+        parent, so every child would otherwise think it owns the same slot.
+        """
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self._partition = None
+            self._state = {}
+            self._issued = {}
+            self._instance_token = None
+
+    def _claim_partition(self):
+        """Claims the first free slot via a held flock, or a random one if slots are not shared."""
+        if fcntl is not None and Config.PROMPT_PARTITION_SHARED:
+            os.makedirs(Config.PROMPT_PARTITION_DIR, exist_ok=True)
+            for slot in range(self.partition_count):
+                path = os.path.join(Config.PROMPT_PARTITION_DIR, f"slot_{slot}.lock")
+                f = open(path, "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()
+                    continue
+                self._lock_file = f  # held for the lifetime of the process
+                return slot
+        return int.from_bytes(os.urandom(4), "big") % self.partition_count
+
+    def _seed(self, prefix):
+        # Hosts with their own /tmp claim the same slots, so the host name is
+        # always mixed in; unshared instances also add a random token.
+        instance = socket.gethostname()
+        if not Config.PROMPT_PARTITION_SHARED or fcntl is None:
+            if self._instance_token is None:
+                self._instance_token = f"{os.getpid()}:{os.urandom(8).hex()}"
+            instance = f"{instance}:{self._instance_token}"
+        return f"{Config.DEPLOYMENT_ID}:{instance}:{prefix}:{self.partition}"
+
+    def _build_order(self, prefix, keys):
+        own, others = [], []
+        for key in sorted(keys):
+            (own if _bucket(key, self.partition_count) == self.partition else others).append(key)
+        rng = random.Random(self._seed(prefix))
+        rng.shuffle(own)
+        rng.shuffle(others)
+        return own, others
+
+    def order(self, prefix, keys, reserve=0):
+        """
+        Returns keys in allocation order: this worker's partition first,
+        continuing from where the last allocation left off, then the other
+        partitions. Prompts handed out within PROMPT_ALLOCATION_TTL_SECONDS
+        are left out.
+
+        The first `reserve` keys are marked as handed out (and the cursor
+        moves past them) under the same lock, so concurrent requests in this
+        worker never get the same candidates. Give back the ones not used
+        with release().
+        """
+        signature = (len(keys), hash(tuple(keys)))
+        now = time.time()
+        with self._lock:
+            state = self._state.get(prefix)
+            if state is None or state["signature"] != signature:
+                own, others = self._build_order(prefix, keys)
+                cursor = state["cursor"] % len(own) if state and own else 0
+                state = {"signature": signature, "own": own, "others": others, "cursor": cursor}
+                self._state[prefix] = state
+
+            cutoff = now - Config.PROMPT_ALLOCATION_TTL_SECONDS
+            self._issued = {k: t for k, t in self._issued.items() if t > cutoff}
+
+            own, cursor = state["own"], state["cursor"]
+            rotated = own[cursor:] + own[:cursor]
+            ordered = [k for k in rotated + state["others"] if k not in self._issued]
+
+            for key in ordered[:reserve]:
+                self._issued[key] = now
+            own_reserved = [k for k in ordered[:reserve] if k in state["own"]]
+            if own_reserved:
+                state["cursor"] = (state["own"].index(own_reserved[-1]) + 1) % len(state["own"])
+            return ordered
+
+    def release(self, *keys):
+        """Makes reserved keys that were not handed out available again."""
+        with self._lock:
+            for key in keys:
+                self._issued.pop(key, None)
+
+
+prompt_allocator = PromptAllocator()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from utils.metrics_utils import registry, current_route
+
+
+class PromptCache:
+    """
+    Two-tier cache for prompt texts, keyed by S3 key.
+
+    Tier 1 is a bounded in-memory LRU. Tier 2 is a directory in /tmp, which
+    survives warm serverless invocations and is shared by the workers on a
+    host. Prompts are immutable once uploaded, so a memory hit younger than
+    PROMPT_CACHE_REVALIDATE_SECONDS is served without touching S3. Older or
+    disk-only entries are revalidated with a conditional GET (If-None-Match
+    on the stored ETag), which costs no body transfer when nothing changed.
+    """
+
+    def __init__(self, max_entries=None, cache_dir=None, revalidate_seconds=None):
+        self.max_entries = max_entries or Config.PROMPT_CACHE_MAX_ENTRIES
+        self.cache_dir = cache_dir or Config.PROMPT_CACHE_DIR
+        self.revalidate_seconds = (Config.PROMPT_CACHE_REVALIDATE_SECONDS
+                                   if revalidate_seconds is None else revalidate_seconds)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # s3_key -> (etag, text, validated_at)
+
+    # ---------------- memory tier ----------------
+
+    def _get_memory(self, s3_key):
+        with self._lock:
+            entry = self._memory.get(s3_key)
+            if entry is not None:
+                self._memory.move_to_end(s3_key)
+            return entry
+
+    def _put_memory(self, s3_key, etag, text):
+        with self._lock:
+            self._memory[s3_key] = (etag, text, time.time())
+            self._memory.move_to_end(s3_key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # ---------------- disk tier ----------------
+
+    def _disk_path(self, s3_key):
+        digest = hashlib.sha1(s3_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _get_disk(self, s3_key):
+        try:
+            with open(self._disk_path(s3_key), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("key") == s3_key:
+                return data["etag"], data["text"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _put_disk(self, s3_key, etag, text):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._disk_path(s3_key)
+            # Per thread as well as per process: threads of one worker write concurrently
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": s3_key, "etag": etag, "text": text}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write prompt cache entry for {s3_key}: {e}")
+
+    # ---------------- public API ----------------
+
+    def get(self, s3_key, fetch):
+        """
+        Returns the text for s3_key. `fetch(s3_key, etag)` must return
+        (etag, text) for a changed/new object, or None if `etag` is still
+        current (HTTP 304). It raises or returns (None, None) on failure.
+        """
+        entry = self._get_memory(s3_key)
+        if entry is not None and time.time() - entry[2] < self.revalidate_seconds:
+            self._record("memory_hit")
+            return entry[1]
+
+        cached = (entry[0], entry[1]) if entry is not None else self._get_disk(s3_key)
+        result = fetch(s3_key, cached[0] if cached else None)
+
+        if result is None and cached:
+            # Not modified: the cached copy is still good
+            self._record("revalidated")
+            self._put_memory(s3_key, *cached)
+            return cached[1]
+
+        etag, text = result if result else (None, None)
+        if text is None:
+            self._record("error")
+            return None
+
+        self._record("miss")
+        self._put_memory(s3_key, etag, text)
+        self._put_disk(s3_key, etag, text)
+        return text
+
+    def invalidate(self, s3_key):
+        with self._lock:
+            self._memory.pop(s3_key, None)
+        try:
+            os.remove(self._disk_path(s3_key))
+        except OSError:
+            pass
+
+    def _record(self, outcome):
+        registry.observe(f"prompt_cache.{outcome}", current_route(), 0.0)
+
+
+prompt_cache = PromptCache()
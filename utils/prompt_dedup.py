@@ -0,0 +1,25 @@
+import hashlib
+import re
+import unicodedata
+
+# Zero-width characters that do not change how a prompt reads
+_INVISIBLE_RE = re.compile("[​‌‍﻿]")
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = " .,!?;:।॥\"'"
+
+
+def normalize_prompt_text(text):
+    """
+    Canonical form of a prompt for duplicate detection: NFC, no zero-width
+    characters, collapsed whitespace, no trailing punctuation, casefolded
+    (for Latin text mixed into prompts).
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = _INVISIBLE_RE.sub("", text)
+    text = _SPACE_RE.sub(" ", text).strip().rstrip(_TRAILING_PUNCT)
+    return text.casefold()
+
+
+def prompt_hash(text):
+    """SHA-256 hex digest of the normalized prompt text."""
+    return hashlib.sha256(normalize_prompt_text(text).encode("utf-8")).hexdigest()
@@ -0,0 +1,81 @@
+import threading
+import uuid
+from config import Config
+from utils.metrics_utils import registry, current_route
+from utils.shared_state import shared_state
+
+
+class SharedPromptListing:
+    """
+    The key listing of a prompt prefix, shared by all workers.
+
+    One worker lists the prefix and publishes the keys in the shared state
+    under a fresh version id for PROMPT_INDEX_TTL_SECONDS. The others only
+    read the small version key per request and reuse their local copy while
+    it matches. After the TTL, the first worker to claim the refresh lock
+    re-lists; the rest keep serving the previous listing meanwhile. Keys
+    that went stale in between (used prompts) are filtered by the callers'
+    used checks, as before.
+    """
+
+    def __init__(self, state=None, ttl=None):
+        self.state = state or shared_state
+        self.ttl = ttl or Config.PROMPT_INDEX_TTL_SECONDS
+        self._local = {}  # prefix -> (version, keys)
+        self._lock = threading.Lock()
+
+    def keys(self, prefix, list_keys):
+        """Returns the shared listing of `prefix`, calling list_keys(prefix) when it must be rebuilt."""
+        version_key = f"prompt_listing:{prefix}:version"
+        lock_key = f"prompt_listing:{prefix}:lock"
+        with self._lock:
+            local = self._local.get(prefix)
+        try:
+            version = self.state.get(version_key)
+            if version is not None and local and local[0] == version:
+                registry.observe("prompt_listing.hit", current_route(), 0)
+                return local[1]
+            if version is not None:
+                keys = self.state.get(f"prompt_listing:{prefix}:{version}")
+                if keys is not None:
+                    with self._lock:
+                        self._local[prefix] = (version, keys)
+                    return keys
+            claimed = self.state.add(lock_key, 1, ttl=10)
+        except Exception as e:
+            print(f"⚠️ Shared state unavailable ({e}), listing {prefix} directly")
+            return list_keys(prefix)
+
+        if not claimed and local:
+            # Another worker is re-listing; the previous listing will do until then
+            return local[1]
+        try:
+            keys = list_keys(prefix)
+            version = uuid.uuid4().hex
+            try:
+                # The data outlives the version pointer, so readers of the old version still find it
+                self.state.set(f"prompt_listing:{prefix}:{version}", keys, ttl=self.ttl * 2)
+                self.state.set(version_key, version, ttl=self.ttl)
+            except Exception as e:
+                print(f"⚠️ Could not share the listing of {prefix}: {e}")
+        finally:
+            if claimed:
+                try:
+                    self.state.delete(lock_key)
+                except Exception:
+                    pass  # the lock expires on its own
+        registry.observe("prompt_listing.rebuild", current_route(), 0)
+        with self._lock:
+            self._local[prefix] = (version, keys)
+        return keys
+
+    def invalidate(self, *prefixes):
+        """Forces a re-list on the next request (e.g. after prompts were added)."""
+        for prefix in prefixes:
+            try:
+                self.state.delete(f"prompt_listing:{prefix}:version")
+            except Exception as e:
+                print(f"⚠️ Could not invalidate the prompt listing of {prefix}: {e}")
+
+
+prompt_listing = SharedPromptListing()
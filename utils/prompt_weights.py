@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from config import Config
+
+# Age bands used to group speakers when balancing coverage
+AGE_BANDS = ((17, "u18"), (25, "18-25"), (40, "26-40"), (60, "41-60"))
+
+
+def demographic_group(user_info):
+    """Coarse speaker group, e.g. 'female:18-25'."""
+    gender = (user_info.get("gender") or "unknown").lower()
+    try:
+        age = int(user_info.get("age"))
+    except (TypeError, ValueError):
+        return f"{gender}:unknown"
+    for upper, label in AGE_BANDS:
+        if age <= upper:
+            return f"{gender}:{label}"
+    return f"{gender}:60+"
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table: O(n) to build, O(1) per weighted sample.
+    """
+
+    def __init__(self, items, weights):
+        n = len(items)
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        if n == 0:
+            return
+
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+class WeightedPromptSelector:
+    """
+    Coverage-balanced prompt selection.
+
+    Each prompt is weighted by 1 / (1 + recordings it already has from the
+    requesting speaker's demographic group), so prompts that need more
+    speakers of that group come up more often. Counts are loaded once with a
+    grouped query and then kept up to date in memory as recordings land
+    (record()); the per-(prefix, group) alias tables are rebuilt lazily, at
+    most every PROMPT_WEIGHTS_REBUILD_SECONDS, so sampling stays O(1) and no
+    request scans `recordings`.
+    """
+
+    def __init__(self, load_counts=None):
+        self._load_counts = load_counts
+        self._lock = threading.Lock()
+        self._counts = None  # (prompt_key, group) -> count
+        self._tables = {}  # (prefix, group) -> (signature, built_at, AliasTable)
+        self._dirty = set()  # groups whose counts changed since the last build
+
+    def _ensure_counts(self):
+        if self._counts is not None:
+            return
+        counts = defaultdict(int)
+        if self._load_counts is None:
+            from database import get_prompt_recording_counts
+            self._load_counts = get_prompt_recording_counts
+        try:
+            for (prompt_key, gender, age), count in self._load_counts():
+                counts[(prompt_key, demographic_group({"gender": gender, "age": age}))] += count
+        except Exception as e:
+            print(f"⚠️ Could not load prompt recording counts: {e}")
+        self._counts = counts
+
+    def record(self, prompt_key, user_info):
+        """Counts a new recording of `prompt_key` by this speaker."""
+        group = demographic_group(user_info)
+        with self._lock:
+            self._ensure_counts()
+            self._counts[(prompt_key, group)] += 1
+            self._dirty.add(group)
+
+    def _table(self, prefix, keys, group):
+        signature = (len(keys), hash(tuple(keys)))
+        now = time.time()
+        cached = self._tables.get((prefix, group))
+        if cached and cached[0] == signature and (
+                group not in self._dirty or now - cached[1] < Config.PROMPT_WEIGHTS_REBUILD_SECONDS):
+            return cached[2]
+
+        weights = [1.0 / (1 + self._counts.get((key, group), 0)) for key in keys]
+        table = AliasTable(keys, weights)
+        self._tables[(prefix, group)] = (signature, now, table)
+        self._dirty.discard(group)
+        return table
+
+    def order(self, prefix, keys, user_info):
+        """
+        Yields distinct keys in weighted-random order for this speaker.
+        Repeated draws are skipped; after enough misses the remaining keys
+        follow in plain order so the caller can always exhaust the pool.
+        """
+        if not keys:
+            return
+        group = demographic_group(user_info)
+        with self._lock:
+            self._ensure_counts()
+            table = self._table(prefix, keys, group)
+
+        seen = set()
+        misses = 0
+        while len(seen) < len(keys) and misses < 3 * len(keys):
+            key = table.sample()
+            if key in seen:
+                misses += 1
+                continue
+            seen.add(key)
+            yield key
+        for key in keys:
+            if key not in seen:
+                yield key
+
+
+weighted_selector = WeightedPromptSelector()
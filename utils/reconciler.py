@@ -0,0 +1,254 @@
+import heapq
+import json
+import queue
+import sqlite3
+import threading
+from itertools import groupby
+from config import Config
+from database import get_db_connection, add_recording_metadata
+from utils.key_layout import is_sharded, object_key, filename_in, all_shards
+from utils.s3_utils import submit_io
+
+_DONE = object()
+
+# Kinds of problems a uid can have, and whether the Reconciler can repair them
+ISSUES = {
+    "missing_transcription": False,   # audio without transcript
+    "missing_audio": False,           # transcript (or db row / metadata) without audio
+    "missing_metadata": True,         # no metadata JSON: rewritten from the db row
+    "missing_db_row": True,           # no recordings row: inserted from the metadata JSON
+}
+
+
+def _uid_from_key(key, prefix, suffix):
+    name = filename_in(prefix, key)
+    if not name or not name.endswith(suffix):
+        return None
+    return name[:-len(suffix)]
+
+
+def _prefetching_keys(s3, prefix, delimiter=None):
+    """
+    Yields the keys under one prefix in order. The first page is requested
+    right away and each next page while the current one is consumed, on the
+    I/O pool, so many of these can be merged without listing serially.
+    """
+    params = {'Prefix': prefix}
+    if delimiter:
+        params['Delimiter'] = delimiter
+
+    def fetch(page_params):
+        return s3._call('list_objects_v2', **page_params)
+
+    future = submit_io(fetch, dict(params))
+
+    def keys(future):
+        while future is not None:
+            page = future.result()
+            future = None
+            if page.get('IsTruncated'):
+                params['ContinuationToken'] = page['NextContinuationToken']
+                future = submit_io(fetch, dict(params))
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+    return keys(future)
+
+
+def _sharded_s3_stream(s3, prefix, suffix, source, group):
+    """
+    _s3_stream for a sharded prefix: every shard lists in key order, so a
+    heap merge on the file name restores global uid order. Flat objects
+    left at the top level (before migration) are merged in too. Memory is
+    one listing page per shard.
+    """
+    shards = [_prefetching_keys(s3, f"{prefix}{shard}/") for shard in all_shards()]
+    shards.append(_prefetching_keys(s3, prefix, delimiter="/"))
+    for key in heapq.merge(*shards, key=lambda k: filename_in(prefix, k) or ""):
+        uid = _uid_from_key(key, prefix, suffix)
+        if uid:
+            yield uid, source, group
+
+
+def _s3_stream(s3, prefix, suffix, source, group, buffer_pages):
+    """
+    Yields (uid, source, group) for every object under `prefix`, in listing
+    (= uid) order. The listing runs on its own thread and hands pages over
+    through a bounded queue, so several prefixes are listed in parallel
+    while memory stays at `buffer_pages` pages per prefix.
+    """
+    pages = queue.Queue(maxsize=buffer_pages)
+
+    def produce():
+        try:
+            paginator = s3.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=s3.bucket_name, Prefix=prefix):
+                pages.put([obj['Key'] for obj in page.get('Contents', [])])
+        except Exception as e:
+            pages.put(e)
+        pages.put(_DONE)
+
+    threading.Thread(target=produce, name=f"reconcile-{source}-{group}", daemon=True).start()
+    while True:
+        page = pages.get()
+        if page is _DONE:
+            return
+        if isinstance(page, Exception):
+            raise page
+        for key in page:
+            uid = _uid_from_key(key, prefix, suffix)
+            if uid:
+                yield uid, source, group
+
+
+def _db_stream(db_path, batch_size=1000):
+    """
+    Yields (uid, "db", group) for every recordings row, ordered by uid.
+    Reads in keyset-paginated batches over the uid index and closes the
+    connection in between, so repairs can write while the merge runs.
+    """
+    last_uid = ""
+    while True:
+        conn = get_db_connection(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT uid, is_tribal FROM recordings WHERE uid > ? ORDER BY uid LIMIT ?",
+                (last_uid, batch_size)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        for row in rows:
+            yield row["uid"], "db", "tribal" if row["is_tribal"] else "standard"
+        last_uid = rows[-1]["uid"]
+
+
+def _checked(stream, name, report):
+    """Passes a stream through, counting keys that break uid ordering (the merge relies on it)."""
+    last = None
+    for item in stream:
+        if last is not None and item[0] < last:
+            report["out_of_order"][name] = report["out_of_order"].get(name, 0) + 1
+        last = item[0]
+        yield item
+
+
+class Reconciler:
+    """
+    Single linear merge of the sorted audio/, transcription/ and metadata/
+    listings with the recordings table. Each uid is examined once, as the
+    streams advance together, so memory is bounded by the page buffers no
+    matter how many objects there are.
+    """
+
+    def __init__(self, s3, db_path=None, repair=False, sample_limit=100, buffer_pages=4, issue_sink=None):
+        self.s3 = s3
+        self.db_path = db_path or Config.DB_PATH
+        self.repair = repair
+        self.sample_limit = sample_limit
+        self.buffer_pages = buffer_pages
+        # Optional callable receiving every issue (e.g. to write a full NDJSON report)
+        self.issue_sink = issue_sink
+
+    def _streams(self, report):
+        specs = [
+            (Config.S3_AUDIO_PREFIX, ".wav", "audio", "standard"),
+            (Config.S3_TRIBAL_AUDIO_PREFIX, ".wav", "audio", "tribal"),
+            (Config.S3_TRANSCRIPTION_PREFIX, ".txt", "transcription", "standard"),
+            (Config.S3_TRIBAL_TRANSCRIPTION_PREFIX, ".txt", "transcription", "tribal"),
+            (Config.S3_METADATA_PREFIX, "_metadata.json", "metadata", None),
+        ]
+        streams = []
+        for prefix, suffix, source, group in specs:
+            if is_sharded(prefix):
+                stream = _sharded_s3_stream(self.s3, prefix, suffix, source, group)
+            else:
+                stream = _s3_stream(self.s3, prefix, suffix, source, group, self.buffer_pages)
+            streams.append(_checked(stream, prefix, report))
+        streams.append(_checked(_db_stream(self.db_path), "recordings", report))
+        return streams
+
+    def run(self):
+        report = {
+            "scanned_uids": 0,
+            "issues": {name: 0 for name in ISSUES},
+            "repaired": {name: 0 for name in ISSUES if ISSUES[name]},
+            "repair_failed": 0,
+            "samples": [],
+            "out_of_order": {},
+        }
+        merged = heapq.merge(*self._streams(report), key=lambda item: item[0])
+        for uid, items in groupby(merged, key=lambda item: item[0]):
+            report["scanned_uids"] += 1
+            sources = {}
+            for _, source, group in items:
+                sources[source] = group
+            for issue in self._issues_for(sources):
+                self._record(report, uid, issue, sources)
+        return report
+
+    @staticmethod
+    def _issues_for(sources):
+        has = sources.__contains__
+        issues = []
+        if has("audio") and not has("transcription"):
+            issues.append("missing_transcription")
+        if not has("audio") and (has("transcription") or has("db") or has("metadata")):
+            issues.append("missing_audio")
+        if has("audio") and not has("metadata"):
+            issues.append("missing_metadata")
+        if has("audio") and not has("db"):
+            issues.append("missing_db_row")
+        return issues
+
+    def _record(self, report, uid, issue, sources):
+        report["issues"][issue] += 1
+        entry = {"uid": uid, "issue": issue, "sources": sorted(sources)}
+        if len(report["samples"]) < self.sample_limit:
+            report["samples"].append(entry)
+        if self.issue_sink:
+            self.issue_sink(entry)
+        if self.repair and ISSUES[issue]:
+            repaired = self._repair(uid, issue, sources)
+            if repaired:
+                report["repaired"][issue] += 1
+            elif repaired is False:
+                report["repair_failed"] += 1
+
+    def _repair(self, uid, issue, sources):
+        """Returns True if repaired, False if the repair failed, None if there was nothing to repair from."""
+        if issue == "missing_metadata":
+            row = self._db_row(uid)
+            if row is None:
+                return None
+            user_info = {k: row[k] for k in ("age", "gender", "location", "state")}
+            key = object_key(Config.S3_METADATA_PREFIX, f"{uid}_metadata.json")
+            return self.s3.upload_string(json.dumps(user_info, ensure_ascii=False), key)
+
+        if issue == "missing_db_row":
+            text = self.s3.read_file(object_key(Config.S3_METADATA_PREFIX, f"{uid}_metadata.json"))
+            if not text:
+                return None
+            is_tribal = sources.get("audio") == "tribal"
+            prompt_prefix = Config.S3_PROMPTS_TRIBAL_PREFIX if is_tribal else Config.S3_PROMPTS_STANDARD_PREFIX
+            prompt_text = self.s3.read_file(object_key(prompt_prefix, f"{uid}_prompt.txt"))
+            return add_recording_metadata(
+                uid=uid,
+                user_info=json.loads(text),
+                audio_path=object_key(Config.S3_TRIBAL_AUDIO_PREFIX if is_tribal else Config.S3_AUDIO_PREFIX,
+                                      f"{uid}.wav"),
+                prompt_text=prompt_text,
+                is_tribal=is_tribal,
+            )
+        return None
+
+    def _db_row(self, uid):
+        conn = get_db_connection(self.db_path)
+        try:
+            return conn.execute("SELECT * FROM recordings WHERE uid = ?", (uid,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"❌ Could not read recording {uid}: {e}")
+            return None
+        finally:
+            conn.close()
@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+from flask import jsonify
+from config import Config
+from utils.metrics_utils import registry, current_route
+
+# Error classes. Only throttle/transient errors are retried and count
+# against the circuit breaker; the rest describe the request, not S3's health.
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+NOT_FOUND = "not_found"
+PRECONDITION = "precondition"
+FATAL = "fatal"
+
+_THROTTLE_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+                   "TooManyRequests", "TooManyRequestsException", "503"}
+_TRANSIENT_CODES = {"InternalError", "ServiceUnavailable", "RequestTimeout", "RequestTimeoutException",
+                    "500", "502", "504"}
+_NOT_FOUND_CODES = {"NoSuchKey", "NotFound", "404"}
+_PRECONDITION_CODES = {"PreconditionFailed", "ConditionalRequestConflict", "412", "304"}
+# botocore connection-level errors, matched by name so botocore is not imported here
+_TRANSIENT_EXCEPTIONS = {"EndpointConnectionError", "ConnectionClosedError", "ReadTimeoutError",
+                         "ConnectTimeoutError", "ConnectionError", "IncompleteReadError",
+                         "ResponseStreamingError", "ProxyConnectionError"}
+# boto3 transfer wrappers (upload_file); classified by the error they wrap
+_WRAPPER_EXCEPTIONS = {"S3UploadFailedError", "RetriesExceededError"}
+
+
+class StorageUnavailable(Exception):
+    """Raised when S3 cannot be reached: retries exhausted or the circuit is open."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def classify(exc):
+    """Maps an exception from boto3 to one of the error classes above."""
+    if isinstance(exc, StorageUnavailable):
+        return FATAL
+    if type(exc).__name__ in _WRAPPER_EXCEPTIONS:
+        inner = getattr(exc, "last_exception", None) or exc.__cause__ or exc.__context__
+        if inner is not None and inner is not exc:
+            return classify(inner)
+    error = (getattr(exc, "response", None) or {}).get("Error", {})
+    code = str(error.get("Code", ""))
+    if code:
+        if code in _THROTTLE_CODES:
+            return THROTTLE
+        if code in _NOT_FOUND_CODES:
+            return NOT_FOUND
+        if code in _PRECONDITION_CODES:
+            return PRECONDITION
+        if code in _TRANSIENT_CODES:
+            return TRANSIENT
+        return FATAL
+    if any(cls.__name__ in _TRANSIENT_EXCEPTIONS for cls in type(exc).__mro__):
+        return TRANSIENT
+    return FATAL
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive retryable failures and then fails
+    fast for `cooldown` seconds. After that a single probe call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half_open"
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 1
+            return max(1, int(self.cooldown - (time.monotonic() - self._opened_at)) + 1)
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        """Ends a half-open probe whose outcome says nothing about S3's health; the next call probes again."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            was_probe, self._probing = self._probing, False
+            if was_probe or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                tripped = True
+            else:
+                tripped = False
+        if tripped:
+            registry.observe("s3.circuit_trip", current_route(), 0, error=True)
+            print(f"🚨 S3 circuit breaker OPEN for {self.cooldown}s after {self._failures} failures")
+
+
+breaker = CircuitBreaker(Config.S3_BREAKER_THRESHOLD, Config.S3_BREAKER_COOLDOWN_SECONDS)
+
+
+def _deadline_for(operation):
+    return Config.S3_OP_DEADLINES.get(operation, Config.S3_DEFAULT_DEADLINE_SECONDS)
+
+
+def storage_call(operation, fn, *args, **kwargs):
+    """
+    Calls fn (one S3 API operation) with jittered exponential backoff on
+    throttling and transient errors, within the operation's deadline, and
+    behind the process-wide circuit breaker. Other errors are raised
+    immediately; StorageUnavailable is raised when S3 looks down.
+    """
+    deadline = time.monotonic() + _deadline_for(operation)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            registry.observe("s3.circuit_rejected", current_route(), 0, error=True)
+            raise StorageUnavailable(f"S3 circuit open, skipping {operation}", breaker.retry_after())
+        attempt += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            kind = classify(e)
+            if kind not in (THROTTLE, TRANSIENT):
+                # The call reached S3 and got an answer, so S3 itself is healthy
+                if kind != FATAL:
+                    breaker.record_success()
+                else:
+                    # Never leave a half-open probe pending, or the circuit stays shut for good
+                    breaker.release_probe()
+                raise
+            breaker.record_failure()
+            # Full jitter; throttling backs off from a higher base
+            base = Config.S3_RETRY_BASE_SECONDS * (4 if kind == THROTTLE else 1)
+            delay = random.uniform(0, min(Config.S3_RETRY_MAX_BACKOFF_SECONDS, base * (2 ** (attempt - 1))))
+            if attempt >= Config.S3_MAX_ATTEMPTS or time.monotonic() + delay > deadline:
+                raise StorageUnavailable(f"S3 {operation} failed after {attempt} attempt(s): {e}",
+                                         breaker.retry_after()) from e
+            registry.observe(f"s3.retry.{operation}", current_route(), delay, error=True)
+            print(f"⚠️ S3 {operation} {kind} error (attempt {attempt}), retrying in {delay:.2f}s: {e}")
+            time.sleep(delay)
+        except BaseException:
+            # Interrupted (e.g. a gevent timeout): free the probe slot too
+            breaker.release_probe()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+def init_resilience(app):
+    """Turns StorageUnavailable escaping a view into a fast 503 with Retry-After."""
+    @app.errorhandler(StorageUnavailable)
+    def _storage_unavailable(e):
+        print(f"❌ {e}")
+        response = jsonify({"error": "storage_unavailable", "retry_after": e.retry_after})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
@@ -0,0 +1,16 @@
+def parse_route_map(spec, convert, label):
+    """
+    Parses "main.submit=16,main.api_get_prompt=32" into {endpoint: convert(value)}.
+    Entries without "=" are skipped; entries convert() rejects with ValueError
+    are reported as an invalid <label> and skipped.
+    """
+    parsed = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        endpoint, _, value = part.partition("=")
+        try:
+            parsed[endpoint.strip()] = convert(value)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid {label}: {part}")
+    return parsed
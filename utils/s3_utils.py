@@ -1,21 +1,179 @@
-import boto3
+import io
 import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 from config import Config
+from utils.metrics_utils import instrument, file_size_arg
+from utils.prompt_cache import prompt_cache
+from utils.prompt_allocator import prompt_allocator
+from utils.prompt_weights import weighted_selector
+from utils.prompt_listing import prompt_listing
+from utils.used_bitmap import used_bitmaps, pool_for_prefix
+from utils.resilience import storage_call, classify, StorageUnavailable, NOT_FOUND
+from utils.key_layout import is_sharded, object_key, sharded_prefixes, filename_in
+
+def _failed(result):
+    return result is False
+
+def _missing(result):
+    return result is None
+
+def _string_size(args, kwargs, result):
+    return len(args[1].encode("utf-8"))
+
+def _read_size(args, kwargs, result):
+    return len(result.encode("utf-8")) if result else 0
+
+def _bytes_size(args, kwargs, result):
+    return len(args[1])
+
+def _bytes_read_size(args, kwargs, result):
+    return len(result) if result else 0
+
+def _unavailable(e):
+    """Wraps a non-retryable S3 error so callers only need to handle StorageUnavailable."""
+    return e if isinstance(e, StorageUnavailable) else StorageUnavailable(str(e))
+
+
+def _error_code(e):
+    """The S3 error code of a boto3 ClientError, or "" for anything else."""
+    return str((getattr(e, "response", None) or {}).get("Error", {}).get("Code", ""))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_s3_client():
+    """
+    Returns the process-wide boto3 S3 client, creating it on first use.
+    boto3 is imported here rather than at module level because it is the
+    largest import in the app and most cold starts never touch S3.
+    Clients are thread-safe, so every S3Manager shares this one.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                from botocore.config import Config as BotoConfig
+                _client = boto3.client(
+                    's3',
+                    aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
+                    region_name=Config.S3_REGION,
+                    endpoint_url=Config.S3_ENDPOINT_URL,
+                    # Retries are done by utils.resilience (backoff, deadlines, breaker), not botocore
+                    config=BotoConfig(
+                        connect_timeout=Config.S3_CONNECT_TIMEOUT_SECONDS,
+                        read_timeout=Config.S3_READ_TIMEOUT_SECONDS,
+                        max_pool_connections=Config.S3_MAX_POOL_CONNECTIONS,
+                        retries={'total_max_attempts': 1}
+                    )
+                )
+                if Config.ADMISSION_CONTROL_ENABLED:
+                    # Every S3 API call spends a token from the process-wide storage budget
+                    from utils.admission import pace_storage_call
+                    _client.meta.events.register('before-call.s3', pace_storage_call)
+    return _client
+
+_executor = None
+
+def get_io_executor():
+    """Shared thread pool for concurrent S3 requests (boto3 clients are thread-safe)."""
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.S3_IO_THREADS, thread_name_prefix="s3-io")
+    return _executor
+
+def submit_io(fn, *args):
+    """Runs fn on the I/O pool inside a copy of the caller's context, so metrics and trace spans keep the request."""
+    return get_io_executor().submit(contextvars.copy_context().run, fn, *args)
 
 class S3Manager:
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            region_name=Config.S3_REGION
-        )
+        self.s3_client = get_s3_client()
         self.bucket_name = Config.S3_BUCKET_NAME
 
+    def _call(self, operation, **params):
+        """Runs one S3 API operation on this bucket with retries and the circuit breaker."""
+        return storage_call(operation, getattr(self.s3_client, operation), Bucket=self.bucket_name, **params)
+
+    def _get_body(self, **params):
+        """GET + body read as one retried unit (a dropped stream is retried too). Returns (etag, bytes)."""
+        def get():
+            response = self.s3_client.get_object(Bucket=self.bucket_name, **params)
+            return response.get('ETag'), response['Body'].read()
+        return storage_call("get_object", get)
+
+    def _iter_pages(self, prefix):
+        """Yields the object lists of every listing page under prefix. Each page request is retried."""
+        params = {'Prefix': prefix}
+        while True:
+            page = self._call('list_objects_v2', **params)
+            yield page.get('Contents', [])
+            if not page.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = page['NextContinuationToken']
+
+    def _list_level(self, prefix):
+        """One delimited listing (all pages): (objects directly under prefix, sub-prefixes)."""
+        objects, subprefixes = [], []
+        params = {'Prefix': prefix, 'Delimiter': '/'}
+        while True:
+            page = self._call('list_objects_v2', **params)
+            objects.extend(page.get('Contents', []))
+            subprefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+            if not page.get('IsTruncated'):
+                return objects, subprefixes
+            params['ContinuationToken'] = page['NextContinuationToken']
+
+    def _objects_under(self, prefix, skip=(), dedupe=True):
+        """
+        Every object (listing entry) under prefix, in key order. Sharded
+        prefixes are listed one folder level at a time with all sub-prefixes
+        of a level (the shards, used/, ...) listed concurrently on the I/O
+        pool. Only this thread waits, so pool threads never block on each
+        other. Sub-folders ending in one of `skip` are not descended into.
+
+        During a migration a sharded prefix can still hold flat copies of
+        the same files; with `dedupe` those are left out.
+        """
+        if not is_sharded(prefix):
+            objects = []
+            for contents in self._iter_pages(prefix):
+                objects.extend(contents)
+            return objects
+
+        objects, level, top = [], [prefix], None
+        while level:
+            futures = [submit_io(self._list_level, p) for p in level]
+            level = []
+            for future in futures:
+                found, subprefixes = future.result()
+                if top is None:
+                    top = found
+                else:
+                    objects.extend(found)
+                level.extend(p for p in subprefixes if not p.endswith(skip))
+        if dedupe:
+            sharded_names = {name for name in (filename_in(prefix, o['Key']) for o in objects) if name}
+            top = [o for o in top if o['Key'][len(prefix):] not in sharded_names]
+        objects.extend(top)
+        objects.sort(key=lambda o: o['Key'])
+        return objects
+
+    def _keys_under(self, prefix, skip=(), dedupe=True):
+        """The keys of _objects_under()."""
+        return [o['Key'] for o in self._objects_under(prefix, skip=skip, dedupe=dedupe)]
+
+    @instrument("s3.upload_file", bytes_fn=file_size_arg(1), is_error=_failed)
     def upload_file(self, file_path, s3_key):
         """Uploads a file from local path to S3."""
         try:
-            self.s3_client.upload_file(file_path, self.bucket_name, s3_key)
+            storage_call("upload_file", self.s3_client.upload_file, file_path, self.bucket_name, s3_key)
             return True
         except Exception as e:
             print(f"❌ S3 Error uploading file {file_path} to {s3_key}: {e}")
@@ -23,20 +181,30 @@ class S3Manager:
             traceback.print_exc()
             return False
 
+    @instrument("s3.upload_fileobj", is_error=_failed)
     def upload_fileobj(self, file_obj, s3_key):
         """Uploads a file object (like a Flask file storage object) to S3."""
         try:
-            self.s3_client.upload_fileobj(file_obj, self.bucket_name, s3_key)
+            if not (hasattr(file_obj, 'seekable') and file_obj.seekable()):
+                # Buffer it so a retry can re-send from the start
+                file_obj = io.BytesIO(file_obj.read())
+            start = file_obj.tell()
+
+            def upload():
+                file_obj.seek(start)
+                self.s3_client.upload_fileobj(file_obj, self.bucket_name, s3_key)
+            storage_call("upload_fileobj", upload)
             return True
         except Exception as e:
             print(f"Error uploading file object to {s3_key}: {e}")
             return False
 
+    @instrument("s3.upload_string", bytes_fn=_string_size, is_error=_failed)
     def upload_string(self, content, s3_key):
         """Uploads a string content to S3."""
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
+            self._call(
+                'put_object',
                 Key=s3_key,
                 Body=content.encode("utf-8"),
                 ContentType="text/plain; charset=utf-8"
@@ -46,10 +214,43 @@ class S3Manager:
             print(f"Error uploading string to {s3_key}: {e}")
             return False
             
+    @instrument("s3.upload_bytes", bytes_fn=_bytes_size, is_error=_failed)
+    def upload_bytes(self, content, s3_key, content_type="application/octet-stream"):
+        """Uploads raw bytes to S3."""
+        try:
+            self._call(
+                'put_object',
+                Key=s3_key,
+                Body=content,
+                ContentType=content_type
+            )
+            return True
+        except Exception as e:
+            print(f"Error uploading bytes to {s3_key}: {e}")
+            return False
+
+    @instrument("s3.presign_put", is_error=_missing)
+    def generate_presigned_put_url(self, s3_key, content_type, expires_in=None):
+        """Returns a presigned URL the browser can PUT the object to directly."""
+        try:
+            return self.s3_client.generate_presigned_url(
+                'put_object',
+                Params={
+                    'Bucket': self.bucket_name,
+                    'Key': s3_key,
+                    'ContentType': content_type
+                },
+                ExpiresIn=expires_in or Config.PRESIGNED_URL_EXPIRY
+            )
+        except Exception as e:
+            print(f"❌ S3 Error generating presigned URL for {s3_key}: {e}")
+            return None
+
+    @instrument("s3.list_files")
     def list_files(self, prefix):
         """List files in a given prefix."""
         try:
-            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
+            response = self._call('list_objects_v2', Prefix=prefix)
             if 'Contents' in response:
                 return [f['Key'] for f in response['Contents']]
             return []
@@ -57,6 +258,7 @@ class S3Manager:
             print(f"Error listing files in {prefix}: {e}")
             return []
 
+    @instrument("s3.export_db_to_csv", is_error=_failed)
     def export_db_to_csv(self, db_path, s3_key, query="SELECT * FROM prompts"):
         """Reads a SQLite DB and exports query results to S3 as CSV."""
         import sqlite3
@@ -76,119 +278,405 @@ class S3Manager:
             print(f"Error exporting DB {db_path} to {s3_key}: {e}")
             return False
 
+    @instrument("s3.get_object_with_etag")
+    def get_object_with_etag(self, s3_key):
+        """Returns (bytes, etag), or (None, None) if the object does not exist."""
+        try:
+            etag, body = self._get_body(Key=s3_key)
+            return body, etag
+        except Exception as e:
+            code = (getattr(e, 'response', {}) or {}).get('Error', {}).get('Code')
+            if code not in ('NoSuchKey', '404'):
+                print(f"❌ S3 Error reading {s3_key}: {e}")
+                raise
+            return None, None
+
+    @instrument("s3.put_object_if_match")
+    def put_object_if_match(self, s3_key, body, etag):
+        """
+        Compare-and-swap write: only succeeds if the object still has `etag`
+        (or does not exist yet when etag is None). Returns the new ETag, or
+        None if another writer got there first.
+        """
+        params = {'Key': s3_key, 'Body': body, 'ContentType': 'application/json'}
+        if etag:
+            params['IfMatch'] = etag
+        else:
+            params['IfNoneMatch'] = '*'
+        try:
+            return self._call('put_object', **params).get('ETag') or True
+        except Exception as e:
+            code = (getattr(e, 'response', {}) or {}).get('Error', {}).get('Code')
+            if code in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                return None
+            print(f"❌ S3 Error writing {s3_key}: {e}")
+            return None
+
+    @instrument("s3.list_all_keys")
+    def list_all_keys(self, prefix, dedupe=True):
+        """
+        Returns every key under a prefix (all pages, including sub-folders).
+        Raises StorageUnavailable instead of returning a misleading empty list.
+        `dedupe=False` keeps flat leftovers next to their sharded copies.
+        """
+        try:
+            return self._keys_under(prefix, dedupe=dedupe)
+        except Exception as e:
+            print(f"Error listing all keys in {prefix}: {e}")
+            raise _unavailable(e)
+
+    @instrument("s3.list_all_objects")
+    def list_all_objects(self, prefix):
+        """
+        Like list_all_keys, but returns (key, last_modified) pairs, the time as
+        epoch seconds. Raises StorageUnavailable instead of an empty list.
+        """
+        try:
+            return [(o['Key'], o['LastModified'].timestamp()) for o in self._objects_under(prefix)]
+        except Exception as e:
+            print(f"Error listing all objects in {prefix}: {e}")
+            raise _unavailable(e)
+
+    @instrument("s3.count_files")
     def count_files(self, prefix):
-        """Counts the number of objects with a given prefix."""
+        """
+        Counts the number of objects with a given prefix.
+        Raises StorageUnavailable instead of reporting 0 when S3 fails.
+        """
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
+            if is_sharded(prefix):
+                return len(self._keys_under(prefix))
             count = 0
-            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
-                if 'Contents' in page:
-                    count += len(page['Contents'])
+            for contents in self._iter_pages(prefix):
+                count += len(contents)
             return count
         except Exception as e:
             print(f"❌ S3 Error counting files with prefix '{prefix}': {e}")
-            import traceback
-            traceback.print_exc()
-            return 0
+            raise _unavailable(e)
 
+    @instrument("s3.read_file", bytes_fn=_read_size, is_error=_missing)
     def read_file(self, s3_key):
         """Reads a file from S3 and returns its content as a string."""
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
-            return response['Body'].read().decode('utf-8')
+            return self._get_body(Key=s3_key)[1].decode('utf-8')
         except Exception as e:
             print(f"❌ S3 Error reading file {s3_key}: {e}")
             return None
 
+    @instrument("s3.read_bytes", bytes_fn=_bytes_read_size, is_error=_missing)
+    def read_bytes(self, s3_key):
+        """Reads a file from S3 and returns its raw bytes."""
+        try:
+            return self._get_body(Key=s3_key)[1]
+        except Exception as e:
+            print(f"❌ S3 Error reading file {s3_key}: {e}")
+            return None
+
+    @instrument("s3.delete_file", is_error=_failed)
+    def delete_file(self, s3_key):
+        """Deletes a single object."""
+        try:
+            self._call('delete_object', Key=s3_key)
+            return True
+        except Exception as e:
+            print(f"❌ S3 Error deleting {s3_key}: {e}")
+            return False
+
+    def _fetch_if_changed(self, s3_key, etag):
+        """Conditional GET for the prompt cache: (etag, text), or None on 304."""
+        params = {'Key': s3_key}
+        if etag:
+            params['IfNoneMatch'] = etag
+        try:
+            new_etag, body = self._get_body(**params)
+            return new_etag, body.decode('utf-8')
+        except Exception as e:
+            error = getattr(e, 'response', {}) or {}
+            if error.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304 or \
+                    error.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                return None
+            print(f"❌ S3 Error reading prompt {s3_key}: {e}")
+            return None, None
+
+    @instrument("s3.read_prompt", is_error=_missing)
+    def read_prompt(self, s3_key):
+        """Reads an (immutable) prompt text through the two-tier prompt cache."""
+        return prompt_cache.get(s3_key, self._fetch_if_changed)
+
+    @instrument("s3.move_file", is_error=_failed)
     def move_file(self, source_key, dest_key):
         """Moves a file from source_key to dest_key (Copy + Delete)."""
         try:
+            prompt_cache.invalidate(source_key)
             # Copy
             copy_source = {'Bucket': self.bucket_name, 'Key': source_key}
-            self.s3_client.copy_object(CopySource=copy_source, Bucket=self.bucket_name, Key=dest_key)
+            self._call('copy_object', CopySource=copy_source, Key=dest_key)
             # Delete
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=source_key)
+            self._call('delete_object', Key=source_key)
             return True
         except Exception as e:
             print(f"Error moving file {source_key} to {dest_key}: {e}")
             return False
 
+    @instrument("s3.get_all_file_keys")
     def get_all_file_keys(self, prefix):
         """Returns a list of all file keys in a prefix, EXCLUDING sub-folders (inprogress/used)."""
         keys = []
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        key = obj['Key']
-                        # Filter out 'inprogress/' and 'used/' if they are sub-folders of this prefix
-                        # Logic: If the key contains the prefix + "inprogress/" or "used/", skip it.
-                        if "inprogress/" in key or "used/" in key:
-                            continue
-                        # Also ensure it's not the directory itself (if created empty)
-                        if key.endswith('/'):
-                            continue
-                        keys.append(key)
+            # Sharded listings do not descend into the sub-folders at all
+            for key in self._keys_under(prefix, skip=("inprogress/", "used/")):
+                # Filter out 'inprogress/' and 'used/' if they are sub-folders of this prefix
+                # Logic: If the key contains the prefix + "inprogress/" or "used/", skip it.
+                if "inprogress/" in key or "used/" in key:
+                    continue
+                # Also ensure it's not the directory itself (if created empty)
+                if key.endswith('/'):
+                    continue
+                keys.append(key)
             return keys
         except Exception as e:
+            # An outage must not look like "no prompts left"
             print(f"Error listing all files in {prefix}: {e}")
-            return []
+            raise _unavailable(e)
 
+    @instrument("s3.check_file_exists")
     def check_file_exists(self, key):
-        """Checks if a file exists in S3 without downloading it."""
+        """
+        Checks if a file exists in S3 without downloading it.
+        Only a 404 (or a 403, see S3_HEAD_403_AS_MISSING) means "no"; other
+        errors raise StorageUnavailable.
+        """
         try:
-            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            self._call('head_object', Key=key)
             return True
-        except:
-            return False
+        except Exception as e:
+            if classify(e) == NOT_FOUND:
+                return False
+            if Config.S3_HEAD_403_AS_MISSING and _error_code(e) in ("403", "AccessDenied", "Forbidden"):
+                return False
+            raise _unavailable(e)
+
+    def object_size(self, key):
+        """Size in bytes of an object, or None if it does not exist (same rules as check_file_exists)."""
+        try:
+            return self._call('head_object', Key=key).get('ContentLength', 0)
+        except Exception as e:
+            if classify(e) == NOT_FOUND:
+                return None
+            if Config.S3_HEAD_403_AS_MISSING and _error_code(e) in ("403", "AccessDenied", "Forbidden"):
+                return None
+            raise _unavailable(e)
 
+    def is_prompt_used(self, used_prefix, filename):
+        """
+        True if the prompt's used/ marker exists. While S3_KEY_LAYOUT_MIGRATING
+        is set, a marker still at the other layout's key counts too: the app
+        on the old layout may have retired the prompt after it was copied.
+        """
+        if self.check_file_exists(object_key(used_prefix, filename)):
+            return True
+        if Config.S3_KEY_LAYOUT_MIGRATING and used_prefix in sharded_prefixes():
+            other = "flat" if is_sharded(used_prefix) else "sharded"
+            return self.check_file_exists(object_key(used_prefix, filename, layout=other))
+        return False
+
+    @instrument("s3.get_random_file_from_prefix")
     def get_random_file_from_prefix(self, prefix, lock=False):
         """
-        Pick a random text file from the prefix.
+        Pick the next text file from this worker's prompt partition.
         Ensures the prompt is NOT in the 'used/' folder (Duplicate Check).
         Default is False (as per simplified lifecycle).
         Returns: (new_key, content)
         """
-        import random
-        keys = self.get_all_file_keys(prefix)
+        keys = prompt_listing.keys(prefix, self.get_all_file_keys)
         # Filter for text files only
         txt_keys = [k for k in keys if k.lower().endswith('.txt')]
         
         if not txt_keys:
             return None, None
-            
-        # Try to find a unique unsed prompt
-        for _ in range(20): # Try 20 times to find a non-duplicate
-            selected_key = random.choice(txt_keys)
-            
-            # Construct the theoretical 'used' key
-            # prefix: "prompts/standard/"
-            # selected_key: "prompts/standard/UOH_123.txt"
+
+        # Determine correct used folder based on prefix
+        if "tribal" in prefix:
+             used_prefix = Config.S3_PROMPTS_TRIBAL_USED
+        else:
+             used_prefix = Config.S3_PROMPTS_STANDARD_USED
+
+        bitmap = self.used_bitmap(prefix, txt_keys)
+
+        # Walk this worker's partition in allocation order (no random retries).
+        # Each candidate is reserved as it is taken, so concurrent requests
+        # skip it; used ones stay reserved and are not offered again.
+        while True:
+            ordered = prompt_allocator.order(prefix, txt_keys, reserve=1)
+            if not ordered:
+                return None, None
+            selected_key = ordered[0]
             filename = os.path.basename(selected_key)
-            
-            # Determine correct used folder based on prefix
-            if "tribal" in prefix:
-                 used_prefix = Config.S3_PROMPTS_TRIBAL_USED
+
+            # CHECK: If this file is already used? (bitmap lookup, or HEAD on the used folder)
+            if bitmap is not None:
+                is_used = bitmap.is_used(filename)
             else:
-                 used_prefix = Config.S3_PROMPTS_STANDARD_USED
-                 
-            used_key = used_prefix + filename
-            
-            # CHECK: If this file is already in the used folder?
-            if self.check_file_exists(used_key):
+                is_used = self.is_prompt_used(used_prefix, filename)
+            if is_used:
                 print(f"⚠️ Prompt {filename} is marked as USED (Duplicate found). Skipping...")
-                # Optional: self.delete_file(selected_key) ?
-                # For now, just skip.
-                # Remove from local list so we don't pick it again in this loop
-                if selected_key in txt_keys:
-                    txt_keys.remove(selected_key)
-                if not txt_keys:
-                    return None, None
                 continue
-            
-            # Found a unique one!
-            content = self.read_file(selected_key)
+
+            content = self.read_prompt(selected_key)
             return selected_key, content
-            
-        return None, None
+
+    def used_bitmap(self, prefix, keys=()):
+        """
+        The used-prompt bitmap for the prefix's pool, or None in folder mode
+        (or if it is unavailable). Prompt `keys` missing from its index are
+        added to it first.
+        """
+        if Config.USED_STATE_BACKEND != "bitmap":
+            return None
+        pool = pool_for_prefix(prefix)
+        if keys:
+            bitmap = used_bitmaps.index_names(self, pool, [os.path.basename(k) for k in keys])
+            if bitmap is not None:
+                return bitmap
+        return used_bitmaps.get(self, pool)
+
+    @staticmethod
+    def _is_clean_pair(futures):
+        """True once every request of a candidate has finished and none disqualifies it."""
+        if any(f.cancelled() or f.exception() is not None for f in futures.values()):
+            return False
+        if "used" in futures and (futures["used"].result() or futures["en_used"].result()):
+            return False
+        return bool(futures["text"].result())
+
+    @instrument("s3.find_clean_prompt_pair")
+    def find_clean_prompt_pair(self, prefix, en_prefix, used_prefix, en_used_prefix, user_info=None, exclude=()):
+        """
+        Picks the next prompt whose Telugu and English versions are both unused.
+
+        For each candidate the four independent requests (HEAD on both used/
+        keys, GET of both texts) are issued concurrently, and several
+        candidates are evaluated in parallel. The first clean pair wins and
+        the outstanding requests of the other candidates are cancelled.
+
+        Candidates come from the weighted selector (PROMPT_SELECTION=weighted,
+        using the speaker's `user_info`) or from this worker's prompt
+        partition. Keys in `exclude` (already recorded this session) are skipped.
+        With USED_STATE_BACKEND=bitmap, used prompts are filtered out in memory
+        and only the two GETs per candidate remain.
+
+        Returns (status, s3_key, text, english_text) where status is
+        "ok", "empty" (no unused prompts left) or "exhausted" (gave up).
+        """
+        txt_keys = [k for k in prompt_listing.keys(prefix, self.get_all_file_keys)
+                    if k.lower().endswith('.txt') and k not in exclude]
+        bitmap = self.used_bitmap(prefix, txt_keys)
+        if bitmap is not None:
+            # The whole used set is in memory: filter up front, no HEADs needed
+            txt_keys = [k for k in txt_keys if not bitmap.is_used(os.path.basename(k))]
+        if not txt_keys:
+            return "empty", None, None, None
+
+        batch_size = Config.PROMPT_FANOUT_CANDIDATES
+        if Config.PROMPT_SELECTION != "weighted":
+            # Candidates come from this worker's partition, so concurrent
+            # workers almost never race for the same prompt. Each batch is
+            # reserved as it is taken; the losers are released at the end.
+            if not prompt_allocator.order(prefix, txt_keys):
+                # Everything left is already handed out to running sessions
+                return "exhausted", None, None, None
+            ordered = None
+        else:
+            ordered = iter(weighted_selector.order(prefix, txt_keys, user_info or {}))
+
+        reserved = []
+        try:
+            return self._fanout_clean_pair(prefix, en_prefix, used_prefix, en_used_prefix,
+                                           txt_keys, ordered, bitmap, batch_size, reserved)
+        finally:
+            if reserved:
+                prompt_allocator.release(*reserved)
+
+    def _fanout_clean_pair(self, prefix, en_prefix, used_prefix, en_used_prefix,
+                           txt_keys, ordered, bitmap, batch_size, reserved):
+        """The candidate rounds of find_clean_prompt_pair. `reserved` collects partition keys to give back."""
+        used_seen = set()
+        for _ in range(Config.PROMPT_FANOUT_MAX_ROUNDS):
+            if ordered is None:
+                batch = prompt_allocator.order(prefix, txt_keys, reserve=batch_size)[:batch_size]
+                reserved.extend(batch)
+            else:
+                batch = list(islice(ordered, batch_size))
+            if not batch:
+                if ordered is None:
+                    # Only this worker's reservations are used up; decided below
+                    break
+                return "empty", None, None, None
+            candidates = {}
+            pending = {}
+            for key in batch:
+                filename = os.path.basename(key)
+                futures = {
+                    "text": submit_io(self.read_prompt, key),
+                    "en_text": submit_io(self.read_prompt, object_key(en_prefix, filename)),
+                }
+                if bitmap is None:
+                    futures["used"] = submit_io(self.is_prompt_used, used_prefix, filename)
+                    futures["en_used"] = submit_io(self.is_prompt_used, en_used_prefix, filename)
+                candidates[key] = futures
+                for future in futures.values():
+                    pending[future] = key
+
+            winner = None
+            while pending and winner is None:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future, None)
+                    futures = candidates.get(key)
+                    if futures is None:
+                        # Belongs to a candidate dropped earlier in this loop
+                        continue
+
+                    if isinstance(future.exception(), StorageUnavailable):
+                        # Storage is down, not this candidate: let the route answer 503
+                        for other in pending:
+                            other.cancel()
+                        raise future.exception()
+                    if future.exception() is None and not future.result() and future is futures["text"]:
+                        failed = True
+                    elif future.exception() is None and future.result() and future in (futures.get("used"), futures.get("en_used")):
+                        print(f"⚠️ Prompt {os.path.basename(key)} is marked as USED (Duplicate found). Skipping...")
+                        used_seen.add(key)
+                        failed = True
+                    else:
+                        failed = future.exception() is not None
+
+                    if failed:
+                        # Drop this candidate and stop waiting on its other requests
+                        for other in candidates.pop(key).values():
+                            other.cancel()
+                            pending.pop(other, None)
+                    elif all(f.done() for f in futures.values()) and self._is_clean_pair(futures):
+                        winner = key
+                        break
+
+            if winner is not None:
+                # Cancel the losers; requests already in flight just finish in the background
+                for future in pending:
+                    future.cancel()
+                # The winner stays reserved; used prompts stay reserved so they are not offered again
+                if ordered is None:
+                    reserved[:] = [k for k in reserved if k != winner and k not in used_seen]
+                futures = candidates[winner]
+                return "ok", winner, futures["text"].result(), futures["en_text"].result() or ""
+
+        if ordered is None:
+            prompt_allocator.release(*[k for k in reserved if k not in used_seen])
+            reserved.clear()
+            # Keys handed out to other sessions (in any partition) may still
+            # come back; only "empty" once every key turned out to be used
+            if used_seen.issuperset(txt_keys):
+                return "empty", None, None, None
+        elif next(ordered, None) is None:
+            return "empty", None, None, None
+        return "exhausted", None, None, None
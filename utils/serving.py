@@ -0,0 +1,78 @@
+import time
+from config import Config
+
+
+def warm_up(app):
+    """
+    Runs once in the gunicorn master (preload_app) before workers fork, so
+    every worker starts with the expensive one-off work already done and
+    shares the results copy-on-write:
+
+    - parses the botocore service models (the bulk of creating an S3 client)
+    - compiles all Jinja templates
+    - indexes staged uploads left over from before the upload spool index
+    - loads the prompt key listings and prompt texts into the prompt cache
+      (memory + /tmp), and the used-prompt bitmaps in bitmap mode
+
+    Failures are logged and ignored; workers then just warm lazily.
+    """
+    start = time.perf_counter()
+
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            print(f"⚠️ Warm-up: could not compile template {name}: {e}")
+
+    from utils.upload_spool import upload_spool
+    try:
+        upload_spool.adopt(Config.UPLOAD_AUDIO_DIR, Config.UPLOAD_TRANSCRIPTION_DIR,
+                           Config.TRIBAL_AUDIO_DIR, Config.TRIBAL_TRANSCRIPTION_DIR)
+        from utils.chunk_utils import ChunkSpool
+        upload_spool.adopt(*ChunkSpool().upload_dirs(), category="chunks", suffix=".part")
+        upload_spool.maybe_sweep()
+    except Exception as e:
+        print(f"⚠️ Warm-up: could not index the upload spool: {e}")
+
+    if not Config.S3_BUCKET_NAME:
+        print("⚠️ Warm-up: S3_BUCKET_NAME not set, skipping storage warm-up")
+        return
+
+    from utils.s3_utils import S3Manager, submit_io
+    from utils.key_layout import object_key
+    from utils.prompt_listing import prompt_listing
+    try:
+        s3 = S3Manager()
+        warmed = 0
+        for prefix, en_prefix in [
+            (Config.S3_PROMPTS_STANDARD_PREFIX, Config.S3_PROMPTS_STANDARD_ENGLISH_PREFIX),
+            (Config.S3_PROMPTS_TRIBAL_PREFIX, Config.S3_PROMPTS_TRIBAL_ENGLISH_PREFIX),
+        ]:
+            keys = [k for k in prompt_listing.keys(prefix, s3.get_all_file_keys) if k.lower().endswith('.txt')]
+            s3.used_bitmap(prefix, keys)
+            keys = keys[:Config.WARMUP_PROMPT_LIMIT]
+            futures = [submit_io(s3.read_prompt, key) for key in keys]
+            futures += [submit_io(s3.read_prompt, object_key(en_prefix, key.rsplit("/", 1)[-1])) for key in keys]
+            for future in futures:
+                if future.result():
+                    warmed += 1
+        print(f"🔥 Warm-up: {warmed} prompt texts cached in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"⚠️ Warm-up: storage warm-up failed, continuing cold: {e}")
+
+
+def after_fork():
+    """
+    Resets per-process state that must not be shared with the master:
+    pooled S3 connections, the I/O thread pool (threads do not survive
+    fork), the claimed prompt partition and the master's warm-up metrics.
+    The parsed service models stay cached, so the worker's client is cheap.
+    """
+    import utils.s3_utils as s3_utils
+    from utils.prompt_allocator import prompt_allocator
+    from utils.metrics_utils import registry
+
+    s3_utils._client = None
+    s3_utils._executor = None
+    prompt_allocator.reset_after_fork()
+    registry.reset()
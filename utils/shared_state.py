@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+
+class SharedState:
+    """
+    Small key/value store for state that every worker should see once
+    rather than rebuild per process: caches, counters and rate limits.
+
+    Values are anything JSON-serialisable. `ttl` is in seconds; a key with
+    a TTL disappears once it expires. Implementations:
+
+    - InProcessState: a dict, for a single process (and tests)
+    - SQLiteState: a WAL-mode SQLite file (reads memory-mapped) shared by
+      the workers on one host
+    - RedisState: any Redis-protocol server, shared across hosts
+    """
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Sets `key` only if it does not exist. Returns True if it was set."""
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, ttl=None):
+        """Adds `amount` (creating the key at 0, with `ttl`) and returns the new value."""
+        raise NotImplementedError
+
+    def cas(self, key, expected, value, ttl=None):
+        """Sets `key` to `value` only if it currently holds `expected` (None: does not exist)."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+def _dump(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+
+class InProcessState(SharedState):
+    def __init__(self):
+        self._data = {}  # key -> (json, expires_at or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiry(ttl, now):
+        return now + ttl if ttl else None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+        return json.loads(entry[0]) if entry else default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._data[key] = (_dump(value), self._expiry(ttl, now))
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._data[key] = (_dump(value), self._expiry(ttl, now))
+            return True
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                entry = ("0", self._expiry(ttl, now))
+            value = json.loads(entry[0]) + amount
+            self._data[key] = (_dump(value), entry[1])
+            return value
+
+    def cas(self, key, expected, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            current = entry[0] if entry else None
+            if current != (None if expected is None else _dump(expected)):
+                return False
+            self._data[key] = (_dump(value), self._expiry(ttl, now))
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteState(SharedState):
+    """
+    Every operation is one short transaction; writes take the database's
+    write lock (BEGIN IMMEDIATE), so add/incr/cas are atomic across
+    processes. Expired rows are ignored on read and purged now and then.
+    """
+
+    PURGE_SECONDS = 60
+
+    def __init__(self, path=None):
+        self.path = path or Config.SHARED_STATE_DB_PATH
+        # Per thread: conn, the pid that opened it and the last purge time
+        self._local = threading.local()
+
+    def _conn(self):
+        # One connection per thread, reopened after fork: the forking
+        # thread's copy still holds the parent's connection and pid
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=67108864")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.last_purge = 0.0
+        return conn
+
+    @staticmethod
+    def _expiry(ttl, now):
+        return now + ttl if ttl else None
+
+    def _read(self, conn, key, now):
+        row = conn.execute("SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                           (key, now)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, fn):
+        """Runs fn(conn, now) inside a write transaction and returns its result."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, now)
+            if now - self._local.last_purge > self.PURGE_SECONDS:
+                self._local.last_purge = now
+                conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (now,))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _put(self, conn, key, value, expires):
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, expires))
+
+    def get(self, key, default=None):
+        raw = self._read(self._conn(), key, time.time())
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key, value, ttl=None):
+        self._write(lambda conn, now: self._put(conn, key, _dump(value), self._expiry(ttl, now)))
+
+    def add(self, key, value, ttl=None):
+        def op(conn, now):
+            if self._read(conn, key, now) is not None:
+                return False
+            self._put(conn, key, _dump(value), self._expiry(ttl, now))
+            return True
+        return self._write(op)
+
+    def incr(self, key, amount=1, ttl=None):
+        def op(conn, now):
+            row = conn.execute("SELECT value, expires FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                               (key, now)).fetchone()
+            value, expires = (json.loads(row[0]), row[1]) if row else (0, self._expiry(ttl, now))
+            value += amount
+            self._put(conn, key, _dump(value), expires)
+            return value
+        return self._write(op)
+
+    def cas(self, key, expected, value, ttl=None):
+        def op(conn, now):
+            if self._read(conn, key, now) != (None if expected is None else _dump(expected)):
+                return False
+            self._put(conn, key, _dump(value), self._expiry(ttl, now))
+            return True
+        return self._write(op)
+
+    def delete(self, key):
+        self._write(lambda conn, now: conn.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+
+class RedisState(SharedState):
+    """
+    Redis-protocol backend (Redis, Valkey, KeyDB, ...). Needs
+    `pip install redis`; the client is created on first use and keeps
+    its own connection pool (fork-safe).
+    """
+
+    def __init__(self, url=None, prefix="uoh:"):
+        self.url = url or Config.SHARED_STATE_URL
+        self.prefix = prefix
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _redis(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    self._client = redis.Redis.from_url(self.url, socket_timeout=2, socket_connect_timeout=2)
+        return self._client
+
+    @staticmethod
+    def _px(ttl):
+        return int(ttl * 1000) if ttl else None
+
+    def get(self, key, default=None):
+        raw = self._redis().get(self.prefix + key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key, value, ttl=None):
+        self._redis().set(self.prefix + key, _dump(value), px=self._px(ttl))
+
+    def add(self, key, value, ttl=None):
+        return bool(self._redis().set(self.prefix + key, _dump(value), px=self._px(ttl), nx=True))
+
+    def incr(self, key, amount=1, ttl=None):
+        client = self._redis()
+        if isinstance(amount, float):
+            value = client.incrbyfloat(self.prefix + key, amount)
+        else:
+            value = client.incrby(self.prefix + key, amount)
+        if ttl and value == amount:
+            # First increment created the key
+            client.pexpire(self.prefix + key, self._px(ttl))
+        return value
+
+    def cas(self, key, expected, value, ttl=None):
+        from redis.exceptions import WatchError
+        full_key = self.prefix + key
+        with self._redis().pipeline() as pipe:
+            try:
+                pipe.watch(full_key)
+                current = pipe.get(full_key)
+                if current != (None if expected is None else _dump(expected).encode("utf-8")):
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.set(full_key, _dump(value), px=self._px(ttl))
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def delete(self, key):
+        self._redis().delete(self.prefix + key)
+
+
+def create_shared_state(backend=None):
+    backend = backend or Config.SHARED_STATE_BACKEND
+    if backend == "redis":
+        return RedisState()
+    if backend == "memory":
+        return InProcessState()
+    return SQLiteState()
+
+
+shared_state = create_shared_state()
@@ -0,0 +1,92 @@
+import json
+import mimetypes
+import os
+from flask import request, send_from_directory
+
+# Fingerprinted files never change under the same name
+MAX_AGE = 365 * 24 * 3600
+IMMUTABLE = f"public, max-age={MAX_AGE}, immutable"
+
+
+class AssetManifest:
+    """
+    The static/dist/manifest.json written by scripts/build_assets.py:
+    logical name ("style.css") -> fingerprinted file and its variants.
+    Empty when the assets have not been built, in which case the plain
+    static files are served as before.
+    """
+
+    def __init__(self, static_dir):
+        self.dist_dir = os.path.join(static_dir, "dist")
+        self.assets = {}
+        self.by_path = {}
+        path = os.path.join(self.dist_dir, "manifest.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.assets = json.load(f).get("assets", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable asset manifest {path}: {e}")
+            return
+        # dist-relative path ("style.1a2b3c4d5e.css") -> manifest entry
+        self.by_path = {entry["path"][len("dist/"):]: entry for entry in self.assets.values()}
+
+    def resolve(self, filename):
+        entry = self.assets.get(filename)
+        return entry["path"] if entry else filename
+
+
+def _negotiate(entry, filename):
+    """Picks the variant to send: (file under dist/, Content-Encoding or None, mimetype or None)."""
+    # Only an explicit image/webp counts; "*/*" is sent by browsers without WebP too
+    if entry.get("webp") and any(value == "image/webp" and q > 0 for value, q in request.accept_mimetypes):
+        return entry["webp"][len("dist/"):], None, "image/webp"
+    # Honour q-values ("br;q=0" rules brotli out); on a tie brotli wins
+    best = None
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        q = request.accept_encodings.quality(encoding) if encoding in entry["encodings"] else 0
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, encoding, suffix)
+    if best:
+        return filename + best[2], best[1], None
+    return filename, None, None
+
+
+def init_static_assets(app):
+    """
+    Rewrites url_for('static', filename=...) to the fingerprinted build
+    output, and serves /static/dist/ with immutable cache headers,
+    negotiating brotli/gzip and WebP variants.
+    """
+    manifest = AssetManifest(app.static_folder)
+    app.extensions["asset_manifest"] = manifest
+    if not manifest.assets:
+        if not app.debug:
+            print("⚠️ Static assets not built (python scripts/build_assets.py); serving them uncached")
+        return
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = manifest.resolve(values["filename"])
+
+    def serve_dist(filename):
+        entry = manifest.by_path.get(filename)
+        if entry is None:
+            # WebP variants requested directly, or a file a newer build dropped
+            response = send_from_directory(manifest.dist_dir, filename, max_age=MAX_AGE)
+        else:
+            variant, encoding, mimetype = _negotiate(entry, filename)
+            response = send_from_directory(manifest.dist_dir, variant, max_age=MAX_AGE,
+                                           mimetype=mimetype or mimetypes.guess_type(filename)[0])
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            if entry.get("webp"):
+                response.vary.add("Accept")
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+    app.add_url_rule(f"{app.static_url_path}/dist/<path:filename>", endpoint="static_dist", view_func=serve_dist)
+
@@ -0,0 +1,137 @@
+import contextvars
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import g, request
+from config import Config
+
+# The innermost open span of the current request (None outside a trace)
+_current_span = contextvars.ContextVar("uoh_current_span", default=None)
+
+_slow_logger = None
+
+
+class Span:
+    __slots__ = ("name", "start", "duration_ms", "error", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.error = False
+        self.children = []
+
+    def finish(self, error=False):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        self.error = error
+
+    def to_dict(self, origin=None):
+        origin = self.start if origin is None else origin
+        data = {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration_ms or 0, 2),
+        }
+        if self.error:
+            data["error"] = True
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+def start_span(name):
+    """
+    Opens a span nested under the current one. Returns a token for end_span,
+    or None when no trace is active (so background work costs nothing).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(name)
+    parent.children.append(child)
+    return child, _current_span.set(child)
+
+
+def end_span(token, error=False):
+    if token is None:
+        return
+    child, var_token = token
+    child.finish(error)
+    _current_span.reset(var_token)
+
+
+def _get_slow_logger():
+    global _slow_logger
+    if _slow_logger is None:
+        os.makedirs(os.path.dirname(Config.SLOW_LOG_PATH), exist_ok=True)
+        handler = RotatingFileHandler(Config.SLOW_LOG_PATH,
+                                      maxBytes=Config.SLOW_LOG_MAX_BYTES,
+                                      backupCount=Config.SLOW_LOG_BACKUPS,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("uoh.slow_requests")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        _slow_logger = logger
+    return _slow_logger
+
+
+def init_tracing(app):
+    """Opens a root span per request and logs the span tree of slow requests."""
+    @app.before_request
+    def _start_trace():
+        root = Span(f"{request.method} {request.path}")
+        g.trace_root = root
+        g.trace_token = _current_span.set(root)
+
+    @app.after_request
+    def _finish_trace(response):
+        root = g.pop("trace_root", None)
+        if root is None:
+            return response
+        root.finish(response.status_code >= 500)
+        if root.duration_ms >= Config.SLOW_REQUEST_THRESHOLD_MS:
+            entry = {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "endpoint": request.endpoint,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(root.duration_ms, 2),
+                "spans": root.to_dict(),
+            }
+            try:
+                _get_slow_logger().info(json.dumps(entry, ensure_ascii=False))
+            except Exception as e:
+                print(f"⚠️ Could not write slow request log: {e}")
+        return response
+
+    @app.teardown_request
+    def _reset_trace(exc):
+        token = g.pop("trace_token", None)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                _current_span.set(None)
+
+
+def read_slow_requests(limit=50):
+    """Returns the slowest `limit` requests from the slow log and its rotated backups."""
+    paths = [Config.SLOW_LOG_PATH] + [f"{Config.SLOW_LOG_PATH}.{i}" for i in range(1, Config.SLOW_LOG_BACKUPS + 1)]
+    entries = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    entries.sort(key=lambda e: e.get("duration_ms", 0), reverse=True)
+    return entries[:limit]
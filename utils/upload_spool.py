@@ -0,0 +1,264 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import Config
+from utils.metrics_utils import instrument
+
+
+class SpoolFull(Exception):
+    """Raised when staging another file would exceed the spool quota."""
+
+
+class UploadSpool:
+    """
+    Index of the files /submit stages under BASE_UPLOAD_DIR until
+    finalize_session uploads them.
+
+    Every staged file has a row in a small SQLite file shared by all workers
+    on the host, and a per-category totals row is updated in the same
+    transaction, so stats() never walks the directories. Files are removed
+    as soon as they are uploaded (release) or once they are older than
+    SPOOL_TTL_SECONDS (sweep: abandoned sessions, failed uploads). New files
+    are refused with SpoolFull when the byte or file quota would be
+    exceeded even after expired files are evicted.
+
+    reserve() books the space in the same transaction as the quota check,
+    so concurrent requests cannot overshoot it; track() turns the
+    reservation into index rows and cancel() gives it back. Reservations
+    that are never used lapse after RESERVATION_TTL_SECONDS.
+    """
+
+    RESERVATION_TTL_SECONDS = 600
+
+    def __init__(self, db_path=None, max_bytes=None, max_files=None, ttl_seconds=None):
+        self.db_path = db_path or Config.SPOOL_INDEX_DB_PATH
+        self.max_bytes = max_bytes or Config.SPOOL_MAX_BYTES
+        self.max_files = max_files or Config.SPOOL_MAX_FILES
+        self.ttl_seconds = ttl_seconds or Config.SPOOL_TTL_SECONDS
+        self._lock = threading.Lock()
+        self._ready = False
+        self._last_sweep = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                    conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS spool_files (
+                        path TEXT PRIMARY KEY,
+                        category TEXT NOT NULL,
+                        bytes INTEGER NOT NULL,
+                        created REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_spool_files_created ON spool_files (created);
+                    CREATE TABLE IF NOT EXISTS spool_totals (
+                        category TEXT PRIMARY KEY,
+                        files INTEGER NOT NULL DEFAULT 0,
+                        bytes INTEGER NOT NULL DEFAULT 0
+                    );
+                    CREATE TABLE IF NOT EXISTS spool_reservations (
+                        token TEXT PRIMARY KEY,
+                        files INTEGER NOT NULL,
+                        bytes INTEGER NOT NULL,
+                        created REAL NOT NULL
+                    );
+                    """)
+                    self._ready = True
+        return conn
+
+    @staticmethod
+    def _totals(conn):
+        """Files and bytes in the spool plus those reserved for files being written."""
+        row = conn.execute("""
+            SELECT (SELECT COALESCE(SUM(files), 0) FROM spool_totals) + (SELECT COALESCE(SUM(files), 0) FROM spool_reservations),
+                   (SELECT COALESCE(SUM(bytes), 0) FROM spool_totals) + (SELECT COALESCE(SUM(bytes), 0) FROM spool_reservations)
+        """).fetchone()
+        return row[0], row[1]
+
+    @staticmethod
+    def _remove_rows(conn, rows):
+        """Deletes index rows (path, category, bytes) and their files. Caller commits."""
+        for path, category, size in rows:
+            cur = conn.execute("DELETE FROM spool_files WHERE path = ?", (path,))
+            if cur.rowcount:
+                conn.execute("UPDATE spool_totals SET files = files - 1, bytes = bytes - ? WHERE category = ?",
+                             (size, category))
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Could not remove spooled file {path}: {e}")
+
+    def _evict_expired(self, conn, now):
+        rows = conn.execute("SELECT path, category, bytes FROM spool_files WHERE created < ? ORDER BY created",
+                            (now - self.ttl_seconds,)).fetchall()
+        self._remove_rows(conn, rows)
+        conn.execute("DELETE FROM spool_reservations WHERE created < ?", (now - self.RESERVATION_TTL_SECONDS,))
+        return len(rows)
+
+    def _fits(self, conn, nbytes, nfiles):
+        files, size = self._totals(conn)
+        return files + nfiles <= self.max_files and size + nbytes <= self.max_bytes
+
+    @instrument("spool.reserve")
+    def reserve(self, nbytes, nfiles=1):
+        """
+        Books room for `nfiles` more files totalling `nbytes`, evicting
+        expired files first if they do not fit. Raises SpoolFull otherwise.
+        Returns the reservation token to pass to track() or cancel().
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            fits = self._fits(conn, nbytes, nfiles)
+            if not fits:
+                evicted = self._evict_expired(conn, now)
+                self._last_sweep = now
+                if evicted:
+                    print(f"🧹 Spool over quota: evicted {evicted} expired file(s)")
+                fits = self._fits(conn, nbytes, nfiles)
+            if fits:
+                conn.execute("INSERT INTO spool_reservations (token, files, bytes, created) VALUES (?, ?, ?, ?)",
+                             (token, nfiles, nbytes, now))
+            conn.commit()
+            if not fits:
+                files, size = self._totals(conn)
+                raise SpoolFull(f"Upload spool is full ({files} files, {size // (1024 * 1024)} MB)")
+            return token
+        finally:
+            conn.close()
+
+    def cancel(self, reservation):
+        """Gives back a reservation whose files were never written."""
+        if not reservation:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM spool_reservations WHERE token = ?", (reservation,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @instrument("spool.track")
+    def track(self, *paths, reservation=None, category=None):
+        """
+        Adds files that were just written to the index, grouped by their
+        staging directory (or `category`), and settles their reservation.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if reservation:
+                conn.execute("DELETE FROM spool_reservations WHERE token = ?", (reservation,))
+            for path in paths:
+                file_category = category or os.path.basename(os.path.dirname(path))
+                size = os.path.getsize(path)
+                old = conn.execute("SELECT category, bytes FROM spool_files WHERE path = ?", (path,)).fetchone()
+                if old:
+                    conn.execute("UPDATE spool_totals SET files = files - 1, bytes = bytes - ? WHERE category = ?",
+                                 (old[1], old[0]))
+                conn.execute("INSERT OR REPLACE INTO spool_files (path, category, bytes, created) VALUES (?, ?, ?, ?)",
+                             (path, file_category, size, now))
+                conn.execute("INSERT OR IGNORE INTO spool_totals (category) VALUES (?)", (file_category,))
+                conn.execute("UPDATE spool_totals SET files = files + 1, bytes = bytes + ? WHERE category = ?",
+                             (size, file_category))
+            conn.commit()
+        finally:
+            conn.close()
+        self.maybe_sweep(now)
+
+    @instrument("spool.release")
+    def release(self, *paths):
+        """Deletes files that are no longer needed (uploaded, or duplicates) and forgets them."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = []
+            for path in paths:
+                row = conn.execute("SELECT path, category, bytes FROM spool_files WHERE path = ?", (path,)).fetchone()
+                rows.append(row or (path, None, 0))
+            self._remove_rows(conn, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def adopt(self, *dirs, category=None, suffix=""):
+        """
+        Indexes files already in the staging directories that the index does
+        not know about (written before it existed), keeping their mtime so
+        they expire on schedule. One directory scan, meant for start-up.
+        Only names ending in `suffix` are indexed, under `category` if given.
+        """
+        conn = self._connect()
+        try:
+            known = {row[0] for row in conn.execute("SELECT path FROM spool_files")}
+            conn.execute("BEGIN IMMEDIATE")
+            adopted = 0
+            for upload_dir in dirs:
+                if not os.path.isdir(upload_dir):
+                    continue
+                file_category = category or os.path.basename(upload_dir)
+                conn.execute("INSERT OR IGNORE INTO spool_totals (category) VALUES (?)", (file_category,))
+                for entry in os.scandir(upload_dir):
+                    path = f"{upload_dir}/{entry.name}"
+                    if path in known or not entry.is_file() or not entry.name.endswith(suffix):
+                        continue
+                    st = entry.stat()
+                    conn.execute("INSERT INTO spool_files (path, category, bytes, created) VALUES (?, ?, ?, ?)",
+                                 (path, file_category, st.st_size, st.st_mtime))
+                    conn.execute("UPDATE spool_totals SET files = files + 1, bytes = bytes + ? WHERE category = ?",
+                                 (st.st_size, file_category))
+                    adopted += 1
+            conn.commit()
+        finally:
+            conn.close()
+        if adopted:
+            print(f"📥 Spool: indexed {adopted} previously staged file(s)")
+        return adopted
+
+    def maybe_sweep(self, now=None):
+        """Evicts expired files, at most once per SPOOL_SWEEP_SECONDS per process."""
+        now = now or time.time()
+        if now - self._last_sweep < Config.SPOOL_SWEEP_SECONDS:
+            return 0
+        self._last_sweep = now
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            evicted = self._evict_expired(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+        if evicted:
+            print(f"🧹 Evicted {evicted} expired spooled file(s)")
+        return evicted
+
+    def stats(self):
+        """Per-category {files, bytes} plus the quota, read from the totals rows."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT category, files, bytes FROM spool_totals").fetchall()
+            reserved = conn.execute(
+                "SELECT COALESCE(SUM(files), 0), COALESCE(SUM(bytes), 0) FROM spool_reservations").fetchone()
+        finally:
+            conn.close()
+        categories = {category: {"files": files, "bytes": size} for category, files, size in rows}
+        return {
+            "categories": categories,
+            "files": sum(c["files"] for c in categories.values()),
+            "bytes": sum(c["bytes"] for c in categories.values()),
+            "reserved": {"files": reserved[0], "bytes": reserved[1]},
+            "max_files": self.max_files,
+            "max_bytes": self.max_bytes,
+        }
+
+
+upload_spool = UploadSpool()
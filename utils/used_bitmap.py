@@ -0,0 +1,145 @@
+import base64
+import json
+import threading
+import time
+from config import Config
+
+
+class UsedBitmap:
+    """
+    Packed bit array over a dense, append-only index of the pool's prompts.
+    Every prompt file name seen in the pool gets a position (bit 0); bit i
+    is set when prompt names[i] has been used.
+    """
+
+    def __init__(self, names=None, bits=None, version=0):
+        self.names = list(names or [])
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.bits = bytearray(bits or b"")
+        self.version = version
+
+    def is_used(self, name):
+        i = self.index.get(name)
+        if i is None or i // 8 >= len(self.bits):
+            return False
+        return bool(self.bits[i // 8] & (1 << (i % 8)))
+
+    def add(self, name):
+        """Appends `name` to the index as unused. Returns True if it was new."""
+        if name in self.index:
+            return False
+        i = len(self.names)
+        self.names.append(name)
+        self.index[name] = i
+        if i // 8 >= len(self.bits):
+            self.bits.extend(b"\0" * (i // 8 + 1 - len(self.bits)))
+        return True
+
+    def mark(self, name):
+        """Sets the bit for `name`, adding it to the index if needed. Returns True if it changed."""
+        self.add(name)
+        i = self.index[name]
+        mask = 1 << (i % 8)
+        if self.bits[i // 8] & mask:
+            return False
+        self.bits[i // 8] |= mask
+        return True
+
+    def count(self):
+        return sum(bin(b).count("1") for b in self.bits)
+
+    def to_bytes(self):
+        return json.dumps({
+            "version": self.version,
+            "names": self.names,
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii"),
+        }).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data):
+        doc = json.loads(data.decode("utf-8"))
+        return cls(doc.get("names"), base64.b64decode(doc.get("bits", "")), doc.get("version", 0))
+
+
+class UsedBitmapStore:
+    """
+    Per-process cache of the used-prompt bitmaps, one S3 object per pool
+    (standard / tribal). A membership test is an in-memory bit lookup; the
+    whole used set loads in one GET and is refreshed after
+    USED_BITMAP_TTL_SECONDS. Updates use compare-and-swap on the object's
+    ETag (conditional PUT), retrying on conflicts with other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}  # pool -> (etag, bitmap, loaded_at)
+
+    @staticmethod
+    def object_key(pool):
+        return f"{Config.S3_PROMPTS_STATE_PREFIX}{pool}_used.json"
+
+    def _load(self, s3, pool):
+        data, etag = s3.get_object_with_etag(self.object_key(pool))
+        bitmap = UsedBitmap.from_bytes(data) if data else UsedBitmap()
+        with self._lock:
+            self._cache[pool] = (etag, bitmap, time.time())
+        return etag, bitmap
+
+    def get(self, s3, pool):
+        """Returns the pool's bitmap, or None if it cannot be loaded (callers fall back to used/ lookups)."""
+        with self._lock:
+            cached = self._cache.get(pool)
+        if cached and time.time() - cached[2] < Config.USED_BITMAP_TTL_SECONDS:
+            return cached[1]
+        try:
+            return self._load(s3, pool)[1]
+        except Exception as e:
+            print(f"⚠️ Used bitmap for {pool} unavailable: {e}")
+            return cached[1] if cached else None
+
+    def _update(self, s3, pool, change):
+        """
+        Applies change(bitmap) -> changed? with compare-and-swap. Returns the
+        persisted bitmap, or None if it could not be written.
+        """
+        for _ in range(Config.USED_BITMAP_CAS_RETRIES):
+            try:
+                etag, bitmap = self._load(s3, pool)
+            except Exception as e:
+                print(f"❌ Could not load used bitmap for {pool}: {e}")
+                return None
+            updated = UsedBitmap(bitmap.names, bitmap.bits, bitmap.version + 1)
+            if not change(updated):
+                return bitmap
+            new_etag = s3.put_object_if_match(self.object_key(pool), updated.to_bytes(), etag)
+            if new_etag:
+                with self._lock:
+                    self._cache[pool] = (new_etag, updated, time.time())
+                return updated
+            # Another worker updated the bitmap first; reload and retry
+        print(f"❌ Could not update used bitmap for {pool} after {Config.USED_BITMAP_CAS_RETRIES} attempts")
+        return None
+
+    def mark_used(self, s3, pool, names):
+        """Marks prompt file names as used. Returns True once persisted."""
+        return self._update(s3, pool, lambda bitmap: any([bitmap.mark(name) for name in names])) is not None
+
+    def index_names(self, s3, pool, names):
+        """
+        Adds the pool's prompt names that the index does not know yet (new
+        uploads) as unused. Only writes when something is missing. Returns
+        the bitmap to use, or None if it could not be updated.
+        """
+        bitmap = self.get(s3, pool)
+        if bitmap is None:
+            return None
+        if all(name in bitmap.index for name in names):
+            return bitmap
+        return self._update(s3, pool, lambda bitmap: any([bitmap.add(name) for name in names]))
+
+
+used_bitmaps = UsedBitmapStore()
+
+
+def pool_for_prefix(prefix):
+    return "tribal" if "tribal" in prefix else "standard"